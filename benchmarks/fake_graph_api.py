@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor local que imita la WhatsApp Cloud API (Graph API) para pruebas de carga
+
+    python benchmarks/fake_graph_api.py --port 8765 --latency-ms 80 --error-rate 0.01 --throttle-rate 0.02
+    WHATSAPP_GRAPH_URL=http://127.0.0.1:8765 python app.py
+
+Simula latencia, errores 5xx, throttling 429 (código 130429 con Retry-After)
+y envía los callbacks de estado (sent, delivered, read) al webhook indicado.
+"""
+
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('fake_graph_api')
+
+
+class FakeGraphConfig:
+    def __init__(self, latency_ms=50.0, latency_jitter_ms=20.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, webhook_url=None, webhook_batch_size=100):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.webhook_url = webhook_url
+        self.webhook_batch_size = webhook_batch_size
+
+
+class FakeGraphState:
+    """Mensajes aceptados y callbacks de estado pendientes de entregar"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = {}
+        self.statuses = deque()
+        self.counters = {'accepted': 0, 'errors': 0, 'throttled': 0}
+
+    def accept(self, recipient):
+        message_id = f"wamid.{uuid.uuid4().hex}"
+        now = int(time.time())
+        with self.lock:
+            self.messages[message_id] = {'id': message_id, 'recipient_id': recipient, 'status': 'sent'}
+            self.counters['accepted'] += 1
+            for offset, status in enumerate(('sent', 'delivered', 'read')):
+                self.statuses.append({
+                    'id': message_id,
+                    'status': status,
+                    'timestamp': str(now + offset),
+                    'recipient_id': recipient
+                })
+        return message_id
+
+    def drain_statuses(self, limit=None):
+        with self.lock:
+            count = len(self.statuses) if limit is None else min(limit, len(self.statuses))
+            return [self.statuses.popleft() for _ in range(count)]
+
+
+def make_handler(config: FakeGraphConfig, state: FakeGraphState):
+    class FakeGraphHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, como la API real
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+
+            if not self.path.endswith('/messages'):
+                return self._send_json(404, {'error': {'message': 'Unknown path', 'code': 100}})
+
+            delay = max(0.0, random.gauss(config.latency_ms, config.latency_jitter_ms)) / 1000.0
+            time.sleep(delay)
+
+            roll = random.random()
+            if roll < config.throttle_rate:
+                with state.lock:
+                    state.counters['throttled'] += 1
+                return self._send_json(429, {
+                    'error': {'message': 'Rate limit hit', 'code': 130429, 'type': 'OAuthException'}
+                }, headers={'Retry-After': str(config.retry_after)})
+
+            if roll < config.throttle_rate + config.error_rate:
+                with state.lock:
+                    state.counters['errors'] += 1
+                return self._send_json(500, {'error': {'message': 'Simulated failure', 'code': 1}})
+
+            message_id = state.accept(body.get('to'))
+            self._send_json(200, {
+                'messaging_product': 'whatsapp',
+                'contacts': [{'input': body.get('to'), 'wa_id': body.get('to')}],
+                'messages': [{'id': message_id}]
+            })
+
+        def do_GET(self):
+            if self.path.startswith('/_stats'):
+                with state.lock:
+                    return self._send_json(200, dict(state.counters, pending_statuses=len(state.statuses)))
+
+            message_id = self.path.rstrip('/').split('/')[-1]
+            with state.lock:
+                message = state.messages.get(message_id)
+            if message is None:
+                return self._send_json(404, {'error': {'message': 'Unknown message', 'code': 100}})
+            self._send_json(200, message)
+
+    return FakeGraphHandler
+
+
+def _webhook_pusher(config: FakeGraphConfig, state: FakeGraphState, stop: threading.Event):
+    """Entrega los callbacks de estado al webhook en payloads con el formato de Meta"""
+    import requests
+
+    session = requests.Session()
+    while not stop.is_set():
+        statuses = state.drain_statuses(config.webhook_batch_size)
+        if not statuses:
+            stop.wait(0.2)
+            continue
+        payload = {
+            'object': 'whatsapp_business_account',
+            'entry': [{'id': 'fake', 'changes': [{'field': 'messages', 'value': {'statuses': statuses}}]}]
+        }
+        try:
+            session.post(config.webhook_url, json=payload, timeout=5)
+        except requests.RequestException as e:
+            logger.warning(f"Webhook delivery failed: {str(e)}")
+
+
+class FakeGraphServer:
+    """Servidor en un hilo aparte, utilizable desde los benchmarks"""
+
+    def __init__(self, config: FakeGraphConfig = None, host='127.0.0.1', port=0):
+        self.config = config or FakeGraphConfig()
+        self.state = FakeGraphState()
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.config, self.state))
+        self.httpd.daemon_threads = True
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        if self.config.webhook_url:
+            pusher = threading.Thread(target=_webhook_pusher, args=(self.config, self.state, self._stop), daemon=True)
+            pusher.start()
+            self._threads.append(pusher)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake WhatsApp Graph API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--webhook-url', help='e.g. http://127.0.0.1:5000/api/whatsapp/webhook')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    config = FakeGraphConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        webhook_url=args.webhook_url
+    )
+    server = FakeGraphServer(config, args.host, args.port).start()
+    print(f"🚀 Fake Graph API listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del camino de notificaciones de WhatsApp contra la Graph API simulada
+
+    python benchmarks/notification_benchmark.py --messages 1000 10000 --latency-ms 80 --throttle-rate 0.01
+
+Escenarios:
+  bulk       WhatsAppService.send_bulk_alerts_concurrent a N destinatarios
+  automatic  Alertas pendientes agrupadas por repartidor y enviadas como lo hace el worker
+  webhook    Ingesta de los callbacks de estado resultantes por WhatsAppStatusBuffer
+
+Para cada escenario informa mensajes/segundo, latencia p50/p99 por envío y el
+coste en base de datos (sentencias y tiempo total de ejecución SQL).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / 'benchmarks'))
+
+from fake_graph_api import FakeGraphConfig, FakeGraphServer  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return round(ordered[index], 1)
+
+
+class DBCostMeter:
+    """Cuenta sentencias SQL y tiempo de ejecución a través de los eventos del engine"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.statements = 0
+        self.seconds = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - getattr(self._local, 'started', time.perf_counter())
+        with self._lock:
+            self.statements += 1
+            self.seconds += elapsed
+
+    def snapshot(self):
+        with self._lock:
+            return self.statements, self.seconds
+
+
+def build_app(database_path, redis_url):
+    from flask import Flask
+    from src.models.user import db
+    from src.models import organization, support, user  # noqa: F401  Registrar todos los modelos
+    from src.services.alert_payload import register_alert_payload_listeners
+    from src.services.alert_counters import register_alert_counter_listeners
+
+    app = Flask('notification_benchmark')
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{database_path}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}},
+        REDIS_URL=redis_url
+    )
+    db.init_app(app)
+    register_alert_payload_listeners()
+    register_alert_counter_listeners()
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed(app, messages, alerts_per_rider, graph_token='bench-token', phone_number_id='bench-number'):
+    from src.models.user import db
+    from src.models.organization import Organization, APIConfiguration
+    from src.models.support import Alert
+
+    organization_id = 'bench_org'
+    with app.app_context():
+        if not Organization.query.get(organization_id):
+            db.session.add(Organization(id=organization_id, name='Benchmark'))
+            db.session.add(APIConfiguration(
+                organization_id=organization_id,
+                api_type='whatsapp',
+                credentials={'access_token': graph_token, 'phone_number_id': phone_number_id},
+                is_active=True
+            ))
+        alert_types = ['cash_threshold', 'battery_low', 'no_show']
+        rows = []
+        for index in range(messages):
+            rider = index // alerts_per_rider
+            rows.append(Alert(
+                organization_id=organization_id,
+                alert_type=alert_types[index % len(alert_types)],
+                rider_id=f"rider_{rider}",
+                title='Benchmark alert',
+                description='Generated by notification_benchmark',
+                severity='critical' if index % 4 == 0 else 'high',
+                data={'rider_phone': f"+3460{rider:07d}", 'city_id': 'bench_city'}
+            ))
+        db.session.add_all(rows)
+        db.session.commit()
+    return organization_id
+
+
+def run_bulk(messages, workers, governor):
+    from src.services.whatsapp_service import WhatsAppService
+
+    service = WhatsAppService('bench-token', 'bench-number', governor=governor)
+    phones = [f"+3461{index:07d}" for index in range(messages)]
+    alert = {'alert_type': 'emergency', 'severity': 'critical', 'title': 'Benchmark', 'description': 'Bulk'}
+
+    started = time.perf_counter()
+    result = service.send_bulk_alerts_concurrent(phones, alert, max_workers=workers)
+    elapsed = time.perf_counter() - started
+    latencies = [r['elapsed_ms'] for r in result['results'].values()]
+
+    return {
+        'scenario': 'bulk',
+        'messages': messages,
+        'successful': result['stats']['successful'],
+        'elapsed_s': round(elapsed, 2),
+        'messages_per_second': round(messages / elapsed, 1),
+        'latency_p50_ms': percentile(latencies, 50),
+        'latency_p99_ms': percentile(latencies, 99),
+        'db_statements': 0,
+        'db_ms': 0.0
+    }
+
+
+def run_automatic(app, meter, organization_id, workers, governor):
+    from src.models.user import db
+    from src.models.support import Alert
+    from src.services.alert_digest import AlertDigestService
+    from src.services.whatsapp_service import WhatsAppService
+
+    with app.app_context():
+        pending = Alert.query.filter_by(
+            organization_id=organization_id, whatsapp_sent=False, status='active'
+        ).all()
+        groups = [[alert.id for alert in group] for group in AlertDigestService.group_by_recipient(pending)]
+        total_alerts = len(pending)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def deliver(alert_ids):
+        # Igual que una tarea del worker: cargar, enviar un mensaje por grupo, un commit
+        with app.app_context():
+            service = WhatsAppService('bench-token', 'bench-number', governor=governor)
+            started = time.perf_counter()
+            alerts = Alert.query.filter(Alert.id.in_(alert_ids)).all()
+            AlertDigestService.deliver_digest(alerts, service)
+            db.session.commit()
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    statements_before, seconds_before = meter.snapshot()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(deliver, groups))
+    elapsed = time.perf_counter() - started
+    statements_after, seconds_after = meter.snapshot()
+
+    with app.app_context():
+        sent = Alert.query.filter_by(organization_id=organization_id, whatsapp_sent=True).count()
+
+    return {
+        'scenario': 'automatic',
+        'messages': len(groups),
+        'alerts': total_alerts,
+        'successful': sent,
+        'elapsed_s': round(elapsed, 2),
+        'messages_per_second': round(len(groups) / elapsed, 1) if elapsed else None,
+        'latency_p50_ms': percentile(latencies, 50),
+        'latency_p99_ms': percentile(latencies, 99),
+        'db_statements': statements_after - statements_before,
+        'db_ms': round((seconds_after - seconds_before) * 1000, 1)
+    }
+
+
+def run_webhook(app, meter, server, batch_size):
+    from src.services.whatsapp_status import WhatsAppStatusBuffer
+
+    statuses = server.state.drain_statuses()
+    buffer = WhatsAppStatusBuffer(batch_size=batch_size, max_delay=3600)
+
+    statements_before, seconds_before = meter.snapshot()
+    started = time.perf_counter()
+    with app.app_context():
+        for offset in range(0, len(statuses), 50):  # Un callback de Meta suele traer pocos estados
+            buffer.add(statuses[offset:offset + 50])
+        buffer.flush()
+    elapsed = time.perf_counter() - started
+    statements_after, seconds_after = meter.snapshot()
+
+    return {
+        'scenario': 'webhook',
+        'messages': len(statuses),
+        'successful': len(statuses),
+        'elapsed_s': round(elapsed, 2),
+        'messages_per_second': round(len(statuses) / elapsed, 1) if elapsed else None,
+        'latency_p50_ms': None,
+        'latency_p99_ms': None,
+        'db_statements': statements_after - statements_before,
+        'db_ms': round((seconds_after - seconds_before) * 1000, 1)
+    }
+
+
+def print_table(rows):
+    columns = ['scenario', 'messages', 'successful', 'elapsed_s', 'messages_per_second',
+               'latency_p50_ms', 'latency_p99_ms', 'db_statements', 'db_ms']
+    widths = {column: max(len(column), *(len(str(row.get(column))) for row in rows)) for column in columns}
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print('  '.join(str(row.get(column)).ljust(widths[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WhatsApp notification throughput benchmark')
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000])
+    parser.add_argument('--alerts-per-rider', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=1000.0, help='Governor rate per phone_number_id (msg/s)')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--status-batch-size', type=int, default=200)
+    parser.add_argument('--scenarios', nargs='+', default=['bulk', 'automatic', 'webhook'])
+    parser.add_argument('--redis-url', help='Share governor/buffer state through Redis (default: in-process)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    server = FakeGraphServer(FakeGraphConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate
+    )).start()
+
+    # Debe fijarse antes de importar los servicios de WhatsApp
+    os.environ['WHATSAPP_GRAPH_URL'] = server.url
+    os.environ['WHATSAPP_BULK_MAX_WORKERS'] = str(args.workers)
+    # Sin --redis-url se apunta a un puerto cerrado para forzar el estado en memoria
+    redis_url = args.redis_url or 'redis://127.0.0.1:1/0'
+
+    from src.services.whatsapp_rate_governor import WhatsAppRateGovernor
+
+    results = []
+    try:
+        for messages in args.messages:
+            governor = WhatsAppRateGovernor(default_rate=args.rate, max_rate=args.rate)
+            with tempfile.TemporaryDirectory() as tmp:
+                app = build_app(os.path.join(tmp, 'bench.db'), redis_url)
+                with app.app_context():
+                    from src.models.user import db
+                    meter = DBCostMeter(db.engine)
+
+                if 'bulk' in args.scenarios:
+                    with app.app_context():
+                        results.append(run_bulk(messages, args.workers, governor))
+                if 'automatic' in args.scenarios:
+                    organization_id = seed(app, messages, args.alerts_per_rider)
+                    results.append(run_automatic(app, meter, organization_id, args.workers, governor))
+                if 'webhook' in args.scenarios:
+                    results.append(run_webhook(app, meter, server, args.status_batch_size))
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -65,6 +65,7 @@ OPENAI_MODEL=gpt-4-turbo-preview
 # ============================================
 WHATSAPP_ACCESS_TOKEN=
 WHATSAPP_PHONE_NUMBER_ID=
+WHATSAPP_APP_SECRET=
 
 # ============================================
 # 🌐 URLs Configuration
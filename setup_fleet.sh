@@ -70,7 +70,8 @@ HEALTHCHECK --interval=30s --timeout=10s --start-period=5s --retries=3 \
   CMD curl -f http://localhost:5000/health || exit 1
 
 # Comando para iniciar
-CMD ["gunicorn", "--bind", "0.0.0.0:5000", "--workers", "4", "--timeout", "120", "--access-logfile", "-", "--error-logfile", "-", "app:application"]
+# Workers gthread: los streams SSE y las respuestas IA en streaming ocupan un hilo, no un worker entero
+CMD ["gunicorn", "--bind", "0.0.0.0:5000", "--workers", "4", "--worker-class", "gthread", "--threads", "32", "--timeout", "120", "--access-logfile", "-", "--error-logfile", "-", "app:application"]
 EOF
 
 # ========================================
@@ -448,6 +449,7 @@ OPENAI_API_KEY=your-openai-api-key-here
 WHATSAPP_ACCESS_TOKEN=your-whatsapp-access-token
 WHATSAPP_PHONE_NUMBER_ID=your-whatsapp-phone-number-id
 WHATSAPP_VERIFY_TOKEN=your-webhook-verify-token
+WHATSAPP_APP_SECRET=your-whatsapp-app-secret
 
 # URLs Configuration
 API_URL=https://fleet.loginexia.com
@@ -0,0 +1,67 @@
+import os
+from celery import Celery
+from kombu import Queue
+
+# Colas de notificaciones: las alertas críticas tienen su propia cola para que
+# un worker dedicado las atienda aunque la cola normal esté saturada
+CRITICAL_QUEUE = 'notifications_critical'
+DEFAULT_QUEUE = 'notifications'
+
+celery = Celery('loginexia')
+
+
+def init_celery(app):
+    """Configure the shared Celery app from the Flask config and run tasks inside an app context"""
+    broker_url = os.getenv('CELERY_BROKER_URL', app.config.get('REDIS_URL'))
+
+    celery.conf.update(
+        broker_url=broker_url,
+        result_backend=os.getenv('CELERY_RESULT_BACKEND', broker_url),
+        task_default_queue=DEFAULT_QUEUE,
+        task_queues=(
+            Queue(CRITICAL_QUEUE),
+            Queue(DEFAULT_QUEUE),
+        ),
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        worker_prefetch_multiplier=1,
+        task_ignore_result=True,
+        broker_transport_options={
+            'visibility_timeout': 3600,
+            'priority_steps': list(range(10)),
+            'queue_order_strategy': 'priority',
+        },
+        task_always_eager=os.getenv('CELERY_TASK_ALWAYS_EAGER', 'false').lower() == 'true',
+        timezone='UTC',
+        beat_schedule={
+            'reconcile-alert-counters': {
+                'task': 'src.tasks.notifications.reconcile_alert_counters',
+                'schedule': 3600.0,
+            },
+            'process-pending-alerts': {
+                'task': 'src.tasks.notifications.process_pending_alerts',
+                'schedule': 300.0,
+            },
+            'refresh-rider-directory': {
+                'task': 'src.tasks.notifications.refresh_rider_directory',
+                'schedule': 3600.0,
+            },
+            'refresh-analytics-store': {
+                'task': 'src.tasks.notifications.refresh_analytics_store',
+                'schedule': 300.0,
+            },
+            'flush-whatsapp-statuses': {
+                'task': 'src.tasks.notifications.flush_whatsapp_statuses',
+                'schedule': 5.0,
+            },
+        },
+    )
+
+    class ContextTask(celery.Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery.Task = ContextTask
+    celery.autodiscover_tasks(['src.tasks'], related_name='notifications', force=True)
+    return celery
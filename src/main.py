@@ -53,10 +53,32 @@ def create_app():
     # Configuración Redis
     app.config['REDIS_URL'] = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     
+    # Cola de tareas en segundo plano (Celery sobre Redis)
+    from src.celery_app import init_celery
+    init_celery(app)
+    
     # Inicializar base de datos
     from src.models.user import db
     db.init_app(app)
     
+    # Columnas promovidas y contadores materializados de alertas
+    from src.services.alert_payload import register_alert_payload_listeners, ensure_alert_columns
+    from src.services.alert_counters import AlertCounterService, register_alert_counter_listeners
+    register_alert_payload_listeners()
+    register_alert_counter_listeners()
+    
+    # Caché de credenciales descifradas, invalidada al cambiar APIConfiguration
+    from src.services.encryption_service import register_credentials_cache_listeners
+    register_credentials_cache_listeners()
+    
+    # Caché versionada de configuraciones por organización (invalidación vía Redis pub/sub)
+    from src.services.config_cache import register_config_cache_listeners
+    register_config_cache_listeners()
+    
+    # Caché de usuarios y API keys autenticados, invalidada al cambiar sus filas
+    from src.services.auth_service import register_principal_cache_listeners
+    register_principal_cache_listeners()
+    
     # Importar y registrar blueprints
     try:
         from src.routes.user import user_bp
@@ -65,6 +87,7 @@ def create_app():
         from src.routes.ai import ai_bp
         from src.routes.demo import demo_bp
         from src.routes.whatsapp import whatsapp_bp
+        from src.routes.alerts import alerts_bp
         
         app.register_blueprint(user_bp, url_prefix='/api/users')
         app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -72,6 +95,7 @@ def create_app():
         app.register_blueprint(ai_bp, url_prefix='/api/ai')
         app.register_blueprint(demo_bp, url_prefix='/api/demo')
         app.register_blueprint(whatsapp_bp, url_prefix='/api/whatsapp')
+        app.register_blueprint(alerts_bp, url_prefix='/api/alerts')
         logger.info("✅ Todos los blueprints registrados correctamente")
     except ImportError as e:
         logger.error(f"Error importando blueprints: {e}")
@@ -90,6 +114,7 @@ def create_app():
                 'api_riders': '/api/riders',
                 'api_ai': '/api/ai',
                 'api_whatsapp': '/api/whatsapp',
+                'api_alerts': '/api/alerts',
                 'documentation': '/api/docs'
             },
             'environment': os.getenv('FLASK_ENV', 'development')
@@ -130,7 +155,8 @@ def create_app():
                 'auth': {
                     'POST /api/auth/login': 'User login',
                     'POST /api/auth/register': 'User registration',
-                    'POST /api/auth/refresh': 'Refresh token'
+                    'POST /api/auth/refresh': 'Refresh token',
+                    'GET /api/auth/usage': 'Daily API usage and rate limits (admin)'
                 },
                 'riders': {
                     'GET /api/riders': 'List all riders',
@@ -140,13 +166,26 @@ def create_app():
                     'DELETE /api/riders/{id}': 'Delete rider'
                 },
                 'ai': {
-                    'POST /api/ai/nl-to-sql': 'Natural language to SQL',
+                    'POST /api/ai/nl-to-sql': 'Natural language to SQL ("execute": true also runs it)',
+                    'POST /api/ai/analytics/query': 'Run SQL or a natural language query on the analytics store',
                     'POST /api/ai/recommendations': 'Get AI recommendations',
-                    'POST /api/ai/chat': 'AI chat assistant'
+                    'POST /api/ai/chat': 'AI chat assistant (stream tokens with "stream": true or Accept: text/event-stream)',
+                    'POST /api/ai/query-knowledge': 'Knowledge base Q&A (streamable like chat)',
+                    'GET /api/ai/cache-stats': 'AI response cache hit rates',
+                    'GET /api/ai/documents': 'List knowledge base documents',
+                    'POST /api/ai/documents': 'Index a knowledge base document',
+                    'DELETE /api/ai/documents/{id}': 'Remove a knowledge base document'
                 },
                 'whatsapp': {
                     'POST /api/whatsapp/send-alert': 'Send WhatsApp alert',
-                    'POST /api/whatsapp/config': 'Configure WhatsApp'
+                    'POST /api/whatsapp/config': 'Configure WhatsApp',
+                    'POST /api/whatsapp/webhook': 'WhatsApp delivery-status callbacks'
+                },
+                'alerts': {
+                    'GET /api/alerts/stream': 'Server-Sent Events stream of alert changes',
+                    'GET /api/alerts/counts': 'Alert counts by severity and type',
+                    'POST /api/alerts/{id}/acknowledge': 'Acknowledge alert',
+                    'POST /api/alerts/{id}/resolve': 'Resolve alert'
                 }
             }
         })
@@ -209,6 +248,8 @@ def create_app():
             
             # Crear tablas
             db.create_all()
+            ensure_alert_columns()
+            AlertCounterService.seed()
             
             # Inicializar datos demo
             try:
@@ -39,7 +39,7 @@ class APIKey(db.Model):
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), nullable=False)
-    key_hash = db.Column(db.String(255), nullable=False)
+    key_hash = db.Column(db.String(255), nullable=False, index=True)
     name = db.Column(db.String(255), nullable=False)
     permissions = db.Column(db.JSON)
     expires_at = db.Column(db.DateTime)
@@ -3,6 +3,12 @@ from datetime import datetime
 import uuid
 from src.models.user import db
 
+def _to_number(value, cast):
+    try:
+        return cast(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
 class SupportTicket(db.Model):
     __tablename__ = 'support_tickets'
     
@@ -90,13 +96,38 @@ class Alert(db.Model):
     # WhatsApp notification fields
     whatsapp_sent = db.Column(db.Boolean, default=False)
     whatsapp_sent_at = db.Column(db.DateTime)
-    whatsapp_message_id = db.Column(db.String(255))
+    whatsapp_message_id = db.Column(db.String(255), index=True)
     whatsapp_status = db.Column(db.String(50))  # sent, delivered, read, failed
-    rider_phone = db.Column(db.String(20))  # Rider's WhatsApp number
+    rider_phone = db.Column(db.String(20), index=True)  # Rider's WhatsApp number
+    # Notification owned by the outbox relay until its event is sent or fails for good
+    outbox_pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    
+    # Hot fields promoted from `data` at write time (see apply_payload_fields)
+    city_id = db.Column(db.String(100), index=True)
+    cash_amount = db.Column(db.Float, index=True)
+    battery_level = db.Column(db.Integer, index=True)
+    late_minutes = db.Column(db.Integer, index=True)
     
     def __repr__(self):
         return f'<Alert {self.alert_type} - {self.title}>'
     
+    def apply_payload_fields(self):
+        """Copy the commonly queried fields of `data` into their typed columns"""
+        data = self.data if isinstance(self.data, dict) else {}
+        
+        if not self.rider_phone:
+            rider_info = data.get('rider_info') if isinstance(data.get('rider_info'), dict) else {}
+            contact = data.get('contact') if isinstance(data.get('contact'), dict) else {}
+            self.rider_phone = data.get('rider_phone') or rider_info.get('phone') or contact.get('phone')
+        
+        if data.get('city_id') is not None:
+            self.city_id = str(data['city_id'])
+        self.cash_amount = _to_number(data.get('cash_amount'), float)
+        self.battery_level = _to_number(data.get('battery_level'), int)
+        self.late_minutes = _to_number(
+            data.get('late_minutes', data.get('late_duration', data.get('late_duration_minutes'))), int
+        )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -114,6 +145,109 @@ class Alert(db.Model):
             'whatsapp_sent': self.whatsapp_sent,
             'whatsapp_sent_at': self.whatsapp_sent_at.isoformat() if self.whatsapp_sent_at else None,
             'whatsapp_status': self.whatsapp_status,
-            'rider_phone': self.rider_phone
+            'rider_phone': self.rider_phone,
+            'city_id': self.city_id,
+            'cash_amount': self.cash_amount,
+            'battery_level': self.battery_level,
+            'late_minutes': self.late_minutes
+        }
+
+
+class AlertOutbox(db.Model):
+    __tablename__ = 'alert_outbox'
+    __table_args__ = (
+        db.Index('ix_alert_outbox_status_id', 'status', 'id'),
+        db.Index('ix_alert_outbox_rider_status_id', 'rider_id', 'status', 'id'),
+        db.Index('ix_alert_outbox_alert_status_id', 'alert_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)  # Delivery order
+    organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), nullable=False)
+    alert_id = db.Column(db.String(36), db.ForeignKey('alerts.id'), nullable=False)
+    rider_id = db.Column(db.String(100))  # Ordering key: events for a rider are delivered in order
+    event_type = db.Column(db.String(50), nullable=False)  # alert.raised
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), default='pending')  # pending, processing, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<AlertOutbox {self.id} {self.event_type}>'
+    
+    @property
+    def partition_key(self):
+        return self.rider_id or self.alert_id
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'organization_id': self.organization_id,
+            'alert_id': self.alert_id,
+            'rider_id': self.rider_id,
+            'event_type': self.event_type,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
         }
 
+class AlertCounter(db.Model):
+    __tablename__ = 'alert_counters'
+    __table_args__ = (
+        db.UniqueConstraint('organization_id', 'city_id', 'alert_type', 'severity', 'status',
+                            name='uq_alert_counters_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), nullable=False)
+    city_id = db.Column(db.String(100), nullable=False, default='')  # '' when the alert has no city
+    alert_type = db.Column(db.String(50), nullable=False)
+    severity = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AlertCounter {self.alert_type}/{self.severity}/{self.status}: {self.count}>'
+    
+    def to_dict(self):
+        return {
+            'organization_id': self.organization_id,
+            'city_id': self.city_id or None,
+            'alert_type': self.alert_type,
+            'severity': self.severity,
+            'status': self.status,
+            'count': self.count
+        }
+
+class RiderContact(db.Model):
+    __tablename__ = 'rider_contacts'
+    __table_args__ = (
+        db.UniqueConstraint('organization_id', 'rider_id', name='uq_rider_contacts_rider'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), nullable=False)
+    rider_id = db.Column(db.String(100), nullable=False)  # Employee ID in the external system
+    name = db.Column(db.String(255))
+    phone = db.Column(db.String(50))
+    city_id = db.Column(db.String(100))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<RiderContact {self.rider_id}>'
+    
+    def to_dict(self):
+        return {
+            'rider_id': self.rider_id,
+            'name': self.name,
+            'phone': self.phone,
+            'city_id': self.city_id,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -1,10 +1,26 @@
-from flask import Blueprint, request, jsonify
-from src.services.auth_service import token_required, api_key_required
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from src.services.auth_service import token_required, admin_required, api_key_required
 from src.services.ai_service import AIService
+from src.services.ai_cache import ai_response_cache
 from src.services.rider_service import RiderExternalService
+from src.services.rider_summary import summarize_for_prompt
+from src.services.vector_store import vector_store
+from src.services.analytics_store import analytics_store, AnalyticsQueryError, prepare_sql, ANALYTICS_MAX_ROWS
 
 ai_bp = Blueprint('ai', __name__)
 
+# Shared pool: OpenAI calls get the time left until the deadline as their timeout, so calls that
+# miss it end shortly after in the background instead of holding a worker
+INSIGHTS_DEADLINE_SECONDS = float(os.environ.get('AI_INSIGHTS_DEADLINE', 25))
+TIMED_OUT = 'timed_out'
+_insights_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('AI_MAX_WORKERS', 16)), thread_name_prefix='ai-insights'
+)
+
 @ai_bp.route('/nl-to-sql', methods=['POST'])
 @token_required
 def natural_language_to_sql(current_user):
@@ -22,6 +38,11 @@ def natural_language_to_sql(current_user):
             current_user.organization_id
         )
         
+        if data.get('execute') and result.get('sql_query'):
+            result['results'] = _execute_generated_sql(
+                current_user.organization_id, result['sql_query'], data.get('max_rows')
+            )
+        
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -39,6 +60,13 @@ def query_knowledge_base(current_user):
             return jsonify({'error': 'Question is required'}), 400
         
         ai_service = AIService()
+        stream_format = _stream_format(data)
+        if stream_format:
+            return _stream_response(
+                ai_service.stream_knowledge_answer(question, current_user.organization_id, context_docs),
+                stream_format
+            )
+        
         result = ai_service.query_knowledge_base(
             question, 
             current_user.organization_id,
@@ -68,7 +96,8 @@ def get_recommendations(current_user):
         ai_service = AIService()
         result = ai_service.generate_recommendations(
             rider_data,
-            recommendation_type=recommendation_type
+            recommendation_type=recommendation_type,
+            organization_id=current_user.organization_id
         )
         
         return jsonify(result), 200
@@ -110,17 +139,144 @@ def ai_chat(current_user):
         # Determine the type of query and route accordingly
         if any(keyword in message.lower() for keyword in ['sql', 'query', 'database', 'select', 'count']):
             # Treat as NL to SQL query
-            result = ai_service.generate_sql_from_nl(message, current_user.organization_id)
-            result['type'] = 'sql_query'
+            query_type = 'sql_query'
         else:
             # Treat as knowledge base query
+            query_type = 'knowledge_query'
+        
+        stream_format = _stream_format(data)
+        if stream_format:
+            if query_type == 'sql_query':
+                events = ai_service.stream_sql_from_nl(message, current_user.organization_id)
+            else:
+                events = ai_service.stream_knowledge_answer(message, current_user.organization_id)
+            return _stream_response(events, stream_format, query_type)
+        
+        if query_type == 'sql_query':
+            result = ai_service.generate_sql_from_nl(message, current_user.organization_id)
+        else:
             result = ai_service.query_knowledge_base(message, current_user.organization_id)
-            result['type'] = 'knowledge_query'
+        result['type'] = query_type
         
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _stream_format(data):
+    """'sse' or 'ndjson' when the client asked for a streamed answer, else None"""
+    accept = request.headers.get('Accept', '')
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    if data.get('stream'):
+        return 'ndjson' if data.get('stream') == 'ndjson' else 'sse'
+    return None
+
+def _stream_response(events, stream_format, query_type=None):
+    """
+    Stream the answer tokens as they arrive, then the same structured result
+    the non-streaming endpoint returns.
+
+    SSE: 'token' events with {"content": ...} and a final 'result' event.
+    NDJSON: {"type": "token", "content": ...} lines and a final {"type": "result", "result": ...}.
+    """
+    def generate():
+        for kind, payload in events:
+            if kind == 'result' and query_type:
+                payload = dict(payload, type=query_type)
+            body = {'content': payload} if kind == 'token' else payload
+            if stream_format == 'sse':
+                yield f"event: {kind}\ndata: {json.dumps(body)}\n\n"
+            else:
+                key = 'content' if kind == 'token' else 'result'
+                yield json.dumps({'type': kind, key: payload}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if stream_format == 'sse' else 'application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Flush each token through nginx
+        }
+    )
+
+@ai_bp.route('/analytics/query', methods=['POST'])
+@token_required
+def run_analytics_query(current_user):
+    """
+    Run SQL (or a natural language query translated to SQL) against the
+    read-only analytics store. Rows are streamed in batches when requested
+    like /chat; otherwise the row-limited result is returned at once.
+    """
+    try:
+        data = request.get_json()
+        sql = data.get('sql')
+        max_rows = int(data.get('max_rows') or ANALYTICS_MAX_ROWS)
+        
+        if not sql and data.get('query'):
+            generated = AIService().generate_sql_from_nl(data['query'], current_user.organization_id)
+            if not generated.get('sql_query'):
+                return jsonify(generated), 422
+            sql = generated['sql_query']
+        
+        if not sql:
+            return jsonify({'error': 'SQL or query is required'}), 400
+        
+        try:
+            sql = prepare_sql(sql)
+        except AnalyticsQueryError as e:
+            return jsonify({'error': str(e), 'sql_query': sql}), 400
+        
+        stream_format = _stream_format(data)
+        if stream_format:
+            return _analytics_stream_response(
+                analytics_store.stream(current_user.organization_id, sql, max_rows), stream_format, sql
+            )
+        
+        try:
+            result = analytics_store.execute(current_user.organization_id, sql, max_rows)
+        except AnalyticsQueryError as e:
+            return jsonify({'error': str(e), 'sql_query': sql}), 400
+        result['sql_query'] = sql
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _execute_generated_sql(organization_id, sql, max_rows=None):
+    """Run generated SQL against the analytics store; errors are reported inline"""
+    try:
+        return analytics_store.execute(organization_id, sql, int(max_rows or ANALYTICS_MAX_ROWS))
+    except AnalyticsQueryError as e:
+        return {'error': str(e)}
+
+def _analytics_stream_response(events, stream_format, sql):
+    """
+    SSE: 'columns', 'rows' and a final 'done' (or 'error') event.
+    NDJSON: the same events as lines with a "type" field.
+    """
+    def generate():
+        try:
+            for kind, payload in events:
+                body = dict(payload, sql_query=sql) if kind == 'done' else {kind: payload}
+                yield _encode_event(kind, body, stream_format)
+        except AnalyticsQueryError as e:
+            yield _encode_event('error', {'error': str(e), 'sql_query': sql}, stream_format)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if stream_format == 'sse' else 'application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def _encode_event(kind, body, stream_format):
+    if stream_format == 'sse':
+        return f"event: {kind}\ndata: {json.dumps(body, default=str)}\n\n"
+    return json.dumps(dict(body, type=kind), default=str) + "\n"
+
 @ai_bp.route('/smart-alerts', methods=['POST'])
 @token_required
 def generate_smart_alerts(current_user):
@@ -141,14 +297,15 @@ def generate_smart_alerts(current_user):
         # Generate recommendations specifically for alerts
         recommendations = ai_service.generate_recommendations(
             rider_data,
-            recommendation_type='alerts'
+            recommendation_type='alerts',
+            organization_id=current_user.organization_id
         )
         
         # Analyze patterns and suggest proactive measures
         pattern_analysis = ai_service.query_knowledge_base(
             f"Based on the current rider data, what patterns should we watch for potential issues?",
             current_user.organization_id,
-            f"Current rider data: {rider_data}"
+            f"Current rider data summary: {summarize_for_prompt(rider_data, prompt_type='knowledge_context')}"
         )
         
         result = {
@@ -165,7 +322,14 @@ def generate_smart_alerts(current_user):
 @ai_bp.route('/performance-insights', methods=['POST'])
 @token_required
 def get_performance_insights(current_user):
-    """Get AI-powered performance insights"""
+    """
+    Get AI-powered performance insights
+
+    The two upstream fetches run concurrently, and each LLM call starts as
+    soon as the data it needs is available. Everything shares one deadline:
+    whatever has not finished by then is reported in 'timed_out' and the
+    rest is returned as a partial result.
+    """
     try:
         data = request.get_json()
         city_id = data.get('city_id')
@@ -174,44 +338,136 @@ def get_performance_insights(current_user):
         if not city_id:
             return jsonify({'error': 'City ID is required'}), 400
         
-        # Get rider and company data
+        deadline = time.monotonic() + min(float(data.get('timeout', INSIGHTS_DEADLINE_SECONDS)), INSIGHTS_DEADLINE_SECONDS)
+        organization_id = current_user.organization_id
         rider_service = RiderExternalService(current_user.organization)
-        rider_data = rider_service.get_live_riders(city_id)
-        company_data = rider_service.get_companies_overview(city_id)
-        
         ai_service = AIService()
         
-        # Generate performance recommendations
-        performance_recs = ai_service.generate_recommendations(
-            rider_data,
-            recommendation_type='performance'
-        )
+        # Get rider and company data in parallel
+        rider_future = _insights_executor.submit(rider_service.get_live_riders, city_id)
+        company_future = _insights_executor.submit(rider_service.get_companies_overview, city_id)
         
-        # Generate scheduling recommendations
-        scheduling_recs = ai_service.generate_recommendations(
-            rider_data,
-            recommendation_type='scheduling'
+        sections = {}
+        rider_data, rider_error = _result_before(rider_future, deadline)
+        if rider_error:
+            return jsonify({'error': f"Could not fetch rider data: {rider_error}"}), 504 if rider_error == TIMED_OUT else 502
+        
+        # Performance and scheduling recommendations only need the rider data
+        sections['performance_recommendations'] = _submit_ai_call(
+            ai_service, deadline, 'generate_recommendations', rider_data,
+            recommendation_type='performance', organization_id=organization_id
         )
+        sections['scheduling_recommendations'] = _submit_ai_call(
+            ai_service, deadline, 'generate_recommendations', rider_data,
+            recommendation_type='scheduling', organization_id=organization_id
+        )
+        
+        company_data, company_error = _result_before(company_future, deadline)
+        if company_error:
+            company_data = {'unavailable': company_error}
         
         # Analyze overall performance
-        performance_analysis = ai_service.query_knowledge_base(
+        sections['performance_analysis'] = _submit_ai_call(
+            ai_service, deadline, 'query_knowledge_base',
             f"Analyze the performance data and provide insights on operational efficiency for {time_period}",
-            current_user.organization_id,
-            f"Rider data: {rider_data}\nCompany data: {company_data}"
+            organization_id,
+            f"Rider data summary: {summarize_for_prompt(rider_data, company_data, prompt_type='knowledge_context')}"
         )
         
-        result = {
-            'performance_recommendations': performance_recs,
-            'scheduling_recommendations': scheduling_recs,
-            'performance_analysis': performance_analysis,
-            'city_id': city_id,
-            'time_period': time_period
-        }
-        
+        result = {'city_id': city_id, 'time_period': time_period}
+        timed_out = ['company_data'] if company_error == TIMED_OUT else []
+        for name, future in sections.items():
+            value, error = _result_before(future, deadline)
+            if error == TIMED_OUT:
+                timed_out.append(name)
+                result[name] = {'error': 'Timed out'}
+            else:
+                result[name] = value if not error else {'error': error}
+        
+        result['partial'] = bool(timed_out)
+        result['timed_out'] = timed_out
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _submit_ai_call(ai_service, deadline, method, *args, **kwargs):
+    """
+    Run an AIService method on the shared pool with an OpenAI timeout equal to
+    the time left until the deadline, so abandoned calls free their worker
+    """
+    def call():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise FutureTimeoutError()
+        return getattr(ai_service.with_timeout(remaining), method)(*args, **kwargs)
+    return _insights_executor.submit(call)
+
+def _result_before(future, deadline):
+    """Wait for a future until the shared deadline; returns (value, error)"""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic())), None
+    except FutureTimeoutError:
+        return None, TIMED_OUT
+    except Exception as e:
+        return None, str(e)
+
+@ai_bp.route('/cache-stats', methods=['GET'])
+@token_required
+def get_cache_stats(current_user):
+    """Get hit-rate metrics of the AI response cache"""
+    try:
+        return jsonify(ai_response_cache.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/documents', methods=['GET'])
+@token_required
+def list_knowledge_documents(current_user):
+    """List the documents indexed in the organization's knowledge base"""
+    try:
+        store = vector_store.store_for(current_user.organization_id)
+        return jsonify({'documents': store.list_documents(), 'stats': store.stats()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/documents', methods=['POST'])
+@token_required
+@admin_required
+def add_knowledge_document(current_user):
+    """Chunk, embed and index a document (re-indexes it when document_id already exists)"""
+    try:
+        data = request.get_json()
+        text = data.get('text')
+        
+        if not text:
+            return jsonify({'error': 'Text is required'}), 400
+        
+        document = vector_store.add_document(
+            AIService().client,
+            current_user.organization_id,
+            text,
+            title=data.get('title'),
+            document_id=data.get('document_id')
+        )
+        
+        return jsonify(document), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/documents/<document_id>', methods=['DELETE'])
+@token_required
+@admin_required
+def delete_knowledge_document(current_user, document_id):
+    """Remove a document from the organization's knowledge base"""
+    try:
+        if not vector_store.delete_document(current_user.organization_id, document_id):
+            return jsonify({'error': 'Document not found'}), 404
+        return jsonify({'message': 'Document deleted'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # API Key endpoints for external integrations
 @ai_bp.route('/api/recommendations', methods=['POST'])
 @api_key_required
@@ -231,7 +487,8 @@ def api_get_recommendations(organization):
         ai_service = AIService()
         result = ai_service.generate_recommendations(
             rider_data,
-            recommendation_type=recommendation_type
+            recommendation_type=recommendation_type,
+            organization_id=organization.id
         )
         
         return jsonify(result), 200
@@ -252,6 +509,9 @@ def api_natural_language_to_sql(organization):
         ai_service = AIService()
         result = ai_service.generate_sql_from_nl(natural_query, organization.id)
         
+        if data.get('execute') and result.get('sql_query'):
+            result['results'] = _execute_generated_sql(organization.id, result['sql_query'], data.get('max_rows'))
+        
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
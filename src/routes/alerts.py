@@ -0,0 +1,174 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from datetime import datetime
+import os
+import time
+import logging
+from src.models.user import db
+from src.models.support import Alert
+from src.services.auth_service import (
+    AuthService, token_required, stream_token_required, STREAM_TOKEN_COOKIE, STREAM_TOKEN_TTL
+)
+from src.services.redis_client import get_redis
+from src.services.alert_events import alert_event_bus, format_sse, ALERT_ACKNOWLEDGED, ALERT_RESOLVED
+from src.services.alert_counters import AlertCounterService
+from src.services.alert_suppression import alert_suppressor
+
+logger = logging.getLogger(__name__)
+
+# Vida máxima de una conexión SSE (por debajo del proxy_read_timeout de nginx)
+SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 240))
+# Sin Redis los eventos solo llegan a los clientes del mismo proceso: válido con un único worker
+SSE_ALLOW_LOCAL_BUS = os.environ.get('SSE_ALLOW_LOCAL_BUS', 'false').lower() == 'true'
+
+alerts_bp = Blueprint('alerts', __name__)
+
+def _set_stream_cookie(response, user):
+    """Cookie con un token de stream nuevo, limitada a la ruta del stream"""
+    response.set_cookie(
+        STREAM_TOKEN_COOKIE, AuthService.generate_stream_token(user),
+        max_age=STREAM_TOKEN_TTL, path='/api/alerts/stream',
+        httponly=True, secure=request.is_secure, samesite='Strict'
+    )
+    return response
+
+@alerts_bp.route('/stream-token', methods=['POST'])
+@token_required
+def create_stream_token(current_user):
+    """
+    Token de corta duración para abrir /stream desde un EventSource del navegador,
+    que no puede enviar la cabecera Authorization. Se devuelve en el cuerpo (para
+    ?stream_token=) y en una cookie HttpOnly
+    """
+    response = jsonify({
+        'stream_token': AuthService.generate_stream_token(current_user),
+        'expires_in': STREAM_TOKEN_TTL
+    })
+    return _set_stream_cookie(response, current_user), 200
+
+@alerts_bp.route('/stream', methods=['GET'])
+@stream_token_required
+def stream_alerts(current_user):
+    """
+    Stream de eventos de alertas (Server-Sent Events) para la organización del usuario
+
+    Acepta el Bearer habitual o un token de POST /stream-token (parámetro
+    stream_token o cookie). Cada conexión dura como máximo SSE_MAX_STREAM_SECONDS;
+    el cliente (EventSource) reconecta solo y reanuda con Last-Event-ID, y cada
+    conexión renueva la cookie. Requiere workers gthread o gevent, y Redis para
+    repartir los eventos entre workers (o SSE_ALLOW_LOCAL_BUS con un solo worker).
+    """
+    if get_redis() is None and not SSE_ALLOW_LOCAL_BUS:
+        logger.error("Alert stream requested without Redis; events would not reach other workers")
+        return jsonify({'error': 'Alert stream unavailable'}), 503, {'Retry-After': '30'}
+
+    organization_id = current_user.organization_id
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    def generate():
+        # Indicar al cliente cuánto esperar antes de reconectar
+        yield "retry: 5000\n\n"
+        cursor = last_event_id
+        if not cursor:
+            # Solo con "id" el cliente fija su Last-Event-ID sin recibir ningún evento
+            cursor = alert_event_bus.current_id(organization_id)
+            yield f"id: {cursor}\n\n"
+
+        deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+        for event in alert_event_bus.subscribe(organization_id, cursor):
+            yield format_sse(event)
+            if time.monotonic() >= deadline:
+                break
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Evitar el buffering de nginx
+        }
+    )
+    return _set_stream_cookie(response, current_user)
+
+@alerts_bp.route('/counts', methods=['GET'])
+@token_required
+def alert_counts(current_user):
+    """
+    Totales de alertas por severidad y tipo, leídos de los contadores materializados
+    """
+    try:
+        status = request.args.get('status', 'active')
+        counts = AlertCounterService.get_counts(
+            current_user.organization_id,
+            city_id=request.args.get('city_id'),
+            status=None if status == 'all' else status
+        )
+        return jsonify(counts), 200
+
+    except Exception as e:
+        logger.error(f"Error reading alert counts: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@alerts_bp.route('/<alert_id>/acknowledge', methods=['POST'])
+@token_required
+def acknowledge_alert(current_user, alert_id):
+    """
+    Marca una alerta como reconocida
+    """
+    try:
+        alert = Alert.query.filter_by(
+            id=alert_id,
+            organization_id=current_user.organization_id
+        ).first()
+
+        if not alert:
+            return jsonify({'error': 'Alert not found'}), 404
+
+        if alert.status != 'active':
+            return jsonify({'error': f'Alert is already {alert.status}'}), 409
+
+        alert.status = 'acknowledged'
+        alert.acknowledged_at = datetime.utcnow()
+        db.session.commit()
+
+        alert_event_bus.publish(alert.organization_id, ALERT_ACKNOWLEDGED, alert.to_dict())
+
+        return jsonify({'alert': alert.to_dict()}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error acknowledging alert {alert_id}: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@alerts_bp.route('/<alert_id>/resolve', methods=['POST'])
+@token_required
+def resolve_alert(current_user, alert_id):
+    """
+    Marca una alerta como resuelta
+    """
+    try:
+        alert = Alert.query.filter_by(
+            id=alert_id,
+            organization_id=current_user.organization_id
+        ).first()
+
+        if not alert:
+            return jsonify({'error': 'Alert not found'}), 404
+
+        if alert.status == 'resolved':
+            return jsonify({'error': 'Alert is already resolved'}), 409
+
+        alert.status = 'resolved'
+        alert.resolved_at = datetime.utcnow()
+        db.session.commit()
+
+        # Resuelta a mano: la próxima detección de este repartidor se notifica sin esperar al enfriamiento
+        if alert.rider_id:
+            alert_suppressor.reset(alert.organization_id, alert.rider_id, alert.alert_type)
+        alert_event_bus.publish(alert.organization_id, ALERT_RESOLVED, alert.to_dict())
+
+        return jsonify({'alert': alert.to_dict()}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error resolving alert {alert_id}: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import User, db
 from src.models.organization import Organization, APIKey
-from src.services.auth_service import AuthService, token_required, admin_required
+from src.services.auth_service import AuthService, token_required, admin_required, invalidate_principal, invalidate_api_key
 from src.services.encryption_service import EncryptionService
+from src.services.rate_limiter import rate_limiter
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -244,6 +245,7 @@ def delete_api_key(current_user, key_id):
         
         api_key.is_active = False
         db.session.commit()
+        invalidate_api_key(api_key.key_hash)
         
         return jsonify({'message': 'API key deleted successfully'}), 200
         
@@ -251,9 +253,28 @@ def delete_api_key(current_user, key_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@auth_bp.route('/usage', methods=['GET'])
+@token_required
+@admin_required
+def get_api_usage(current_user):
+    """Get daily API usage counters and the limits that apply to the organization"""
+    try:
+        days = min(int(request.args.get('days', 7)), 90)
+        
+        return jsonify({
+            'organization_id': current_user.organization_id,
+            'subscription_tier': current_user.organization.subscription_tier,
+            'limits': rate_limiter.limits_for(current_user.organization),
+            'usage': rate_limiter.get_usage(current_user.organization_id, days)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @auth_bp.route('/logout', methods=['POST'])
 @token_required
 def logout(current_user):
     """Logout user (client-side token removal)"""
+    invalidate_principal(current_user.id)
     return jsonify({'message': 'Logged out successfully'}), 200
 
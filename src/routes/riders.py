@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
 from src.services.auth_service import token_required, api_key_required
 from src.services.rider_service import RiderExternalService, RiderAnalyticsService
+from src.services.alert_suppression import alert_suppressor
+from src.services.alert_events import alert_event_bus, ALERT_RAISED
+from src.services.rider_directory import rider_directory
 from src.models.support import Alert
 from src.models.user import db
 from datetime import datetime
@@ -89,6 +92,7 @@ def get_riders(current_user):
         
         rider_service = RiderExternalService(current_user.organization)
         riders = rider_service.get_riders(filters)
+        rider_directory.remember_quietly(current_user.organization_id, riders)
         
         return jsonify(riders), 200
     except Exception as e:
@@ -101,6 +105,7 @@ def get_rider(current_user, employee_id):
     try:
         rider_service = RiderExternalService(current_user.organization)
         rider = rider_service.get_rider(employee_id)
+        rider_directory.remember_quietly(current_user.organization_id, rider)
         return jsonify(rider), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -212,12 +217,16 @@ def get_alerts(current_user, city_id):
     """Get alerts for a city"""
     try:
         rider_service = RiderExternalService(current_user.organization)
-        analytics_service = RiderAnalyticsService(rider_service)
+        analytics_service = RiderAnalyticsService(rider_service, suppressor=alert_suppressor)
         
         alerts = analytics_service.detect_alerts(city_id)
         
-        # Store alerts in database for tracking
+        # Store alerts in database for tracking (repeated detections are absorbed by the suppressor)
+        new_alerts = []
         for alert_data in alerts:
+            if alert_data.get('suppressed'):
+                continue
+            
             existing_alert = Alert.query.filter_by(
                 organization_id=current_user.organization_id,
                 rider_id=alert_data.get('rider_id'),
@@ -233,12 +242,16 @@ def get_alerts(current_user, city_id):
                     title=alert_data.get('message'),
                     description=alert_data.get('message'),
                     severity=alert_data.get('severity'),
-                    data=alert_data.get('data')
+                    data={**(alert_data.get('data') or {}), 'city_id': city_id}
                 )
                 db.session.add(alert)
+                new_alerts.append(alert)
         
         db.session.commit()
         
+        for alert in new_alerts:
+            alert_event_bus.publish(alert.organization_id, ALERT_RAISED, alert.to_dict())
+        
         return jsonify({'alerts': alerts}), 200
     except Exception as e:
         db.session.rollback()
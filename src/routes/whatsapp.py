@@ -1,11 +1,17 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+import os
+import hmac
+import hashlib
 import logging
 from src.models.user import db
 from src.models.support import Alert
 from src.models.organization import APIConfiguration
 from src.services.whatsapp_service import WhatsAppService
+from src.services.config_cache import config_cache
 from src.services.auth_service import token_required
+from src.tasks.notifications import enqueue_alert_notification
+from src.services.whatsapp_status import whatsapp_status_buffer, extract_statuses
 
 logger = logging.getLogger(__name__)
 
@@ -35,11 +41,7 @@ def send_whatsapp_alert(current_user):
             return jsonify({'error': 'Alert not found'}), 404
         
         # Obtener configuración de WhatsApp de la organización
-        whatsapp_config = APIConfiguration.query.filter_by(
-            organization_id=current_user.organization_id,
-            api_type='whatsapp',
-            is_active=True
-        ).first()
+        whatsapp_config = config_cache.get(current_user.organization_id, 'whatsapp')
         
         if not whatsapp_config:
             return jsonify({'error': 'WhatsApp configuration not found'}), 404
@@ -51,20 +53,22 @@ def send_whatsapp_alert(current_user):
         )
         
         # Enviar mensaje
-        success = whatsapp_service.send_alert_message(rider_phone, alert.to_dict())
+        result = whatsapp_service.send_alert(rider_phone, alert.to_dict())
         
-        if success:
+        if result['success']:
             # Actualizar la alerta con información de WhatsApp
             alert.whatsapp_sent = True
             alert.whatsapp_sent_at = datetime.utcnow()
             alert.whatsapp_status = 'sent'
+            alert.whatsapp_message_id = result.get('message_id')
             alert.rider_phone = rider_phone
             db.session.commit()
             
             return jsonify({
                 'message': 'WhatsApp alert sent successfully',
                 'alert_id': alert_id,
-                'rider_phone': rider_phone
+                'rider_phone': rider_phone,
+                'message_id': result.get('message_id')
             }), 200
         else:
             return jsonify({'error': 'Failed to send WhatsApp alert'}), 500
@@ -97,11 +101,7 @@ def send_bulk_whatsapp_alert(current_user):
             return jsonify({'error': 'Alert not found'}), 404
         
         # Obtener configuración de WhatsApp
-        whatsapp_config = APIConfiguration.query.filter_by(
-            organization_id=current_user.organization_id,
-            api_type='whatsapp',
-            is_active=True
-        ).first()
+        whatsapp_config = config_cache.get(current_user.organization_id, 'whatsapp')
         
         if not whatsapp_config:
             return jsonify({'error': 'WhatsApp configuration not found'}), 404
@@ -112,18 +112,17 @@ def send_bulk_whatsapp_alert(current_user):
             phone_number_id=whatsapp_config.credentials.get('phone_number_id')
         )
         
-        # Enviar mensajes en lote
-        results = whatsapp_service.send_bulk_alerts(rider_phones, alert.to_dict())
-        
-        # Contar éxitos y fallos
-        successful_sends = sum(1 for success in results.values() if success)
-        failed_sends = len(rider_phones) - successful_sends
+        # Enviar mensajes en lote, en paralelo y reutilizando conexiones
+        bulk_result = whatsapp_service.send_bulk_alerts_concurrent(rider_phones, alert.to_dict())
+        stats = bulk_result['stats']
         
         return jsonify({
             'message': f'Bulk WhatsApp alerts processed',
-            'successful_sends': successful_sends,
-            'failed_sends': failed_sends,
-            'results': results
+            'successful_sends': stats['successful'],
+            'failed_sends': stats['failed'],
+            'results': {phone: result['success'] for phone, result in bulk_result['results'].items()},
+            'details': bulk_result['results'],
+            'stats': stats
         }), 200
         
     except Exception as e:
@@ -134,7 +133,7 @@ def send_bulk_whatsapp_alert(current_user):
 @token_required
 def auto_send_critical_alerts(current_user):
     """
-    Envía automáticamente alertas críticas por WhatsApp
+    Encola el envío automático de alertas críticas por WhatsApp
     """
     try:
         # Obtener alertas críticas no enviadas por WhatsApp
@@ -148,53 +147,23 @@ def auto_send_critical_alerts(current_user):
         if not critical_alerts:
             return jsonify({'message': 'No critical alerts to send'}), 200
         
-        # Obtener configuración de WhatsApp
-        whatsapp_config = APIConfiguration.query.filter_by(
-            organization_id=current_user.organization_id,
-            api_type='whatsapp',
-            is_active=True
-        ).first()
+        # Verificar configuración de WhatsApp antes de encolar
+        whatsapp_config = config_cache.get(current_user.organization_id, 'whatsapp')
         
         if not whatsapp_config:
             return jsonify({'error': 'WhatsApp configuration not found'}), 404
         
-        # Inicializar servicio de WhatsApp
-        whatsapp_service = WhatsAppService(
-            access_token=whatsapp_config.credentials.get('access_token'),
-            phone_number_id=whatsapp_config.credentials.get('phone_number_id')
-        )
-        
-        sent_count = 0
-        failed_count = 0
-        
+        enqueued_count = 0
         for alert in critical_alerts:
-            # Obtener número de teléfono del repartidor desde los datos de la alerta
-            rider_phone = alert.data.get('rider_phone') if alert.data else None
-            
-            if rider_phone:
-                success = whatsapp_service.send_alert_message(rider_phone, alert.to_dict())
-                
-                if success:
-                    alert.whatsapp_sent = True
-                    alert.whatsapp_sent_at = datetime.utcnow()
-                    alert.whatsapp_status = 'sent'
-                    alert.rider_phone = rider_phone
-                    sent_count += 1
-                else:
-                    alert.whatsapp_status = 'failed'
-                    failed_count += 1
-            else:
-                logger.warning(f"No phone number found for alert {alert.id}")
-                failed_count += 1
-        
-        db.session.commit()
+            if enqueue_alert_notification(alert):
+                enqueued_count += 1
         
         return jsonify({
-            'message': 'Critical alerts processed',
-            'sent_count': sent_count,
-            'failed_count': failed_count,
+            'message': 'Critical alerts enqueued',
+            'enqueued_count': enqueued_count,
+            'already_enqueued': len(critical_alerts) - enqueued_count,
             'total_alerts': len(critical_alerts)
-        }), 200
+        }), 202
         
     except Exception as e:
         logger.error(f"Error auto-sending critical alerts: {str(e)}")
@@ -278,11 +247,7 @@ def test_whatsapp(current_user):
             return jsonify({'error': 'phone_number is required'}), 400
         
         # Obtener configuración de WhatsApp
-        whatsapp_config = APIConfiguration.query.filter_by(
-            organization_id=current_user.organization_id,
-            api_type='whatsapp',
-            is_active=True
-        ).first()
+        whatsapp_config = config_cache.get(current_user.organization_id, 'whatsapp')
         
         if not whatsapp_config:
             return jsonify({'error': 'WhatsApp configuration not found'}), 404
@@ -312,3 +277,45 @@ def test_whatsapp(current_user):
         logger.error(f"Error sending test WhatsApp message: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+
+@whatsapp_bp.route('/webhook', methods=['GET'])
+def verify_webhook():
+    """
+    Verificación de la suscripción del webhook por parte de Meta
+    """
+    verify_token = os.environ.get('WHATSAPP_VERIFY_TOKEN')
+    
+    if (request.args.get('hub.mode') == 'subscribe' and verify_token and
+            hmac.compare_digest(request.args.get('hub.verify_token', ''), verify_token)):
+        return request.args.get('hub.challenge', ''), 200
+    
+    return jsonify({'error': 'Verification failed'}), 403
+
+@whatsapp_bp.route('/webhook', methods=['POST'])
+def receive_webhook():
+    """
+    Recibe los callbacks de estado de mensajes (sent, delivered, read, failed)
+    """
+    app_secret = os.environ.get('WHATSAPP_APP_SECRET')
+    if not app_secret:
+        # Sin secreto no se puede verificar la firma de Meta: nunca aceptar callbacks sin firmar
+        logger.error("WHATSAPP_APP_SECRET is not set; rejecting unsigned WhatsApp webhook callback")
+        return jsonify({'error': 'Webhook signature verification is not configured'}), 403
+    expected = 'sha256=' + hmac.new(app_secret.encode(), request.get_data(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(request.headers.get('X-Hub-Signature-256', ''), expected):
+        logger.warning("Rejected WhatsApp webhook callback with an invalid signature")
+        return jsonify({'error': 'Invalid signature'}), 403
+    
+    try:
+        payload = request.get_json(silent=True) or {}
+        statuses = extract_statuses(payload)
+        
+        # Se encolan en el búfer; la BD se actualiza por lotes
+        whatsapp_status_buffer.add(statuses)
+        
+        return jsonify({'received': len(statuses)}), 200
+        
+    except Exception as e:
+        # Responder 200 igualmente: Meta reintenta los callbacks con error y el búfer es idempotente
+        logger.error(f"Error processing WhatsApp webhook: {str(e)}")
+        return jsonify({'received': 0}), 200
@@ -0,0 +1,194 @@
+import os
+import re
+import math
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from src.services.cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached answer stays valid, by AIService method. Answers that depend
+# on live rider data expire quickly; SQL translations barely change.
+METHOD_TTLS = {
+    'generate_sql_from_nl': int(os.environ.get('AI_CACHE_TTL_SQL', 86400)),
+    'query_knowledge_base': int(os.environ.get('AI_CACHE_TTL_KNOWLEDGE', 3600)),
+    'generate_recommendations': int(os.environ.get('AI_CACHE_TTL_RECOMMENDATIONS', 600)),
+}
+DEFAULT_TTL = 600
+MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 5000))
+
+# Opt-in: also match paraphrases by embedding similarity (costs one embedding call per miss)
+SEMANTIC_ENABLED = os.environ.get('AI_CACHE_SEMANTIC', 'false').lower() == 'true'
+SEMANTIC_THRESHOLD = float(os.environ.get('AI_CACHE_SEMANTIC_THRESHOLD', 0.95))
+SEMANTIC_MAX_ENTRIES = 200  # Per organization and method
+EMBEDDING_MODEL = os.environ.get('AI_EMBEDDING_MODEL', 'text-embedding-3-small')
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Collapse whitespace and drop trailing punctuation so trivial variants of a
+    question share a key. Case is kept: it can change the answer (names, SQL
+    string literals, identifiers).
+    """
+    text = re.sub(r'\s+', ' ', (text or '').strip())
+    return text.rstrip(' ?!.¿¡')
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def _cosine(a: List[float], b: List[float], norm_a: float, norm_b: float) -> float:
+    if not norm_a or not norm_b:
+        return 0.0
+    return sum(x * y for x, y in zip(a, b)) / (norm_a * norm_b)
+
+
+class AIResponseCache:
+    """
+    LRU cache of AIService responses keyed by organization, method, the
+    verbatim context and the normalized question, with per-method TTLs and
+    hit-rate metrics.
+
+    Only successful responses are stored. With AI_CACHE_SEMANTIC enabled a
+    miss on the exact key falls back to the closest earlier question of the
+    same organization, method and context above the similarity threshold.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self._cache = TTLCache(DEFAULT_TTL, max_entries=max_entries)
+        self._lock = threading.Lock()
+        self._vectors: Dict[Tuple[str, str], List[Tuple[Tuple, str, List[float], float]]] = {}
+        self._metrics: Dict[str, Dict[str, int]] = {}
+
+    def cached_call(self, organization_id: str, method: str, question: str,
+                    compute: Callable[[], Dict], client=None, context: str = '') -> Dict:
+        """
+        Return the cached response for the question, or compute and store it
+
+        Args:
+            organization_id: Organization the answer belongs to (never shared across orgs)
+            method: AIService method name, selects the TTL
+            question: What the user asked; whitespace and trailing punctuation are normalized
+            compute: Calls the model on a miss
+            client: OpenAI client, only used for semantic matching
+            context: Everything else that determines the answer (schema, documents,
+                data digest); hashed verbatim
+
+        Returns:
+            Dict: Response, with 'cached': True when served from the cache
+        """
+        key = self._key(organization_id, method, question, context)
+        cached = self._cache.get(key)
+        if cached is not MISSING:
+            self._count(method, 'hits')
+            return dict(cached, cached=True)
+
+        embedding = None
+        context_digest = _digest(context)
+        if SEMANTIC_ENABLED and client is not None:
+            embedding = self._embed(client, question)
+            similar_key = self._nearest(organization_id, method, context_digest, embedding)
+            if similar_key is not None:
+                cached = self._cache.get(similar_key)
+                if cached is not MISSING:
+                    self._count(method, 'semantic_hits')
+                    return dict(cached, cached=True)
+
+        self._count(method, 'misses')
+        result = compute()
+        if isinstance(result, dict) and 'error' not in result:
+            self._cache.set(key, result, METHOD_TTLS.get(method, DEFAULT_TTL))
+            if embedding is not None:
+                self._remember_vector(organization_id, method, key, context_digest, embedding)
+        return result
+
+    def lookup(self, organization_id: str, method: str, question: str, context: str = '') -> Optional[Dict]:
+        """Exact-match lookup for callers that compute the answer themselves (streaming)"""
+        cached = self._cache.get(self._key(organization_id, method, question, context))
+        if cached is MISSING:
+            self._count(method, 'misses')
+            return None
+        self._count(method, 'hits')
+        return dict(cached, cached=True)
+
+    def store(self, organization_id: str, method: str, question: str, result: Dict, context: str = ''):
+        """Store a response computed outside cached_call"""
+        if isinstance(result, dict) and 'error' not in result:
+            self._cache.set(
+                self._key(organization_id, method, question, context), result, METHOD_TTLS.get(method, DEFAULT_TTL)
+            )
+
+    @staticmethod
+    def _key(organization_id: str, method: str, question: str, context: str = '') -> Tuple[str, str, str]:
+        return organization_id, method, _digest(context or '', normalize_prompt(question))
+
+    def _embed(self, client, question: str) -> Optional[List[float]]:
+        try:
+            response = client.embeddings.create(model=EMBEDDING_MODEL, input=normalize_prompt(question))
+            return list(response.data[0].embedding)
+        except Exception as e:
+            logger.warning(f"Embedding for semantic cache failed: {str(e)}")
+            return None
+
+    def _nearest(self, organization_id: str, method: str, context_digest: str, embedding: Optional[List[float]]):
+        if embedding is None:
+            return None
+        norm = math.sqrt(sum(x * x for x in embedding))
+        with self._lock:
+            candidates = list(self._vectors.get((organization_id, method), ()))
+        best_key, best_score = None, SEMANTIC_THRESHOLD
+        for key, vector_context, vector, vector_norm in candidates:
+            if vector_context != context_digest:
+                continue
+            score = _cosine(embedding, vector, norm, vector_norm)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _remember_vector(self, organization_id: str, method: str, key, context_digest: str,
+                         embedding: List[float]):
+        norm = math.sqrt(sum(x * x for x in embedding))
+        with self._lock:
+            vectors = self._vectors.setdefault((organization_id, method), [])
+            vectors.append((key, context_digest, embedding, norm))
+            if len(vectors) > SEMANTIC_MAX_ENTRIES:
+                del vectors[:len(vectors) - SEMANTIC_MAX_ENTRIES]
+
+    def _count(self, method: str, metric: str):
+        with self._lock:
+            counters = self._metrics.setdefault(method, {'hits': 0, 'semantic_hits': 0, 'misses': 0})
+            counters[metric] += 1
+
+    def invalidate(self, organization_id: Optional[str] = None):
+        """Drop cached answers (of one organization or all)"""
+        if organization_id is None:
+            self._cache.clear()
+            with self._lock:
+                self._vectors.clear()
+            return
+        self._cache.delete_where(lambda key: key[0] == organization_id)
+        with self._lock:
+            for vector_key in [k for k in self._vectors if k[0] == organization_id]:
+                del self._vectors[vector_key]
+
+    def stats(self) -> Dict:
+        """Hit-rate metrics per method plus cache occupancy"""
+        with self._lock:
+            methods = {method: dict(counters) for method, counters in self._metrics.items()}
+        for counters in methods.values():
+            total = counters['hits'] + counters['semantic_hits'] + counters['misses']
+            counters['hit_rate'] = round((counters['hits'] + counters['semantic_hits']) / total, 4) if total else None
+        return {
+            'entries': len(self._cache),
+            'max_entries': self._cache.max_entries,
+            'semantic_enabled': SEMANTIC_ENABLED,
+            'ttls': METHOD_TTLS,
+            'methods': methods
+        }
+
+
+# Shared per-process instance
+ai_response_cache = AIResponseCache()
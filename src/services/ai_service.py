@@ -1,33 +1,81 @@
 import openai
+import copy
 import json
 import re
+import logging
 from datetime import datetime
 from flask import current_app
 from src.models.organization import Organization
+from src.services.ai_cache import ai_response_cache
+from src.services.rider_summary import summarize_for_prompt
+from src.services.vector_store import vector_store
+
+logger = logging.getLogger(__name__)
+
+SQL_SYSTEM_PROMPT = "You are a SQL expert that converts natural language to SQL queries."
+SQL_PARAMS = {'temperature': 0.1, 'max_tokens': 500}
+
+KNOWLEDGE_SYSTEM_PROMPT = "You are a helpful assistant for a rider management platform. Provide accurate and helpful answers based on the context provided."
+KNOWLEDGE_PARAMS = {'temperature': 0.3, 'max_tokens': 800}
+KNOWLEDGE_TOP_K = 4
+
+# Database schema for rider management
+DEFAULT_SQL_SCHEMA = """
+        Tables available:
+        - riders: id, organization_id, name, email, phone, status, cash_amount, battery_level, late_duration_minutes, vehicle_type, city_id, company_id, created_at, updated_at
+        - shifts: id, organization_id, rider_id, start_time, end_time, status, planned_start, actual_start
+        - deliveries: id, organization_id, rider_id, order_id, pickup_time, delivery_time, status, distance_km
+        - companies: id, organization_id, name, city_id, active_riders_count, total_deliveries_today, updated_at
+        - alerts: id, organization_id, rider_id, alert_type, severity, status, city_id, created_at, resolved_at
+        
+        Timestamps are ISO-8601 text (UTC).
+        Important: Always filter by organization_id = '{organization_id}' for data isolation.
+        """
+
+# Default context about rider management
+DEFAULT_KNOWLEDGE_CONTEXT = """
+        Loginexia is a rider management platform that integrates with Delivery Hero's APIs.
+        
+        Key features:
+        - Real-time rider tracking and status monitoring
+        - Automated alert system for cash thresholds, no-shows, battery levels
+        - Performance analytics and KPI tracking
+        - Support ticket management
+        - AI-powered insights and recommendations
+        
+        Rider states include: AVAILABLE, BREAK, ENDING, LATE, NOT_WORKING, READY, STARTING, TEMP_NOT_WORKING, WORKING
+        
+        Common alerts:
+        - Cash threshold: When rider has ≥€120 cash
+        - No-show: When rider is late for shift
+        - Battery low: When device battery <20%
+        - Off-zone: When rider is outside designated area
+        """
 
 class AIService:
     def __init__(self):
         # OpenAI client is already configured via environment variables
         self.client = openai.OpenAI()
+    
+    def with_timeout(self, seconds):
+        """Copy of the service whose OpenAI requests give up after `seconds`, without retries"""
+        service = copy.copy(self)
+        service.client = self.client.with_options(timeout=max(seconds, 0.001), max_retries=0)
+        return service
         
     def generate_sql_from_nl(self, natural_query, organization_id, schema_info=None):
         """Convert natural language to SQL query"""
         
-        # Database schema for rider management
-        default_schema = """
-        Tables available:
-        - riders: id, name, email, phone, status, cash_amount, battery_level, vehicle_type, city_id, created_at
-        - shifts: id, rider_id, start_time, end_time, status, planned_start, actual_start
-        - deliveries: id, rider_id, order_id, pickup_time, delivery_time, status, distance_km
-        - companies: id, name, city_id, active_riders_count, total_deliveries_today
-        - alerts: id, rider_id, alert_type, severity, status, created_at, resolved_at
-        
-        Important: Always filter by organization_id = '{organization_id}' for data isolation.
-        """
+        schema = schema_info or DEFAULT_SQL_SCHEMA.format(organization_id=organization_id)
+        prompt = self._sql_prompt(natural_query, organization_id, schema)
         
-        schema = schema_info or default_schema.format(organization_id=organization_id)
-        
-        prompt = f"""
+        return ai_response_cache.cached_call(
+            organization_id, 'generate_sql_from_nl', natural_query,
+            lambda: self._generate_sql(prompt, natural_query), client=self.client, context=schema
+        )
+    
+    def _sql_prompt(self, natural_query, organization_id, schema):
+        return f"""
         You are a SQL expert. Convert the following natural language query to SQL.
         
         Database Schema:
@@ -37,7 +85,7 @@ class AIService:
         
         Rules:
         1. Always include WHERE organization_id = '{organization_id}' for data isolation
-        2. Use proper SQL syntax for PostgreSQL
+        2. Use proper SQL syntax for SQLite (a single SELECT statement)
         3. Return only the SQL query, no explanations
         4. Use appropriate JOINs when needed
         5. Handle date/time queries properly
@@ -45,36 +93,59 @@ class AIService:
         
         SQL Query:
         """
-        
+    
+    def _generate_sql(self, prompt, natural_query):
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[
-                    {"role": "system", "content": "You are a SQL expert that converts natural language to SQL queries."},
+                    {"role": "system", "content": SQL_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.1,
-                max_tokens=500
+                **SQL_PARAMS
             )
             
-            sql_query = response.choices[0].message.content.strip()
-            
-            # Basic SQL injection prevention
-            sql_query = self._sanitize_sql(sql_query)
-            
-            return {
-                'sql_query': sql_query,
-                'natural_query': natural_query,
-                'confidence': 'high',
-                'generated_at': datetime.utcnow().isoformat()
-            }
+            return self._sql_result(response.choices[0].message.content, natural_query)
             
         except Exception as e:
-            return {
-                'error': f"Failed to generate SQL: {str(e)}",
-                'natural_query': natural_query,
-                'generated_at': datetime.utcnow().isoformat()
-            }
+            return self._sql_error(e, natural_query)
+    
+    def _sql_result(self, text, natural_query):
+        sql_query = text.strip()
+        
+        # Basic SQL injection prevention
+        sql_query = self._sanitize_sql(sql_query)
+        
+        return {
+            'sql_query': sql_query,
+            'natural_query': natural_query,
+            'confidence': 'high',
+            'generated_at': datetime.utcnow().isoformat()
+        }
+    
+    def _sql_error(self, error, natural_query):
+        return {
+            'error': f"Failed to generate SQL: {str(error)}",
+            'natural_query': natural_query,
+            'generated_at': datetime.utcnow().isoformat()
+        }
+    
+    def stream_sql_from_nl(self, natural_query, organization_id, schema_info=None):
+        """
+        Streaming variant of generate_sql_from_nl.
+
+        Yields ('token', text) as the model produces them and finally
+        ('result', dict) with the same structure generate_sql_from_nl returns.
+        """
+        schema = schema_info or DEFAULT_SQL_SCHEMA.format(organization_id=organization_id)
+        prompt = self._sql_prompt(natural_query, organization_id, schema)
+        yield from self._stream_cached(
+            organization_id, 'generate_sql_from_nl', natural_query, schema, 'sql_query',
+            [{"role": "system", "content": SQL_SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+            SQL_PARAMS,
+            lambda text: self._sql_result(text, natural_query),
+            lambda error: self._sql_error(error, natural_query)
+        )
     
     def _sanitize_sql(self, sql_query):
         """Basic SQL sanitization"""
@@ -93,29 +164,43 @@ class AIService:
     def query_knowledge_base(self, question, organization_id, context_docs=None):
         """Answer questions using RAG (Retrieval Augmented Generation)"""
         
-        # Default context about rider management
-        default_context = """
-        Loginexia is a rider management platform that integrates with Delivery Hero's APIs.
+        context, sources = self._knowledge_context(question, organization_id, context_docs)
+        prompt = self._knowledge_prompt(question, context)
         
-        Key features:
-        - Real-time rider tracking and status monitoring
-        - Automated alert system for cash thresholds, no-shows, battery levels
-        - Performance analytics and KPI tracking
-        - Support ticket management
-        - AI-powered insights and recommendations
-        
-        Rider states include: AVAILABLE, BREAK, ENDING, LATE, NOT_WORKING, READY, STARTING, TEMP_NOT_WORKING, WORKING
-        
-        Common alerts:
-        - Cash threshold: When rider has ≥€120 cash
-        - No-show: When rider is late for shift
-        - Battery low: When device battery <20%
-        - Off-zone: When rider is outside designated area
+        return ai_response_cache.cached_call(
+            organization_id, 'query_knowledge_base', question,
+            lambda: self._answer_question(prompt, question, sources), client=self.client, context=context
+        )
+    
+    def _knowledge_context(self, question, organization_id, context_docs):
         """
+        Context for a question: the documents sent by the client, else the
+        organization's most relevant indexed chunks, else the default context.
+
+        Returns:
+            (context, sources) where sources describes the retrieved chunks
+        """
+        if context_docs:
+            return context_docs, []
         
-        context = context_docs or default_context
-        
-        prompt = f"""
+        try:
+            hits = vector_store.retrieve(self.client, organization_id, question, top_k=KNOWLEDGE_TOP_K)
+        except Exception as e:
+            logger.warning(f"Knowledge retrieval failed for organization {organization_id}: {str(e)}")
+            hits = []
+        if not hits:
+            return DEFAULT_KNOWLEDGE_CONTEXT, []
+        
+        context = "\n\n".join(
+            f"[{hit['title']}] {hit['text']}" if hit['title'] else hit['text'] for hit in hits
+        )
+        sources = [
+            {'document_id': hit['document_id'], 'title': hit['title'], 'score': hit['score']} for hit in hits
+        ]
+        return context, sources
+    
+    def _knowledge_prompt(self, question, context):
+        return f"""
         Context: {context}
         
         Question: {question}
@@ -124,36 +209,92 @@ class AIService:
         If the question is about specific data, mention that the user should check their dashboard or run a query.
         Keep the answer concise but informative.
         """
-        
+    
+    def _answer_question(self, prompt, question, sources=None):
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant for a rider management platform. Provide accurate and helpful answers based on the context provided."},
+                    {"role": "system", "content": KNOWLEDGE_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.3,
-                max_tokens=800
+                **KNOWLEDGE_PARAMS
             )
             
-            answer = response.choices[0].message.content.strip()
-            
-            return {
-                'answer': answer,
-                'question': question,
-                'confidence': 'high',
-                'generated_at': datetime.utcnow().isoformat()
-            }
+            return self._answer_result(response.choices[0].message.content, question, sources)
             
         except Exception as e:
-            return {
-                'error': f"Failed to generate answer: {str(e)}",
-                'question': question,
-                'generated_at': datetime.utcnow().isoformat()
-            }
+            return self._answer_error(e, question)
+    
+    def _answer_result(self, text, question, sources=None):
+        result = {
+            'answer': text.strip(),
+            'question': question,
+            'confidence': 'high',
+            'generated_at': datetime.utcnow().isoformat()
+        }
+        if sources:
+            result['sources'] = sources
+        return result
+    
+    def _answer_error(self, error, question):
+        return {
+            'error': f"Failed to generate answer: {str(error)}",
+            'question': question,
+            'generated_at': datetime.utcnow().isoformat()
+        }
     
-    def generate_recommendations(self, rider_data, historical_patterns=None, recommendation_type='general'):
-        """Generate AI-powered recommendations"""
+    def stream_knowledge_answer(self, question, organization_id, context_docs=None):
+        """
+        Streaming variant of query_knowledge_base.
+
+        Yields ('token', text) as the model produces them and finally
+        ('result', dict) with the same structure query_knowledge_base returns.
+        """
+        context, sources = self._knowledge_context(question, organization_id, context_docs)
+        prompt = self._knowledge_prompt(question, context)
+        yield from self._stream_cached(
+            organization_id, 'query_knowledge_base', question, context, 'answer',
+            [{"role": "system", "content": KNOWLEDGE_SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+            KNOWLEDGE_PARAMS,
+            lambda text: self._answer_result(text, question, sources),
+            lambda error: self._answer_error(error, question)
+        )
+    
+    def _stream_cached(self, organization_id, method, question, context, text_field, messages, params,
+                       build_result, build_error):
+        """Serve a cached answer as a single token, or stream the completion and cache the final result"""
+        cached = ai_response_cache.lookup(organization_id, method, question, context)
+        if cached is not None:
+            yield 'token', cached.get(text_field, '')
+            yield 'result', cached
+            return
+        
+        parts = []
+        try:
+            stream = self.client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                stream=True,
+                **params
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield 'token', delta
+            result = build_result(''.join(parts))
+        except Exception as e:
+            result = build_error(e)
+        
+        ai_response_cache.store(organization_id, method, question, result, context)
+        yield 'result', result
+    
+    def generate_recommendations(self, rider_data, historical_patterns=None, recommendation_type='general',
+                                 organization_id=None):
+        """Generate AI-powered recommendations (cached per organization when organization_id is given)"""
         
         data_summary = self._summarize_rider_data(rider_data)
         
@@ -192,6 +333,14 @@ class AIService:
         
         prompt = prompts.get(recommendation_type, prompts['general'])
         
+        if organization_id is None:
+            return self._recommend(prompt, recommendation_type)
+        return ai_response_cache.cached_call(
+            organization_id, 'generate_recommendations', recommendation_type,
+            lambda: self._recommend(prompt, recommendation_type), context=prompt
+        )
+    
+    def _recommend(self, prompt, recommendation_type):
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4",
@@ -221,18 +370,9 @@ class AIService:
             }
     
     def _summarize_rider_data(self, rider_data):
-        """Summarize rider data for AI processing"""
-        if isinstance(rider_data, dict):
-            return json.dumps(rider_data, indent=2)
-        elif isinstance(rider_data, list):
-            summary = {
-                'total_riders': len(rider_data),
-                'active_riders': len([r for r in rider_data if r.get('status') == 'WORKING']),
-                'available_riders': len([r for r in rider_data if r.get('status') == 'AVAILABLE']),
-                'riders_on_break': len([r for r in rider_data if r.get('status') == 'BREAK']),
-                'sample_rider': rider_data[0] if rider_data else None
-            }
-            return json.dumps(summary, indent=2)
+        """Summarize rider data for AI processing (bounded-size statistical digest)"""
+        if isinstance(rider_data, (dict, list)):
+            return summarize_for_prompt(rider_data, prompt_type='recommendations')
         else:
             return str(rider_data)
     
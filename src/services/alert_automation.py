@@ -1,13 +1,23 @@
 import logging
-from datetime import datetime
 from typing import Dict, List, Optional
 from src.models.user import db
-from src.models.support import Alert
-from src.models.organization import APIConfiguration
+from src.models.support import Alert, AlertOutbox
+from src.services.config_cache import config_cache
 from src.services.whatsapp_service import WhatsAppService
+from src.services.alert_events import alert_event_bus, ALERT_RAISED
 
 logger = logging.getLogger(__name__)
 
+# Resultados de un envío por WhatsApp (AlertDigestService)
+DELIVERY_SENT = 'sent'
+DELIVERY_FAILED = 'failed'
+DELIVERY_SKIPPED = 'skipped'
+DELIVERY_NO_CONFIG = 'no_config'
+DELIVERY_NO_PHONE = 'no_phone'
+
+# Tipos de evento del outbox
+OUTBOX_ALERT_RAISED = 'alert.raised'
+
 class AlertAutomationService:
     """
     Servicio para automatizar el envío de alertas críticas por WhatsApp
@@ -16,7 +26,10 @@ class AlertAutomationService:
     @staticmethod
     def process_new_alert(alert: Alert) -> bool:
         """
-        Procesa una nueva alerta y envía notificación por WhatsApp si es crítica
+        Procesa una nueva alerta y encola su notificación por WhatsApp si es crítica
+        
+        El envío lo hace un worker de Celery (src.tasks.notifications), así que
+        esta llamada no bloquea la petición HTTP.
         
         Args:
             alert: Objeto Alert recién creado
@@ -35,53 +48,35 @@ class AlertAutomationService:
                 logger.info(f"Alert {alert.id} already sent via WhatsApp")
                 return True
             
-            # Obtener configuración de WhatsApp de la organización
-            whatsapp_config = APIConfiguration.query.filter_by(
-                organization_id=alert.organization_id,
-                api_type='whatsapp',
-                is_active=True
-            ).first()
-            
-            if not whatsapp_config:
-                logger.warning(f"No WhatsApp configuration found for organization {alert.organization_id}")
-                return False
-            
-            # Obtener número de teléfono del repartidor
-            rider_phone = AlertAutomationService._get_rider_phone(alert)
-            
-            if not rider_phone:
-                logger.warning(f"No phone number found for rider in alert {alert.id}")
-                return False
-            
-            # Inicializar servicio de WhatsApp
-            whatsapp_service = WhatsAppService(
-                access_token=whatsapp_config.credentials.get('access_token'),
-                phone_number_id=whatsapp_config.credentials.get('phone_number_id')
-            )
-            
-            # Enviar mensaje
-            success = whatsapp_service.send_alert_message(rider_phone, alert.to_dict())
-            
-            if success:
-                # Actualizar la alerta
-                alert.whatsapp_sent = True
-                alert.whatsapp_sent_at = datetime.utcnow()
-                alert.whatsapp_status = 'sent'
-                alert.rider_phone = rider_phone
-                db.session.commit()
-                
-                logger.info(f"WhatsApp alert sent successfully for alert {alert.id}")
-                return True
-            else:
-                alert.whatsapp_status = 'failed'
-                db.session.commit()
-                logger.error(f"Failed to send WhatsApp alert for alert {alert.id}")
-                return False
+            from src.tasks.notifications import enqueue_alert_notification
+            enqueue_alert_notification(alert)
+            return True
                 
         except Exception as e:
             logger.error(f"Error processing alert {alert.id}: {str(e)}")
             return False
     
+    @staticmethod
+    def get_whatsapp_service(organization_id: str) -> Optional[WhatsAppService]:
+        """
+        Construye el WhatsAppService de una organización a partir de su configuración activa
+        
+        Args:
+            organization_id: ID de la organización
+            
+        Returns:
+            WhatsAppService o None si la organización no tiene WhatsApp configurado
+        """
+        whatsapp_config = config_cache.get(organization_id, 'whatsapp')
+        
+        if not whatsapp_config:
+            return None
+        
+        return WhatsAppService(
+            access_token=whatsapp_config.credentials.get('access_token'),
+            phone_number_id=whatsapp_config.credentials.get('phone_number_id')
+        )
+    
     @staticmethod
     def _get_rider_phone(alert: Alert) -> Optional[str]:
         """
@@ -94,6 +89,10 @@ class AlertAutomationService:
             str: Número de teléfono o None si no se encuentra
         """
         try:
+            # Columna indexada, rellenada al escribir la alerta
+            if alert.rider_phone:
+                return alert.rider_phone
+            
             # Buscar en los datos de la alerta
             if alert.data:
                 # Buscar directamente el teléfono
@@ -108,11 +107,10 @@ class AlertAutomationService:
                 if 'contact' in alert.data and 'phone' in alert.data['contact']:
                     return alert.data['contact']['phone']
             
-            # Si no se encuentra en los datos, intentar obtener desde la API de riders
+            # Si no se encuentra en los datos, buscar en el directorio local de repartidores
             if alert.rider_id:
-                # Aquí se podría hacer una llamada a la API de Delivery Hero
-                # para obtener la información del repartidor
-                pass
+                from src.services.rider_directory import rider_directory
+                return rider_directory.get_phone(alert.organization_id, alert.rider_id)
             
             return None
             
@@ -121,43 +119,23 @@ class AlertAutomationService:
             return None
     
     @staticmethod
-    def process_pending_alerts(organization_id: str) -> Dict[str, int]:
+    def process_pending_alerts(organization_id: str = None) -> Dict:
         """
-        Procesa todas las alertas críticas pendientes de una organización
+        Envía por lotes todas las alertas críticas pendientes de una organización
         
         Args:
-            organization_id: ID de la organización
+            organization_id: ID de la organización (None para todas)
             
         Returns:
             Dict con estadísticas del procesamiento
         """
         try:
-            # Obtener alertas críticas no enviadas
-            pending_alerts = Alert.query.filter_by(
-                organization_id=organization_id,
-                whatsapp_sent=False,
-                status='active'
-            ).filter(Alert.severity.in_(['critical', 'high'])).all()
-            
-            stats = {
-                'total_alerts': len(pending_alerts),
-                'sent_successfully': 0,
-                'failed_to_send': 0,
-                'no_phone_number': 0
-            }
-            
-            for alert in pending_alerts:
-                success = AlertAutomationService.process_new_alert(alert)
-                
-                if success and alert.whatsapp_sent:
-                    stats['sent_successfully'] += 1
-                elif not AlertAutomationService._get_rider_phone(alert):
-                    stats['no_phone_number'] += 1
-                else:
-                    stats['failed_to_send'] += 1
+            from src.services.pending_alert_processor import PendingAlertProcessor
             
-            logger.info(f"Processed {stats['total_alerts']} pending alerts for organization {organization_id}")
-            return stats
+            processor = PendingAlertProcessor()
+            if organization_id is None:
+                return processor.process_all()
+            return processor.process_organization(organization_id)
             
         except Exception as e:
             logger.error(f"Error processing pending alerts for organization {organization_id}: {str(e)}")
@@ -166,7 +144,10 @@ class AlertAutomationService:
     @staticmethod
     def create_alert_with_whatsapp(organization_id: str, alert_data: Dict, rider_phone: str = None) -> Alert:
         """
-        Crea una nueva alerta y automáticamente envía notificación por WhatsApp si es crítica
+        Crea una nueva alerta y encola su notificación por WhatsApp en el outbox
+        
+        La alerta y el evento de outbox se escriben en la misma transacción; el
+        envío real lo hace OutboxRelay fuera de la petición HTTP.
         
         Args:
             organization_id: ID de la organización
@@ -185,20 +166,29 @@ class AlertAutomationService:
                     alert_data['data'] = {}
                 alert_data['data']['rider_phone'] = rider_phone
             
-            # Crear la alerta
+            # Crear la alerta; su notificación la envía el relay del outbox, no el barrido
             alert = Alert(
                 id=str(uuid.uuid4()),
                 organization_id=organization_id,
-                **{k: v for k, v in alert_data.items() if k != 'id'}
+                **{k: v for k, v in alert_data.items() if k not in ('id', 'outbox_pending')},
+                outbox_pending=True
             )
             
             db.session.add(alert)
+            
+            # Evento de outbox en la misma transacción que la alerta
+            db.session.add(AlertOutbox(
+                organization_id=organization_id,
+                alert_id=alert.id,
+                rider_id=alert.rider_id,
+                event_type=OUTBOX_ALERT_RAISED,
+                payload={'alert_id': alert.id}
+            ))
             db.session.commit()
             
-            # Procesar automáticamente para WhatsApp
-            AlertAutomationService.process_new_alert(alert)
+            alert_event_bus.publish(organization_id, ALERT_RAISED, alert.to_dict())
             
-            logger.info(f"Created alert {alert.id} with automatic WhatsApp processing")
+            logger.info(f"Created alert {alert.id} with queued WhatsApp processing")
             return alert
             
         except Exception as e:
@@ -0,0 +1,238 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event, func, inspect
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.support import Alert, AlertCounter
+
+logger = logging.getLogger(__name__)
+
+_listeners_registered = False
+
+
+def _counter_key(alert: Alert, status: Optional[str] = None, severity: Optional[str] = None,
+                 city_id: Optional[str] = None) -> Tuple:
+    return (
+        alert.organization_id,
+        (city_id if city_id is not None else alert.city_id) or '',
+        alert.alert_type,
+        severity or alert.severity or 'medium',
+        status or alert.status or 'active'
+    )
+
+
+_KEY_COLUMNS = ('organization_id', 'city_id', 'alert_type', 'severity', 'status')
+
+
+def _upsert_statement(dialect_name: str, values: Dict, delta: int):
+    """INSERT ... ON CONFLICT que suma `delta` de forma atómica, o None si el dialecto no lo soporta"""
+    table = AlertCounter.__table__
+    if dialect_name in ('postgresql', 'sqlite'):
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).values(**values)
+        return statement.on_conflict_do_update(
+            index_elements=list(_KEY_COLUMNS),
+            set_={'count': table.c.count + delta, 'updated_at': values['updated_at']}
+        )
+    if dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).values(**values)
+        return statement.on_duplicate_key_update(count=table.c.count + delta, updated_at=values['updated_at'])
+    return None
+
+
+def _apply_delta(connection, key: Tuple, delta: int):
+    """Suma `delta` al contador de `key` dentro de la transacción del flush en curso"""
+    table = AlertCounter.__table__
+    values = dict(zip(_KEY_COLUMNS, key), updated_at=datetime.utcnow())
+    match = db.and_(*[table.c[column] == values[column] for column in _KEY_COLUMNS])
+    update = table.update().where(match).values(count=table.c.count + delta, updated_at=values['updated_at'])
+
+    if delta < 0:
+        if connection.execute(update).rowcount == 0:
+            logger.warning(f"Alert counter {key} missing on decrement; it will be repaired on reconcile")
+        return
+
+    # Upsert atómico: dos flushes concurrentes nunca insertan la misma clave dos veces
+    upsert = _upsert_statement(connection.dialect.name, dict(values, count=delta), delta)
+    if upsert is not None:
+        connection.execute(upsert)
+        return
+
+    # Otros dialectos: UPDATE y, si no hay fila, INSERT en un SAVEPOINT; si otra
+    # transacción la insertó entre medias, se repite el UPDATE
+    if connection.execute(update).rowcount:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(**values, count=delta))
+    except IntegrityError:
+        connection.execute(update)
+
+
+def _after_insert(mapper, connection, target):
+    _apply_delta(connection, _counter_key(target), 1)
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    status_history = state.attrs.status.history
+    severity_history = state.attrs.severity.history
+    city_history = state.attrs.city_id.history
+    if not (status_history.has_changes() or severity_history.has_changes() or city_history.has_changes()):
+        return
+
+    old_key = _counter_key(
+        target,
+        status=status_history.deleted[0] if status_history.deleted else None,
+        severity=severity_history.deleted[0] if severity_history.deleted else None,
+        city_id=(city_history.deleted[0] or '') if city_history.deleted else None
+    )
+    new_key = _counter_key(target)
+    if old_key != new_key:
+        _apply_delta(connection, old_key, -1)
+        _apply_delta(connection, new_key, 1)
+
+
+def _after_delete(mapper, connection, target):
+    _apply_delta(connection, _counter_key(target), -1)
+
+
+def register_alert_counter_listeners():
+    """Mantiene alert_counters actualizado en cada INSERT/UPDATE/DELETE de Alert"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    event.listen(Alert, 'after_insert', _after_insert)
+    event.listen(Alert, 'after_update', _after_update)
+    event.listen(Alert, 'after_delete', _after_delete)
+    _listeners_registered = True
+
+
+class AlertCounterService:
+    """
+    Lectura de los contadores materializados de alertas y reconciliación periódica
+    """
+
+    @staticmethod
+    def get_counts(organization_id: str, city_id: Optional[str] = None, status: Optional[str] = 'active') -> Dict:
+        """
+        Devuelve los totales de alertas por severidad y por tipo
+
+        Args:
+            organization_id: ID de la organización
+            city_id: Filtrar por ciudad (opcional)
+            status: Estado de las alertas a contar (None para todos)
+
+        Returns:
+            Dict con total, by_severity y by_type
+        """
+        query = AlertCounter.query.filter_by(organization_id=organization_id)
+        if city_id is not None:
+            query = query.filter_by(city_id=str(city_id))
+        if status is not None:
+            query = query.filter_by(status=status)
+
+        by_severity = Counter()
+        by_type = Counter()
+        for counter in query.all():
+            by_severity[counter.severity] += counter.count
+            by_type[counter.alert_type] += counter.count
+
+        return {
+            'total': sum(by_severity.values()),
+            'by_severity': dict(by_severity),
+            'by_type': dict(by_type)
+        }
+
+    @staticmethod
+    def reconcile(organization_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        Recalcula los contadores desde la tabla alerts y corrige las desviaciones
+
+        Args:
+            organization_id: Limitar a una organización (opcional)
+
+        Returns:
+            Dict con el número de contadores corregidos
+        """
+        query = db.session.query(
+            Alert.organization_id,
+            func.coalesce(Alert.city_id, ''),
+            Alert.alert_type,
+            func.coalesce(Alert.severity, 'medium'),
+            func.coalesce(Alert.status, 'active'),
+            func.count(Alert.id)
+        )
+        if organization_id:
+            query = query.filter(Alert.organization_id == organization_id)
+        query = query.group_by(
+            Alert.organization_id,
+            func.coalesce(Alert.city_id, ''),
+            Alert.alert_type,
+            func.coalesce(Alert.severity, 'medium'),
+            func.coalesce(Alert.status, 'active')
+        )
+
+        actual = Counter({tuple(row[:5]): row[5] for row in query.all()})
+
+        counters_query = AlertCounter.query
+        if organization_id:
+            counters_query = counters_query.filter_by(organization_id=organization_id)
+
+        repaired = 0
+        stored_keys = set()
+        for counter in counters_query.all():
+            key = (counter.organization_id, counter.city_id, counter.alert_type, counter.severity, counter.status)
+            stored_keys.add(key)
+            if counter.count != actual.get(key, 0):
+                logger.warning(f"Alert counter drift for {key}: stored {counter.count}, actual {actual.get(key, 0)}")
+                counter.count = actual.get(key, 0)
+                repaired += 1
+
+        for key, count in actual.items():
+            if key not in stored_keys:
+                organization, city_id, alert_type, severity, status = key
+                db.session.add(AlertCounter(
+                    organization_id=organization,
+                    city_id=city_id,
+                    alert_type=alert_type,
+                    severity=severity,
+                    status=status,
+                    count=count
+                ))
+                repaired += 1
+
+        db.session.commit()
+        logger.info(f"Alert counters reconciled: {repaired} counters repaired")
+        return {'repaired': repaired, 'counters': len(stored_keys | set(actual))}
+
+    @staticmethod
+    def seed() -> bool:
+        """
+        Siembra los contadores tras la migración si la tabla está vacía y ya hay alertas
+
+        Returns:
+            bool: True si se ejecutó la reconciliación
+        """
+        if AlertCounter.query.first() is not None or Alert.query.first() is None:
+            return False
+        try:
+            AlertCounterService.reconcile()
+        except IntegrityError:
+            # Otro worker sembró los contadores a la vez
+            db.session.rollback()
+            logger.info("Alert counters already seeded by another worker")
+        return True
+
+
+if __name__ == '__main__':
+    from src.main import app
+
+    with app.app_context():
+        AlertCounterService.reconcile()
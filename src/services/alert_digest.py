@@ -0,0 +1,242 @@
+import os
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import or_
+from src.models.user import db
+from src.models.support import Alert
+from src.services.alert_automation import (
+    AlertAutomationService, DELIVERY_SENT, DELIVERY_FAILED, DELIVERY_SKIPPED,
+    DELIVERY_NO_CONFIG, DELIVERY_NO_PHONE
+)
+
+logger = logging.getLogger(__name__)
+
+# Ventana en la que las alertas de un mismo repartidor se agrupan en un solo mensaje
+DIGEST_WINDOW_SECONDS = int(os.environ.get('ALERT_DIGEST_WINDOW', 60))
+
+
+class AlertDigestService:
+    """
+    Agrupa las alertas pendientes de un mismo destinatario en un único mensaje
+    de WhatsApp y las marca todas como enviadas en la misma transacción.
+
+    Es el único camino de envío: la tarea de Celery y el relay del outbox
+    llaman a dispatch() y el barrido de pendientes agrupa con group_by_recipient().
+    Las alertas con outbox_pending solo las envía el relay.
+    """
+
+    @staticmethod
+    def group_by_recipient(alerts: List[Alert], window_seconds: int = DIGEST_WINDOW_SECONDS,
+                           phones: Optional[Dict[str, str]] = None) -> List[List[Alert]]:
+        """
+        Agrupa alertas por teléfono del repartidor dentro de la ventana de agrupación
+
+        Args:
+            alerts: Alertas pendientes
+            window_seconds: Separación máxima desde la primera alerta del grupo
+            phones: Teléfonos ya resueltos por ID de alerta (opcional)
+
+        Returns:
+            List[List[Alert]]: Grupos de alertas; las alertas sin teléfono van solas
+        """
+        by_phone = defaultdict(list)
+        groups = []
+        for alert in alerts:
+            if phones is not None:
+                phone = phones.get(alert.id)
+            else:
+                phone = AlertAutomationService._get_rider_phone(alert)
+            if phone:
+                by_phone[phone].append(alert)
+            else:
+                groups.append([alert])
+
+        window = timedelta(seconds=window_seconds)
+        for phone_alerts in by_phone.values():
+            phone_alerts.sort(key=lambda a: a.created_at or datetime.min)
+            current = [phone_alerts[0]]
+            for alert in phone_alerts[1:]:
+                first_created = current[0].created_at or datetime.min
+                if alert.created_at and alert.created_at - first_created <= window:
+                    current.append(alert)
+                else:
+                    groups.append(current)
+                    current = [alert]
+            groups.append(current)
+
+        return groups
+
+    @staticmethod
+    def collect_pending(alert: Alert, window_seconds: int = DIGEST_WINDOW_SECONDS) -> List[Alert]:
+        """
+        Devuelve la alerta junto con las demás alertas pendientes del mismo repartidor en la ventana
+
+        Solo se agrupan alertas del mismo dueño (relay del outbox o tarea de
+        Celery), para que dos caminos nunca envíen la misma alerta a la vez.
+
+        Args:
+            alert: Alerta que dispara el envío
+            window_seconds: Ventana de agrupación
+
+        Returns:
+            List[Alert]: Alertas a incluir en el mismo mensaje
+        """
+        rider_phone = AlertAutomationService._get_rider_phone(alert)
+        if not rider_phone and not alert.rider_id:
+            return [alert]
+
+        query = Alert.query.filter(
+            Alert.organization_id == alert.organization_id,
+            Alert.id != alert.id,
+            Alert.whatsapp_sent == False,  # noqa: E712
+            Alert.status == 'active',
+            Alert.severity.in_(['critical', 'high']),
+            Alert.outbox_pending == bool(alert.outbox_pending)
+        )
+        if rider_phone and alert.rider_id:
+            # Mismo repartidor aunque la alerta no tenga teléfono, o mismo teléfono con otro ID
+            query = query.filter(or_(Alert.rider_id == alert.rider_id, Alert.rider_phone == rider_phone))
+        elif rider_phone:
+            query = query.filter(Alert.rider_phone == rider_phone)
+        else:
+            query = query.filter(Alert.rider_id == alert.rider_id)
+        if alert.created_at:
+            query = query.filter(Alert.created_at >= alert.created_at - timedelta(seconds=window_seconds))
+
+        return [alert] + query.all()
+
+    @staticmethod
+    def dispatch(alert_id: str) -> str:
+        """
+        Envía la alerta y las pendientes del mismo repartidor en un único mensaje y confirma el resultado
+
+        La lectura se confirma antes de la llamada a la Graph API, de modo que el
+        envío no mantiene abierta ninguna transacción; el resultado se aplica
+        después en una transacción corta.
+
+        Args:
+            alert_id: ID de la alerta que dispara el envío
+
+        Returns:
+            str: DELIVERY_SENT, DELIVERY_FAILED, DELIVERY_SKIPPED,
+                 DELIVERY_NO_CONFIG o DELIVERY_NO_PHONE
+        """
+        alert = db.session.get(Alert, alert_id)
+        if alert is None:
+            logger.warning(f"Alert {alert_id} not found, nothing to send")
+            return DELIVERY_SKIPPED
+
+        pending = [
+            candidate for candidate in AlertDigestService.collect_pending(alert)
+            if candidate.severity in ['critical', 'high'] and not candidate.whatsapp_sent
+        ]
+        if not pending:
+            db.session.commit()
+            return DELIVERY_SKIPPED
+
+        whatsapp_service = AlertAutomationService.get_whatsapp_service(alert.organization_id)
+        if not whatsapp_service:
+            logger.warning(f"No WhatsApp configuration found for organization {alert.organization_id}")
+            db.session.commit()
+            return DELIVERY_NO_CONFIG
+
+        rider_phone = _first_phone(pending)
+        if not rider_phone:
+            logger.warning(f"No phone number found for rider in alert {alert.id}")
+            db.session.commit()
+            return DELIVERY_NO_PHONE
+
+        alert_ids = [candidate.id for candidate in pending]
+        payloads = [candidate.to_dict() for candidate in pending]
+        db.session.commit()
+
+        result = whatsapp_service.send_alert_digest(rider_phone, payloads)
+
+        try:
+            AlertDigestService.apply_result(
+                Alert.query.filter(Alert.id.in_(alert_ids)).all(), rider_phone, result
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if result['success']:
+            logger.info(f"WhatsApp digest with {len(alert_ids)} alerts sent to {rider_phone}")
+            return DELIVERY_SENT
+
+        logger.error(f"Failed to send WhatsApp digest for alerts {alert_ids}")
+        return DELIVERY_FAILED
+
+    @staticmethod
+    def deliver_digest(alerts: List[Alert], whatsapp_service=None) -> str:
+        """
+        Envía un único mensaje con todas las alertas del grupo sin confirmar la transacción
+
+        Args:
+            alerts: Alertas de un mismo destinatario
+            whatsapp_service: Servicio ya resuelto para la organización (opcional)
+
+        Returns:
+            str: DELIVERY_SENT, DELIVERY_FAILED, DELIVERY_SKIPPED,
+                 DELIVERY_NO_CONFIG o DELIVERY_NO_PHONE
+        """
+        pending = [
+            alert for alert in alerts
+            if alert.severity in ['critical', 'high'] and not alert.whatsapp_sent
+        ]
+        if not pending:
+            return DELIVERY_SKIPPED
+
+        whatsapp_service = whatsapp_service or AlertAutomationService.get_whatsapp_service(
+            pending[0].organization_id
+        )
+        if not whatsapp_service:
+            logger.warning(f"No WhatsApp configuration found for organization {pending[0].organization_id}")
+            return DELIVERY_NO_CONFIG
+
+        rider_phone = _first_phone(pending)
+        if not rider_phone:
+            logger.warning(f"No phone number found for rider in alert {pending[0].id}")
+            return DELIVERY_NO_PHONE
+
+        result = whatsapp_service.send_alert_digest(rider_phone, [alert.to_dict() for alert in pending])
+        AlertDigestService.apply_result(pending, rider_phone, result)
+
+        if result['success']:
+            logger.info(f"WhatsApp digest with {len(pending)} alerts sent to {rider_phone}")
+            return DELIVERY_SENT
+
+        logger.error(f"Failed to send WhatsApp digest for alerts {[alert.id for alert in pending]}")
+        return DELIVERY_FAILED
+
+    @staticmethod
+    def apply_result(alerts: List[Alert], rider_phone: str, result: Dict):
+        """
+        Refleja en las alertas el resultado de un envío agrupado (sin commit)
+
+        Args:
+            alerts: Alertas incluidas en el mensaje
+            rider_phone: Teléfono al que se envió
+            result: Resultado devuelto por WhatsAppService
+        """
+        now = datetime.utcnow()
+        for alert in alerts:
+            if result['success']:
+                alert.whatsapp_sent = True
+                alert.whatsapp_sent_at = now
+                alert.whatsapp_status = 'sent'
+                alert.whatsapp_message_id = result.get('message_id')
+                alert.rider_phone = rider_phone
+            else:
+                alert.whatsapp_status = 'failed'
+
+
+def _first_phone(alerts: List[Alert]) -> Optional[str]:
+    for alert in alerts:
+        phone = AlertAutomationService._get_rider_phone(alert)
+        if phone:
+            return phone
+    return None
@@ -0,0 +1,168 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.services.redis_client import get_redis, get_redis_url, reset_redis
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento publicados en el stream
+ALERT_RAISED = 'alert.raised'
+ALERT_ACKNOWLEDGED = 'alert.acknowledged'
+ALERT_RESOLVED = 'alert.resolved'
+
+_STREAM_KEY = 'alert_events:{organization_id}'
+_STREAM_MAXLEN = 1000
+_BUFFER_SIZE = 500
+
+
+class AlertEventBus:
+    """
+    Bus de eventos de alertas por organización para alimentar el stream SSE.
+
+    Con Redis disponible los eventos se escriben en un Redis Stream por
+    organización (compartido entre workers y con IDs reanudables). Sin Redis se
+    usa un búfer circular en memoria con IDs secuenciales.
+    """
+
+    def __init__(self, buffer_size: int = _BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._buffers: Dict[str, deque] = {}
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def publish(self, organization_id: str, event_type: str, alert_data: Dict) -> Optional[str]:
+        """
+        Publica un evento de alerta para todos los clientes de la organización
+
+        Args:
+            organization_id: ID de la organización
+            event_type: alert.raised, alert.acknowledged o alert.resolved
+            alert_data: Representación serializable de la alerta
+
+        Returns:
+            str: ID del evento publicado
+        """
+        payload = json.dumps(alert_data, default=str)
+
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                return redis_client.xadd(
+                    _STREAM_KEY.format(organization_id=organization_id),
+                    {'type': event_type, 'data': payload},
+                    maxlen=_STREAM_MAXLEN,
+                    approximate=True
+                )
+            except Exception as e:
+                logger.warning(f"Could not publish alert event to Redis, using local buffer: {str(e)}")
+                reset_redis()
+
+        with self._condition:
+            self._sequence += 1
+            event_id = str(self._sequence)
+            buffer = self._buffers.setdefault(organization_id, deque(maxlen=self.buffer_size))
+            buffer.append((event_id, event_type, payload))
+            self._condition.notify_all()
+        return event_id
+
+    def current_id(self, organization_id: str) -> str:
+        """
+        ID del último evento publicado para la organización
+
+        Se envía al abrir un stream sin Last-Event-ID para que el cliente,
+        al reconectar, reanude desde ese punto sin perder eventos.
+        """
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                latest = redis_client.xrevrange(_STREAM_KEY.format(organization_id=organization_id), count=1)
+                return latest[0][0] if latest else '0-0'
+            except Exception:
+                reset_redis()
+        with self._condition:
+            return str(self._sequence)
+
+    def subscribe(self, organization_id: str, last_event_id: Optional[str] = None,
+                  heartbeat: float = 15.0) -> Iterator[Optional[Tuple[str, str, str]]]:
+        """
+        Itera sobre los eventos de la organización a partir de last_event_id.
+
+        Produce tuplas (id, tipo, json) y None cada `heartbeat` segundos sin
+        eventos, para que el llamador pueda enviar un keep-alive.
+        """
+        if get_redis() is not None:
+            yield from self._subscribe_redis(organization_id, last_event_id, heartbeat)
+        else:
+            yield from self._subscribe_local(organization_id, last_event_id, heartbeat)
+
+    def _subscribe_redis(self, organization_id, last_event_id, heartbeat):
+        import redis
+
+        # Cliente dedicado: XREAD bloqueante necesita un timeout de socket mayor que el bloqueo
+        client = redis.Redis.from_url(
+            get_redis_url(),
+            socket_timeout=heartbeat + 5,
+            decode_responses=True
+        )
+        stream_key = _STREAM_KEY.format(organization_id=organization_id)
+        cursor = last_event_id or '$'
+        try:
+            while True:
+                response = client.xread({stream_key: cursor}, block=int(heartbeat * 1000), count=100)
+                if not response:
+                    yield None
+                    continue
+                for _, entries in response:
+                    for event_id, fields in entries:
+                        cursor = event_id
+                        yield event_id, fields.get('type'), fields.get('data')
+        finally:
+            client.close()
+
+    def _subscribe_local(self, organization_id, last_event_id, heartbeat):
+        cursor = self._parse_local_id(last_event_id)
+        if cursor is None:
+            with self._condition:
+                cursor = self._sequence
+
+        while True:
+            with self._condition:
+                pending = self._pending_since(organization_id, cursor)
+                if not pending:
+                    self._condition.wait(timeout=heartbeat)
+                    pending = self._pending_since(organization_id, cursor)
+
+            if not pending:
+                yield None
+                continue
+            for event in pending:
+                cursor = int(event[0])
+                yield event
+
+    def _pending_since(self, organization_id: str, cursor: int) -> List[Tuple[str, str, str]]:
+        buffer = self._buffers.get(organization_id)
+        if not buffer:
+            return []
+        return [event for event in buffer if int(event[0]) > cursor]
+
+    @staticmethod
+    def _parse_local_id(last_event_id: Optional[str]) -> Optional[int]:
+        try:
+            return int(last_event_id) if last_event_id else None
+        except ValueError:
+            return None
+
+
+def format_sse(event: Optional[Tuple[str, str, str]]) -> str:
+    """Serializa un evento (o un keep-alive si es None) en formato text/event-stream"""
+    if event is None:
+        return f": keep-alive {int(time.time())}\n\n"
+    event_id, event_type, payload = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+# Instancia compartida por proceso
+alert_event_bus = AlertEventBus()
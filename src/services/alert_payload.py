@@ -0,0 +1,112 @@
+import logging
+from typing import Dict
+from sqlalchemy import event, inspect, text
+from src.models.user import db
+from src.models.support import Alert, AlertOutbox
+
+logger = logging.getLogger(__name__)
+
+# Columnas promovidas desde Alert.data (nombre -> tipo SQL para ALTER TABLE)
+PROMOTED_COLUMNS = {
+    'city_id': 'VARCHAR(100)',
+    'cash_amount': 'FLOAT',
+    'battery_level': 'INTEGER',
+    'late_minutes': 'INTEGER',
+}
+
+# Otras columnas añadidas a alerts después de su creación
+ADDED_COLUMNS = {
+    'outbox_pending': 'BOOLEAN NOT NULL DEFAULT FALSE',
+}
+
+_PAYLOAD_ATTRIBUTES = ('data', 'rider_phone')
+
+_listeners_registered = False
+
+
+def _before_insert(mapper, connection, target):
+    target.apply_payload_fields()
+
+
+def _before_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _PAYLOAD_ATTRIBUTES):
+        target.apply_payload_fields()
+
+
+def register_alert_payload_listeners():
+    """Extrae los campos calientes de Alert.data a sus columnas en cada escritura"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    event.listen(Alert, 'before_insert', _before_insert)
+    event.listen(Alert, 'before_update', _before_update)
+    _listeners_registered = True
+
+
+def ensure_alert_columns():
+    """
+    Añade las columnas promovidas y sus índices a una tabla alerts existente
+
+    db.create_all() no altera tablas ya creadas, así que las bases de datos
+    anteriores a estas columnas necesitan este paso una sola vez.
+    """
+    inspector = inspect(db.engine)
+    if not inspector.has_table(Alert.__tablename__):
+        return
+
+    existing = {column['name'] for column in inspector.get_columns(Alert.__tablename__)}
+    with db.engine.begin() as connection:
+        for name, sql_type in {**PROMOTED_COLUMNS, **ADDED_COLUMNS}.items():
+            if name not in existing:
+                connection.execute(text(f"ALTER TABLE {Alert.__tablename__} ADD COLUMN {name} {sql_type}"))
+                logger.info(f"Added column alerts.{name}")
+
+        for index in Alert.__table__.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+        # Índices del outbox para la selección por partición
+        if inspector.has_table(AlertOutbox.__tablename__):
+            for index in AlertOutbox.__table__.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+
+def backfill_alert_columns(batch_size: int = 500) -> Dict[str, int]:
+    """
+    Rellena las columnas promovidas de las alertas existentes, por lotes
+
+    Args:
+        batch_size: Número de alertas por transacción
+
+    Returns:
+        Dict con el número de alertas actualizadas
+    """
+    updated = 0
+    last_id = ''
+    while True:
+        batch = (
+            Alert.query
+            .filter(Alert.id > last_id)
+            .order_by(Alert.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+
+        for alert in batch:
+            alert.apply_payload_fields()
+        updated += len(batch)
+        last_id = batch[-1].id
+        db.session.commit()
+
+    logger.info(f"Backfilled promoted columns for {updated} alerts")
+    return {'updated': updated}
+
+
+if __name__ == '__main__':
+    from src.main import app
+
+    with app.app_context():
+        ensure_alert_columns()
+        backfill_alert_columns()
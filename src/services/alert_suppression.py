@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+from flask import current_app, has_app_context
+from src.services.redis_client import get_redis, reset_redis
+
+logger = logging.getLogger(__name__)
+
+# Umbrales de alerta por tipo: fuente única para la detección y la histéresis.
+# 'direction' indica si la alerta se dispara por encima ('above') o por debajo ('below')
+# del umbral de entrada ('inclusive' si el propio umbral ya dispara); solo se da por
+# terminada al cruzar el umbral de salida.
+DEFAULT_SUPPRESSION_RULES = {
+    'cash_threshold': {'metric': 'cash_amount', 'direction': 'above', 'enter': 120, 'exit': 110, 'inclusive': True},
+    'no_show': {'metric': 'late_duration_minutes', 'direction': 'above', 'enter': 30, 'exit': 20},
+    'battery_low': {'metric': 'battery_level', 'direction': 'below', 'enter': 20, 'exit': 25},
+}
+
+DEFAULT_COOLDOWN_SECONDS = int(os.environ.get('ALERT_SUPPRESSION_COOLDOWN', 900))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('ALERT_SUPPRESSION_MAX_ENTRIES', 50000))
+# Segundos que una entrada local (incluidas las lecturas sin estado) se da por buena
+# antes de volver a consultar Redis
+DEFAULT_SYNC_SECONDS = float(os.environ.get('ALERT_SUPPRESSION_SYNC_SECONDS', 30))
+
+_REDIS_KEY = 'alert_suppression:{organization_id}'
+
+
+def alert_rules() -> Dict:
+    """Reglas vigentes: ALERT_SUPPRESSION_RULES de la app o las de por defecto"""
+    if has_app_context():
+        return current_app.config.get('ALERT_SUPPRESSION_RULES', DEFAULT_SUPPRESSION_RULES)
+    return DEFAULT_SUPPRESSION_RULES
+
+
+def crosses_enter(rule: Dict, value) -> bool:
+    """Condición de disparo de una regla, sin histéresis"""
+    if value is None:
+        return False
+    if rule['direction'] == 'above':
+        return value >= rule['enter'] if rule.get('inclusive') else value > rule['enter']
+    return value <= rule['enter'] if rule.get('inclusive') else value < rule['enter']
+
+
+class SuppressionDecision(NamedTuple):
+    active: bool  # La condición de alerta sigue vigente (con histéresis)
+    notify: bool  # Es una alerta nueva que debe llegar a la BD / WhatsApp
+
+
+class AlertSuppressionService:
+    """
+    Capa de supresión e histéresis para las alertas detectadas en cada sondeo.
+
+    El estado se guarda por (organización, repartidor, tipo de alerta) como una
+    tupla compacta (activa, último aviso) en memoria del proceso, y se replica
+    en un hash de Redis cuando está disponible para compartirlo entre workers.
+    Las entradas locales, también las de claves sin estado en Redis, caducan a
+    los sync_seconds y se vuelven a leer de Redis para recoger los cambios de
+    otros workers.
+    """
+
+    def __init__(self, rules: Optional[Dict] = None, cooldown_seconds: Optional[int] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, sync_seconds: float = DEFAULT_SYNC_SECONDS):
+        self._rules = rules
+        self._cooldown_seconds = cooldown_seconds
+        self.max_entries = max_entries
+        self.sync_seconds = sync_seconds
+        # (activa, último aviso, momento de la última sincronización con Redis)
+        self._state: Dict[Tuple[str, str, str], Tuple[bool, float, float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> Dict:
+        if self._rules is not None:
+            return self._rules
+        return alert_rules()
+
+    def cooldown_for(self, alert_type: str) -> int:
+        """Ventana de enfriamiento para un tipo de alerta"""
+        rule_cooldown = self.rules.get(alert_type, {}).get('cooldown')
+        if rule_cooldown is not None:
+            return rule_cooldown
+        if self._cooldown_seconds is not None:
+            return self._cooldown_seconds
+        if has_app_context():
+            return current_app.config.get('ALERT_SUPPRESSION_COOLDOWN', DEFAULT_COOLDOWN_SECONDS)
+        return DEFAULT_COOLDOWN_SECONDS
+
+    def evaluate(self, organization_id: str, rider_id: str, alert_type: str, value) -> SuppressionDecision:
+        """
+        Evalúa una lectura del repartidor contra los umbrales de entrada/salida
+
+        Args:
+            organization_id: ID de la organización
+            rider_id: ID del repartidor
+            alert_type: Tipo de alerta (cash_threshold, no_show, battery_low...)
+            value: Valor actual de la métrica asociada a la alerta
+
+        Returns:
+            SuppressionDecision: si la alerta está activa y si debe notificarse
+        """
+        rule = self.rules.get(alert_type)
+        if rule is None or value is None:
+            return SuppressionDecision(active=False, notify=False)
+
+        key = (organization_id, str(rider_id), alert_type)
+        now = time.time()
+        was_active, last_notified = self._get_state(key)
+
+        if was_active:
+            active = value > rule['exit'] if rule['direction'] == 'above' else value < rule['exit']
+        else:
+            active = crosses_enter(rule, value)
+
+        notify = False
+        if active and not was_active:
+            # Flanco de subida: solo se notifica si ha pasado el enfriamiento
+            notify = now - last_notified >= self.cooldown_for(alert_type)
+            self._set_state(key, (True, now if notify else last_notified))
+        elif not active and was_active:
+            self._set_state(key, (False, last_notified))
+
+        return SuppressionDecision(active=active, notify=notify)
+
+    def reset(self, organization_id: str, rider_id: str, alert_type: str):
+        """Olvida el estado de una clave (p. ej. cuando la alerta se resuelve manualmente)"""
+        key = (organization_id, str(rider_id), alert_type)
+        with self._lock:
+            self._state.pop(key, None)
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                redis_client.hdel(_REDIS_KEY.format(organization_id=organization_id), f"{key[1]}:{alert_type}")
+            except Exception as e:
+                logger.warning(f"Could not reset suppression state in Redis: {str(e)}")
+                reset_redis()
+
+    def _get_state(self, key: Tuple[str, str, str]) -> Tuple[bool, float]:
+        now = time.time()
+        with self._lock:
+            entry = self._state.get(key)
+        if entry is not None and now - entry[2] < self.sync_seconds:
+            return entry[:2]
+
+        # Fallo o entrada caducada: consultar el estado compartido en Redis
+        redis_client = get_redis()
+        if redis_client is None:
+            return entry[:2] if entry is not None else (False, 0.0)
+        try:
+            raw = redis_client.hget(_REDIS_KEY.format(organization_id=key[0]), f"{key[1]}:{key[2]}")
+        except Exception as e:
+            logger.warning(f"Could not read suppression state from Redis: {str(e)}")
+            reset_redis()
+            return entry[:2] if entry is not None else (False, 0.0)
+
+        if raw:
+            active, last_notified = raw.split('|', 1)
+            state = (active == '1', float(last_notified))
+        else:
+            state = (False, 0.0)
+        # También se guardan las lecturas vacías para no repetir el HGET en cada sondeo
+        with self._lock:
+            self._state[key] = (*state, now)
+            if len(self._state) > self.max_entries:
+                self._prune()
+        return state
+
+    def _set_state(self, key: Tuple[str, str, str], state: Tuple[bool, float]):
+        with self._lock:
+            self._state[key] = (*state, time.time())
+            if len(self._state) > self.max_entries:
+                self._prune()
+
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                redis_key = _REDIS_KEY.format(organization_id=key[0])
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.hset(redis_key, f"{key[1]}:{key[2]}", f"{int(state[0])}|{state[1]}")
+                pipe.expire(redis_key, 86400)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Could not write suppression state to Redis: {str(e)}")
+                reset_redis()
+
+    def _prune(self):
+        """Elimina las entradas inactivas cuyo enfriamiento ya expiró (llamar con el lock tomado)"""
+        now = time.time()
+        expired = [
+            key for key, (active, last_notified, _) in self._state.items()
+            if not active and now - last_notified >= self.cooldown_for(key[2])
+        ]
+        for key in expired:
+            del self._state[key]
+
+        # Si sigue lleno, descartar las entradas más antiguas
+        overflow = len(self._state) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self._state.items(), key=lambda item: item[1][1])[:overflow]
+            for key, _ in oldest:
+                del self._state[key]
+
+
+# Instancia compartida por proceso
+alert_suppressor = AlertSuppressionService()
@@ -0,0 +1,488 @@
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from src.services.cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ANALYTICS_DB_PATH = os.environ.get('ANALYTICS_DB_PATH', os.path.join(BASE_DIR, 'data', 'analytics.db'))
+ANALYTICS_MAX_ROWS = int(os.environ.get('ANALYTICS_MAX_ROWS', 1000))
+ANALYTICS_QUERY_TIMEOUT = float(os.environ.get('ANALYTICS_QUERY_TIMEOUT', 5))
+ANALYTICS_RESULT_CACHE_TTL = int(os.environ.get('ANALYTICS_RESULT_CACHE_TTL', 600))
+STREAM_BATCH_SIZE = 500
+_ALERT_SYNC_BATCH_SIZE = 1000
+# Alerts written while a sync runs are picked up by the next one
+_ALERT_SYNC_OVERLAP = timedelta(seconds=5)
+
+# Tables exposed to generated SQL; every one carries organization_id
+TABLES = ('riders', 'shifts', 'deliveries', 'companies', 'alerts')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS riders (
+    organization_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    email TEXT,
+    phone TEXT,
+    status TEXT,
+    cash_amount REAL,
+    battery_level REAL,
+    late_duration_minutes REAL,
+    vehicle_type TEXT,
+    city_id TEXT,
+    company_id TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (organization_id, id)
+);
+CREATE INDEX IF NOT EXISTS ix_riders_status ON riders (organization_id, status, city_id);
+CREATE INDEX IF NOT EXISTS ix_riders_city ON riders (organization_id, city_id, company_id);
+CREATE INDEX IF NOT EXISTS ix_riders_cash ON riders (organization_id, cash_amount);
+CREATE INDEX IF NOT EXISTS ix_riders_battery ON riders (organization_id, battery_level);
+
+CREATE TABLE IF NOT EXISTS shifts (
+    organization_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    rider_id TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    status TEXT,
+    planned_start TEXT,
+    actual_start TEXT,
+    PRIMARY KEY (organization_id, id)
+);
+CREATE INDEX IF NOT EXISTS ix_shifts_rider ON shifts (organization_id, rider_id, start_time);
+CREATE INDEX IF NOT EXISTS ix_shifts_planned ON shifts (organization_id, planned_start, status);
+
+CREATE TABLE IF NOT EXISTS deliveries (
+    organization_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    rider_id TEXT,
+    order_id TEXT,
+    pickup_time TEXT,
+    delivery_time TEXT,
+    status TEXT,
+    distance_km REAL,
+    PRIMARY KEY (organization_id, id)
+);
+CREATE INDEX IF NOT EXISTS ix_deliveries_rider ON deliveries (organization_id, rider_id, delivery_time);
+CREATE INDEX IF NOT EXISTS ix_deliveries_time ON deliveries (organization_id, delivery_time, status);
+
+CREATE TABLE IF NOT EXISTS companies (
+    organization_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    city_id TEXT,
+    active_riders_count INTEGER,
+    total_deliveries_today INTEGER,
+    updated_at TEXT,
+    PRIMARY KEY (organization_id, id)
+);
+CREATE INDEX IF NOT EXISTS ix_companies_city ON companies (organization_id, city_id);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    organization_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    rider_id TEXT,
+    alert_type TEXT,
+    severity TEXT,
+    status TEXT,
+    city_id TEXT,
+    created_at TEXT,
+    resolved_at TEXT,
+    PRIMARY KEY (organization_id, id)
+);
+CREATE INDEX IF NOT EXISTS ix_alerts_type ON alerts (organization_id, alert_type, created_at);
+CREATE INDEX IF NOT EXISTS ix_alerts_status ON alerts (organization_id, status, severity);
+CREATE INDEX IF NOT EXISTS ix_alerts_rider ON alerts (organization_id, rider_id, created_at);
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    organization_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COLUMNS = {
+    'riders': ('id', 'name', 'email', 'phone', 'status', 'cash_amount', 'battery_level',
+               'late_duration_minutes', 'vehicle_type', 'city_id', 'company_id', 'created_at', 'updated_at'),
+    'shifts': ('id', 'rider_id', 'start_time', 'end_time', 'status', 'planned_start', 'actual_start'),
+    'deliveries': ('id', 'rider_id', 'order_id', 'pickup_time', 'delivery_time', 'status', 'distance_km'),
+    'companies': ('id', 'name', 'city_id', 'active_riders_count', 'total_deliveries_today', 'updated_at'),
+    'alerts': ('id', 'rider_id', 'alert_type', 'severity', 'status', 'city_id', 'created_at', 'resolved_at'),
+}
+
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_FENCE = re.compile(r'^```(?:sql)?\s*|\s*```$', re.IGNORECASE)
+
+
+class AnalyticsQueryError(Exception):
+    """Generated SQL that cannot run against the analytics store"""
+
+
+def prepare_sql(sql: str) -> str:
+    """Strip code fences, comments and the trailing semicolon; only one SELECT/WITH statement is accepted"""
+    sql = _FENCE.sub('', (sql or '').strip())
+    sql = re.sub(r'--[^\n]*', ' ', sql)
+    sql = re.sub(r'/\*.*?\*/', ' ', sql, flags=re.DOTALL).strip().rstrip(';').strip()
+    if not sql:
+        raise AnalyticsQueryError('Empty query')
+    if not re.match(r'(select|with)\b', sql, re.IGNORECASE):
+        raise AnalyticsQueryError('Only SELECT queries can be executed')
+    if not sqlite3.complete_statement(sql + ';') or ';' in _LITERAL.sub("''", sql):
+        raise AnalyticsQueryError('Only a single SQL statement can be executed')
+    return sql
+
+
+def normalize_sql(sql: str) -> str:
+    """Cache key form of a query: keywords and identifiers lowercased, whitespace collapsed, literals untouched"""
+    parts = _LITERAL.split(sql)
+    return ''.join(
+        part if index % 2 else re.sub(r'\s+', ' ', part.lower())
+        for index, part in enumerate(parts)
+    ).strip()
+
+
+def _items(data, keys: Iterable[str]) -> List[Dict]:
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    if isinstance(data, dict):
+        for key in keys:
+            if isinstance(data.get(key), list):
+                return [item for item in data[key] if isinstance(item, dict)]
+    return []
+
+
+def _first(record: Dict, *fields):
+    """First field that is present (IDs may legitimately be 0)"""
+    for field in fields:
+        if record.get(field) is not None:
+            return record[field]
+    return None
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        value = value.get('id') or value.get('name')
+    return str(value) if value is not None else None
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None and not isinstance(value, bool) else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else _text(value)
+
+
+class AnalyticsStore:
+    """
+    Local SQLite copy of the riders/shifts/deliveries/companies/alerts schema
+    that generate_sql_from_nl targets.
+
+    The refresh_analytics_store task upserts a live rider and company snapshot
+    per known city (skipped when it is identical to the previous one) and syncs
+    the alerts table incrementally; request handlers never write. Each write
+    bumps the organization's data version. Generated SQL runs on a read-only connection where the five
+    tables are TEMP views restricted to the caller's organization and an
+    authorizer rejects everything but reads through those views. Results are
+    cached by normalized SQL plus data version, so any new data invalidates them.
+    """
+
+    def __init__(self, path: str = ANALYTICS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._initialized = False
+        self._results = TTLCache(ANALYTICS_RESULT_CACHE_TTL, max_entries=500)
+
+    # -- connections --
+
+    def _writer(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'writer', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if not self._initialized:
+                connection.executescript(_SCHEMA)
+                self._initialized = True
+            self._local.writer = connection
+        return connection
+
+    def _reader(self, organization_id: str) -> sqlite3.Connection:
+        self._writer()  # Creates the file and schema on first use
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        organization_literal = "'" + str(organization_id).replace("'", "''") + "'"
+        for table in TABLES:
+            columns = ', '.join(_COLUMNS[table])
+            connection.execute(
+                f"CREATE TEMP VIEW {table} AS SELECT organization_id, {columns} "
+                f"FROM main.{table} WHERE organization_id = {organization_literal}"
+            )
+        connection.set_authorizer(self._authorize)
+        deadline = time.monotonic() + ANALYTICS_QUERY_TIMEOUT
+        connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+        return connection
+
+    @staticmethod
+    def _authorize(action, arg1, arg2, database, source):
+        if action in _ALLOWED_ACTIONS:
+            return sqlite3.SQLITE_OK
+        if action == sqlite3.SQLITE_READ:
+            # Direct reads must go through the organization views; the views themselves read main.
+            # CTEs and subqueries are reported without a database
+            if database is None or (database == 'temp' and arg1 in TABLES) or source in TABLES:
+                return sqlite3.SQLITE_OK
+        return sqlite3.SQLITE_DENY
+
+    # -- ingestion --
+
+    def _upsert(self, connection: sqlite3.Connection, table: str, organization_id: str, rows: List[Tuple]):
+        if not rows:
+            return
+        columns = ('organization_id',) + _COLUMNS[table]
+        updates = ', '.join(f"{column} = excluded.{column}" for column in _COLUMNS[table][1:])
+        connection.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (organization_id, id) DO UPDATE SET {updates}",
+            [(organization_id,) + row for row in rows]
+        )
+
+    def _bump_versions(self, connection: sqlite3.Connection, organization_ids: Iterable[str]):
+        connection.executemany(
+            "INSERT INTO data_versions (organization_id, version) VALUES (?, 1) "
+            "ON CONFLICT (organization_id) DO UPDATE SET version = version + 1",
+            [(organization_id,) for organization_id in set(organization_ids)]
+        )
+
+    def ingest_snapshot(self, organization_id: str, city_id, rider_data=None, company_data=None) -> Dict[str, int]:
+        """
+        Upsert a live snapshot (get_live_riders / get_companies_overview responses)
+
+        Shifts and deliveries are taken from the riders when the snapshot
+        embeds them ('shift', 'shifts', 'deliveries').
+
+        Returns:
+            Dict with the number of rows written per table
+        """
+        now = datetime.utcnow().isoformat()
+        city = _text(city_id)
+        riders, shifts, deliveries, companies = [], [], [], []
+
+        for rider in _items(rider_data, ('riders', 'employees', 'items', 'data', 'results')):
+            rider_id = _text(_first(rider, 'id', 'rider_id', 'employee_id'))
+            if not rider_id:
+                continue
+            name = rider.get('name') or ' '.join(
+                part for part in (rider.get('first_name'), rider.get('last_name')) if part
+            ) or None
+            riders.append((
+                rider_id, name, _text(rider.get('email')),
+                _text(rider.get('phone') or rider.get('phone_number')), _text(rider.get('status')),
+                _number(rider.get('cash_amount')), _number(rider.get('battery_level')),
+                _number(rider.get('late_duration_minutes')), _text(rider.get('vehicle_type') or rider.get('vehicle')),
+                _text(rider.get('city_id')) or city, _text(rider.get('company_id') or rider.get('company')),
+                _iso(rider.get('created_at')), now
+            ))
+
+            embedded = rider.get('shifts') or ([rider['shift']] if isinstance(rider.get('shift'), dict) else [])
+            for shift in embedded:
+                if isinstance(shift, dict) and shift.get('id') is not None:
+                    shifts.append((
+                        _text(shift['id']), rider_id, _iso(shift.get('start_time') or shift.get('start')),
+                        _iso(shift.get('end_time') or shift.get('end')), _text(shift.get('status')),
+                        _iso(shift.get('planned_start')), _iso(shift.get('actual_start'))
+                    ))
+            for delivery in rider.get('deliveries') or []:
+                if isinstance(delivery, dict) and delivery.get('id') is not None:
+                    deliveries.append((
+                        _text(delivery['id']), rider_id, _text(delivery.get('order_id')),
+                        _iso(delivery.get('pickup_time')), _iso(delivery.get('delivery_time')),
+                        _text(delivery.get('status')), _number(delivery.get('distance_km'))
+                    ))
+
+        for company in _items(company_data, ('companies', 'items', 'data', 'results')):
+            company_id = _text(_first(company, 'id', 'company_id'))
+            if not company_id:
+                continue
+            companies.append((
+                company_id, _text(company.get('name')), _text(company.get('city_id')) or city,
+                _number(company.get('active_riders_count')), _number(company.get('total_deliveries_today')), now
+            ))
+
+        counts = {'riders': len(riders), 'shifts': len(shifts), 'deliveries': len(deliveries),
+                  'companies': len(companies)}
+        if not any(counts.values()):
+            return counts
+
+        # An identical snapshot would only bump the data version and drop cached results
+        fingerprint = hashlib.sha256(repr((
+            [row[:-1] for row in riders], shifts, deliveries, [row[:-1] for row in companies]
+        )).encode()).hexdigest()
+        state_name = f"snapshot:{organization_id}:{city or ''}"
+
+        with self._write_lock:
+            connection = self._writer()
+            previous = connection.execute("SELECT value FROM sync_state WHERE name = ?", (state_name,)).fetchone()
+            if previous and previous[0] == fingerprint:
+                return counts
+            with connection:
+                self._upsert(connection, 'riders', organization_id, riders)
+                self._upsert(connection, 'shifts', organization_id, shifts)
+                self._upsert(connection, 'deliveries', organization_id, deliveries)
+                self._upsert(connection, 'companies', organization_id, companies)
+                self._bump_versions(connection, [organization_id])
+                connection.execute(
+                    "INSERT INTO sync_state (name, value) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                    (state_name, fingerprint)
+                )
+        return counts
+
+    def sync_alerts(self) -> int:
+        """Copy alerts created, acknowledged or resolved since the last sync; returns rows written"""
+        from src.models.support import Alert
+
+        started = datetime.utcnow()
+        with self._write_lock:
+            row = self._writer().execute("SELECT value FROM sync_state WHERE name = 'alerts'").fetchone()
+        since = datetime.fromisoformat(row[0]) - _ALERT_SYNC_OVERLAP if row else None
+
+        query = Alert.query.with_entities(
+            Alert.id, Alert.organization_id, Alert.rider_id, Alert.alert_type, Alert.severity,
+            Alert.status, Alert.city_id, Alert.created_at, Alert.resolved_at
+        )
+        if since is not None:
+            query = query.filter(
+                (Alert.created_at >= since) | (Alert.acknowledged_at >= since) | (Alert.resolved_at >= since)
+            )
+
+        written = 0
+        last_id = None
+        while True:
+            page = query.filter(Alert.id > last_id) if last_id is not None else query
+            rows = page.order_by(Alert.id).limit(_ALERT_SYNC_BATCH_SIZE).all()
+            if not rows:
+                break
+            by_organization: Dict[str, List[Tuple]] = {}
+            for alert in rows:
+                by_organization.setdefault(alert.organization_id, []).append((
+                    alert.id, alert.rider_id, alert.alert_type, alert.severity, alert.status,
+                    alert.city_id, _iso(alert.created_at), _iso(alert.resolved_at)
+                ))
+            with self._write_lock:
+                connection = self._writer()
+                with connection:
+                    for organization_id, alert_rows in by_organization.items():
+                        self._upsert(connection, 'alerts', organization_id, alert_rows)
+                    self._bump_versions(connection, by_organization)
+            written += len(rows)
+            last_id = rows[-1].id
+
+        with self._write_lock:
+            connection = self._writer()
+            with connection:
+                connection.execute(
+                    "INSERT INTO sync_state (name, value) VALUES ('alerts', ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                    (started.isoformat(),)
+                )
+        return written
+
+    def data_version(self, organization_id: str) -> int:
+        with self._write_lock:
+            row = self._writer().execute(
+                "SELECT version FROM data_versions WHERE organization_id = ?", (organization_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    # -- queries --
+
+    def stream(self, organization_id: str, sql: str, max_rows: int = ANALYTICS_MAX_ROWS) -> Iterator[Tuple[str, object]]:
+        """
+        Run a generated query, yielding ('columns', [...]), then ('rows', [...]) batches and
+        finally ('done', {'row_count', 'truncated', 'cached', 'data_version'})
+
+        Raises:
+            AnalyticsQueryError: The SQL is not a single SELECT, touches anything
+                but the analytics tables, or exceeds the time limit
+        """
+        sql = prepare_sql(sql)
+        max_rows = max(1, min(int(max_rows), ANALYTICS_MAX_ROWS))
+        version = self.data_version(organization_id)
+        key = (organization_id, normalize_sql(sql), version, max_rows)
+
+        cached = self._results.get(key)
+        if cached is not MISSING:
+            columns, rows, truncated = cached
+            yield 'columns', columns
+            for offset in range(0, len(rows), STREAM_BATCH_SIZE):
+                yield 'rows', rows[offset:offset + STREAM_BATCH_SIZE]
+            yield 'done', {'row_count': len(rows), 'truncated': truncated, 'cached': True, 'data_version': version}
+            return
+
+        connection = self._reader(organization_id)
+        try:
+            try:
+                cursor = connection.execute(sql)
+            except sqlite3.DatabaseError as e:
+                raise AnalyticsQueryError(str(e))
+            columns = [description[0] for description in cursor.description or ()]
+            yield 'columns', columns
+
+            rows, truncated = [], False
+            while True:
+                try:
+                    batch = cursor.fetchmany(min(STREAM_BATCH_SIZE, max_rows + 1 - len(rows)))
+                except sqlite3.DatabaseError as e:
+                    raise AnalyticsQueryError(str(e))
+                if not batch:
+                    break
+                if len(rows) + len(batch) > max_rows:
+                    batch = batch[:max_rows - len(rows)]
+                    truncated = True
+                batch = [list(row) for row in batch]
+                rows.extend(batch)
+                if batch:
+                    yield 'rows', batch
+                if truncated:
+                    break
+        finally:
+            connection.close()
+
+        self._results.set(key, (columns, rows, truncated))
+        yield 'done', {'row_count': len(rows), 'truncated': truncated, 'cached': False, 'data_version': version}
+
+    def execute(self, organization_id: str, sql: str, max_rows: int = ANALYTICS_MAX_ROWS) -> Dict:
+        """Run a generated query and collect the whole (row-limited) result"""
+        result = {'columns': [], 'rows': []}
+        for kind, payload in self.stream(organization_id, sql, max_rows):
+            if kind == 'columns':
+                result['columns'] = payload
+            elif kind == 'rows':
+                result['rows'].extend(payload)
+            else:
+                result.update(payload)
+        return result
+
+
+# Shared per-process instance
+analytics_store = AnalyticsStore()
@@ -0,0 +1,93 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict
+from sqlalchemy import bindparam, or_
+from src.models.user import db
+from src.models.organization import APIKey
+
+logger = logging.getLogger(__name__)
+
+LAST_USED_FLUSH_INTERVAL = int(os.environ.get('API_KEY_LAST_USED_FLUSH_INTERVAL', 60))
+
+
+class LastUsedBuffer:
+    """
+    Write-behind buffer for APIKey.last_used.
+
+    Timestamps are coarsened to the minute and kept in memory; a key used a
+    thousand times in a minute costs one buffered entry. Pending values are
+    written in a single executemany UPDATE on its own connection, so flushing
+    never commits the request's session.
+    """
+
+    def __init__(self, flush_interval: int = LAST_USED_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def touch(self, api_key_id: str, used_at: datetime = None):
+        """Record a use of the key and flush if the interval has elapsed"""
+        minute = (used_at or datetime.utcnow()).replace(second=0, microsecond=0)
+        with self._lock:
+            current = self._pending.get(api_key_id)
+            if current is None or current < minute:
+                self._pending[api_key_id] = minute
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all pending timestamps in one bulk UPDATE; returns the number of keys"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        table = APIKey.__table__
+        statement = table.update().where(
+            table.c.id == bindparam('key_id')
+        ).where(
+            or_(table.c.last_used.is_(None), table.c.last_used < bindparam('used_at'))
+        ).values(last_used=bindparam('used_at'))
+
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(statement, [
+                    {'key_id': key_id, 'used_at': used_at} for key_id, used_at in pending.items()
+                ])
+        except Exception as e:
+            logger.warning(f"Could not flush API key usage for {len(pending)} keys: {str(e)}")
+            with self._lock:
+                for key_id, used_at in pending.items():
+                    current = self._pending.get(key_id)
+                    if current is None or current < used_at:
+                        self._pending[key_id] = used_at
+            return 0
+
+        return len(pending)
+
+
+api_key_usage = LastUsedBuffer()
+
+
+def _flush_at_exit():
+    if not api_key_usage._pending:
+        return
+    try:
+        from src.main import app
+
+        with app.app_context():
+            api_key_usage.flush()
+    except Exception as e:
+        logger.warning(f"API key usage not flushed at exit: {str(e)}")
+
+
+atexit.register(_flush_at_exit)
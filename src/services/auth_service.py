@@ -1,11 +1,34 @@
+import os
 import jwt
 import hashlib
 import secrets
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
 from src.models.user import User, db
 from src.models.organization import Organization, APIKey
+from src.services.cache import TTLCache, MISSING
+from src.services.api_key_usage import api_key_usage
+from src.services.rate_limiter import rate_limiter
+
+# Short TTL so deactivation in another worker still takes effect quickly
+PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
+
+_principal_cache = TTLCache(PRINCIPAL_CACHE_TTL, max_entries=10000)
+
+# API keys: revocation in this process is immediate (events), other workers see it within the TTL
+API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', 60))
+_API_KEY_NEGATIVE_TTL = 5
+
+_api_key_cache = TTLCache(API_KEY_CACHE_TTL, max_entries=10000)
+_listeners_registered = False
+
+# Event streams: EventSource cannot send an Authorization header, so it authenticates
+# with a short-lived token that is only valid for streams (query parameter or cookie)
+STREAM_TOKEN_TTL = int(os.environ.get('STREAM_TOKEN_TTL', 900))
+STREAM_TOKEN_COOKIE = 'alert_stream_token'
 
 class AuthService:
     @staticmethod
@@ -34,6 +57,17 @@ class AuthService:
             'token_type': 'Bearer'
         }
     
+    @staticmethod
+    def generate_stream_token(user):
+        """Short-lived token accepted only by stream_token_required routes"""
+        payload = {
+            'user_id': user.id,
+            'organization_id': user.organization_id,
+            'type': 'stream',
+            'exp': datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_TTL)
+        }
+        return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+    
     @staticmethod
     def verify_token(token):
         """Verify and decode a JWT token"""
@@ -58,16 +92,95 @@ class AuthService:
     @staticmethod
     def verify_api_key(api_key):
         """Verify an API key and return the associated organization"""
+        api_key_obj = AuthService.lookup_api_key(api_key)
+        return api_key_obj.organization if api_key_obj else None
+    
+    @staticmethod
+    def lookup_api_key(api_key):
+        """
+        Resolve an active, unexpired API key (with its organization) through the key cache.
+
+        The last_used timestamp is buffered and written in bulk by api_key_usage.
+        """
         key_hash = AuthService.hash_api_key(api_key)
-        api_key_obj = APIKey.query.filter_by(key_hash=key_hash, is_active=True).first()
+        cached = _api_key_cache.get(key_hash)
+        if cached is MISSING:
+            cached = APIKey.query.options(joinedload(APIKey.organization)).filter_by(
+                key_hash=key_hash, is_active=True
+            ).first()
+            if cached is None:
+                _api_key_cache.set(key_hash, None, _API_KEY_NEGATIVE_TTL)
+                return None
+            organization = cached.organization
+            db.session.expunge(cached)
+            if organization is not None:
+                db.session.expunge(organization)
+            _api_key_cache.set(key_hash, cached)
         
-        if api_key_obj and (not api_key_obj.expires_at or api_key_obj.expires_at > datetime.utcnow()):
-            # Update last used timestamp
-            api_key_obj.last_used = datetime.utcnow()
-            db.session.commit()
-            return api_key_obj.organization
+        if cached is None:
+            return None
+        if cached.expires_at and cached.expires_at <= datetime.utcnow():
+            return None
         
-        return None
+        api_key_usage.touch(cached.id)
+        return db.session.merge(cached, load=False)
+
+def load_principal(user_id):
+    """
+    Return the user (with its organization) for an authenticated request.
+
+    Users are cached detached and fully loaded; each request gets its own
+    session copy through merge(load=False), which issues no SELECT.
+    """
+    cached = _principal_cache.get(user_id)
+    if cached is MISSING:
+        user = User.query.options(joinedload(User.organization)).get(user_id)
+        if user is None:
+            return None
+        organization = user.organization
+        db.session.expunge(user)
+        if organization is not None:
+            db.session.expunge(organization)
+        _principal_cache.set(user_id, user)
+        cached = user
+    return db.session.merge(cached, load=False)
+
+def invalidate_api_key(key_hash=None):
+    """Drop a cached API key (or all of them) after revocation or changes"""
+    if key_hash is None:
+        _api_key_cache.clear()
+    else:
+        _api_key_cache.delete(key_hash)
+
+def _on_api_key_change(mapper, connection, target):
+    invalidate_api_key(target.key_hash)
+
+def invalidate_principal(user_id=None):
+    """Drop a cached principal (or all of them) after profile, password or status changes"""
+    if user_id is None:
+        _principal_cache.clear()
+    else:
+        _principal_cache.delete(user_id)
+
+def _on_user_change(mapper, connection, target):
+    invalidate_principal(target.id)
+
+def _on_organization_change(mapper, connection, target):
+    invalidate_principal()
+    invalidate_api_key()
+
+def register_principal_cache_listeners():
+    """Invalidate cached principals and API keys whenever their rows change"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    event.listen(User, 'after_update', _on_user_change)
+    event.listen(User, 'after_delete', _on_user_change)
+    event.listen(Organization, 'after_update', _on_organization_change)
+    event.listen(Organization, 'after_delete', _on_organization_change)
+    event.listen(APIKey, 'after_update', _on_api_key_change)
+    event.listen(APIKey, 'after_delete', _on_api_key_change)
+    _listeners_registered = True
 
 def token_required(f):
     """Decorator to require valid JWT token"""
@@ -86,11 +199,38 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         
         payload = AuthService.verify_token(token)
-        if not payload:
+        if not payload or payload.get('type') == 'stream':
+            return jsonify({'error': 'Token is invalid or expired'}), 401
+        
+        # Get user from the principal cache (database on a miss)
+        current_user = load_principal(payload['user_id'])
+        if not current_user or not current_user.is_active:
+            return jsonify({'error': 'User not found or inactive'}), 401
+        
+        return f(current_user, *args, **kwargs)
+    
+    return decorated
+
+def stream_token_required(f):
+    """
+    Like token_required, but also accepts a stream token from the stream_token
+    query parameter or the stream cookie (for browser EventSource clients)
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            return token_required(f)(*args, **kwargs)
+        
+        token = request.args.get('stream_token') or request.cookies.get(STREAM_TOKEN_COOKIE)
+        if not token:
+            return jsonify({'error': 'Token is missing'}), 401
+        
+        payload = AuthService.verify_token(token)
+        if not payload or payload.get('type') != 'stream':
             return jsonify({'error': 'Token is invalid or expired'}), 401
         
-        # Get user from database
-        current_user = User.query.get(payload['user_id'])
+        current_user = load_principal(payload['user_id'])
         if not current_user or not current_user.is_active:
             return jsonify({'error': 'User not found or inactive'}), 401
         
@@ -99,7 +239,7 @@ def token_required(f):
     return decorated
 
 def api_key_required(f):
-    """Decorator to require valid API key"""
+    """Decorator to require valid API key (rate limited per organization and key)"""
     @wraps(f)
     def decorated(*args, **kwargs):
         api_key = request.headers.get('X-API-Key')
@@ -107,11 +247,23 @@ def api_key_required(f):
         if not api_key:
             return jsonify({'error': 'API key is missing'}), 401
         
-        organization = AuthService.verify_api_key(api_key)
+        api_key_obj = AuthService.lookup_api_key(api_key)
+        organization = api_key_obj.organization if api_key_obj else None
         if not organization:
             return jsonify({'error': 'Invalid API key'}), 401
         
-        return f(organization, *args, **kwargs)
+        decision = rate_limiter.check(organization, api_key_obj, endpoint=request.endpoint or request.path)
+        if not decision.allowed:
+            response = make_response(jsonify({
+                'error': 'Rate limit exceeded' if decision.scope != 'quota' else 'API quota exceeded',
+                'scope': decision.scope,
+                'retry_after': decision.reset
+            }), 429)
+        else:
+            response = make_response(f(organization, *args, **kwargs))
+        
+        response.headers.update(decision.headers())
+        return response
     
     return decorated
 
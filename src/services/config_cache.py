@@ -0,0 +1,214 @@
+import os
+import copy
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from src.services.redis_client import get_redis, get_redis_url, reset_redis
+
+logger = logging.getLogger(__name__)
+
+# Red de seguridad por si se pierde un mensaje de invalidación (p. ej. Redis caído)
+CONFIG_CACHE_TTL = int(os.environ.get('CONFIG_CACHE_TTL', 300))
+
+_VERSION_KEY = 'api_config_version:{organization_id}'
+_CHANNEL = 'api_config_invalidation'
+_ALL = '*'
+_PENDING_KEY = 'api_config_changed_orgs'
+
+
+class CachedConfiguration(NamedTuple):
+    """Read-only snapshot of an active APIConfiguration row"""
+    id: str
+    organization_id: str
+    api_type: str
+    credentials: Dict
+    settings: Optional[Dict]
+    is_active: bool
+
+
+class _OrgEntry(NamedTuple):
+    version: int
+    loaded_at: float
+    by_type: Dict[str, List[CachedConfiguration]]
+
+
+class ConfigurationCache:
+    """
+    In-process cache of every active APIConfiguration of an organization,
+    grouped by api_type and stamped with the organization's config version.
+
+    Each committed write to api_configurations bumps the version in Redis and
+    publishes it; every worker's subscriber thread drops entries older than
+    the published version. Writes in this process are dropped immediately.
+    """
+
+    def __init__(self, ttl_seconds: int = CONFIG_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, _OrgEntry] = {}
+        self._local_versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._subscriber = None
+        self._subscriber_pid = None
+
+    def get(self, organization_id: str, api_type: str) -> Optional[CachedConfiguration]:
+        """First active configuration of a type for the organization, or None"""
+        configs = self.get_all(organization_id, api_type)
+        return configs[0] if configs else None
+
+    def get_all(self, organization_id: str, api_type: str) -> List[CachedConfiguration]:
+        """
+        All active configurations of a type for the organization
+
+        Credentials and settings are copies: callers may modify them without
+        touching the cached snapshot shared by every request of the worker.
+        """
+        self._ensure_subscriber()
+        with self._lock:
+            entry = self._entries.get(organization_id)
+        if entry is None or time.monotonic() - entry.loaded_at > self.ttl_seconds:
+            entry = self._load(organization_id)
+        return [
+            config._replace(credentials=copy.deepcopy(config.credentials), settings=copy.deepcopy(config.settings))
+            for config in entry.by_type.get(api_type, [])
+        ]
+
+    def _load(self, organization_id: str) -> _OrgEntry:
+        from src.models.organization import APIConfiguration
+
+        # La versión se lee antes que las filas: si una escritura se cuela
+        # entre ambas lecturas, su mensaje invalidará esta entrada
+        version = self._current_version(organization_id)
+        by_type: Dict[str, List[CachedConfiguration]] = {}
+        for config in APIConfiguration.query.filter_by(organization_id=organization_id, is_active=True).all():
+            by_type.setdefault(config.api_type, []).append(CachedConfiguration(
+                id=config.id,
+                organization_id=config.organization_id,
+                api_type=config.api_type,
+                credentials=config.credentials,
+                settings=config.settings,
+                is_active=config.is_active
+            ))
+
+        entry = _OrgEntry(version, time.monotonic(), by_type)
+        with self._lock:
+            self._entries[organization_id] = entry
+        return entry
+
+    def _current_version(self, organization_id: str) -> int:
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                return int(redis_client.get(_VERSION_KEY.format(organization_id=organization_id)) or 0)
+            except Exception:
+                reset_redis()
+        with self._lock:
+            return self._local_versions.get(organization_id, 0)
+
+    def bump_version(self, organization_id: str):
+        """Mark the organization's configuration as changed in every worker"""
+        self.invalidate_local(organization_id)
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                version = redis_client.incr(_VERSION_KEY.format(organization_id=organization_id))
+                redis_client.publish(_CHANNEL, json.dumps({'organization_id': organization_id, 'version': version}))
+                return
+            except Exception as e:
+                logger.warning(f"Could not publish config invalidation for {organization_id}: {str(e)}")
+                reset_redis()
+        with self._lock:
+            self._local_versions[organization_id] = self._local_versions.get(organization_id, 0) + 1
+
+    def invalidate(self):
+        """Drop every cached organization in every worker (e.g. after a key rotation)"""
+        self.invalidate_local()
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                redis_client.publish(_CHANNEL, json.dumps({'organization_id': _ALL}))
+            except Exception:
+                reset_redis()
+
+    def invalidate_local(self, organization_id: Optional[str] = None, older_than: Optional[int] = None):
+        with self._lock:
+            if organization_id is None or organization_id == _ALL:
+                self._entries.clear()
+                return
+            entry = self._entries.get(organization_id)
+            if entry is not None and (older_than is None or entry.version < older_than):
+                del self._entries[organization_id]
+
+    def _ensure_subscriber(self):
+        """Start the invalidation listener once per process (after any fork)"""
+        if self._subscriber_pid == os.getpid() and self._subscriber is not None and self._subscriber.is_alive():
+            return
+        with self._lock:
+            if self._subscriber_pid == os.getpid() and self._subscriber is not None and self._subscriber.is_alive():
+                return
+            if get_redis() is None:
+                return
+            self._subscriber = threading.Thread(
+                target=self._listen, args=(get_redis_url(),), name='config-cache-invalidation', daemon=True
+            )
+            self._subscriber_pid = os.getpid()
+            self._subscriber.start()
+
+    def _listen(self, url: str):
+        import redis
+
+        while True:
+            try:
+                # Cliente propio: el compartido tiene un socket_timeout corto
+                client = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=2)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(_CHANNEL)
+                # Lo publicado mientras no estábamos suscritos se da por perdido
+                self.invalidate_local()
+                for message in pubsub.listen():
+                    try:
+                        data = json.loads(message['data'])
+                    except (TypeError, ValueError):
+                        continue
+                    self.invalidate_local(data.get('organization_id'), data.get('version'))
+            except Exception as e:
+                logger.warning(f"Config invalidation listener disconnected: {str(e)}")
+                time.sleep(5)
+
+
+config_cache = ConfigurationCache()
+
+
+def _record_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(target.organization_id)
+
+
+def _after_commit(session):
+    for organization_id in session.info.pop(_PENDING_KEY, ()):
+        config_cache.bump_version(organization_id)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+_listeners_registered = False
+
+
+def register_config_cache_listeners():
+    """Bump the organization's config version after every committed APIConfiguration write"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    from src.models.organization import APIConfiguration
+
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(APIConfiguration, event_name, _record_change)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
@@ -1,34 +1,140 @@
 import os
 import base64
 import json
-from cryptography.fernet import Fernet
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from sqlalchemy import bindparam, event
+from src.services.cache import TTLCache, MISSING
+
+DEFAULT_SALT = b'loginexia_salt_2024'  # In production, use random salt per organization
+KDF_ITERATIONS = 100000
+
+# Decrypted credentials are kept briefly so proxied calls skip the Fernet round trip
+CREDENTIALS_CACHE_TTL = int(os.environ.get('CREDENTIALS_CACHE_TTL', 300))
+
+ROTATION_BATCH_SIZE = 500
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROTATION_CHECKPOINT_PATH = os.environ.get(
+    'KEY_ROTATION_CHECKPOINT', os.path.join(BASE_DIR, 'data', 'key_rotation.checkpoint')
+)
+
+logger = logging.getLogger(__name__)
+
+_cipher_cache = {}
+_cipher_lock = threading.Lock()
+_credentials_cache = TTLCache(CREDENTIALS_CACHE_TTL, max_entries=5000)
+_listeners_registered = False
+
+
+@lru_cache(maxsize=64)
+def _derive_key(password: bytes, salt: bytes) -> bytes:
+    """PBKDF2 is deliberately slow, so each (password, salt) pair is derived once per process"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=KDF_ITERATIONS,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(password))
+
+
+def _configured_keys(salt: bytes):
+    """
+    Keys from the environment, primary first.
+
+    ENCRYPTION_KEYS holds a comma-separated list for rotation (new key first,
+    old keys after it so existing ciphertext still decrypts); ENCRYPTION_KEY
+    is the single-key form; without either a key is derived from ENCRYPTION_PASSWORD.
+    """
+    keys_env = os.environ.get('ENCRYPTION_KEYS')
+    if keys_env:
+        return tuple(key.strip().encode() for key in keys_env.split(',') if key.strip())
+
+    key_env = os.environ.get('ENCRYPTION_KEY')
+    if key_env:
+        return (key_env.encode(),)
+
+    password = os.environ.get('ENCRYPTION_PASSWORD', 'default_dev_password').encode()
+    return (_derive_key(password, salt),)
+
+
+def get_cipher(keys):
+    """Shared Fernet (one key) or MultiFernet (several keys) for a key tuple"""
+    keys = tuple(keys)
+    cipher = _cipher_cache.get(keys)
+    if cipher is None:
+        with _cipher_lock:
+            cipher = _cipher_cache.get(keys)
+            if cipher is None:
+                fernets = [Fernet(key) for key in keys]
+                cipher = fernets[0] if len(fernets) == 1 else MultiFernet(fernets)
+                _cipher_cache[keys] = cipher
+    return cipher
+
+
+def invalidate_credentials_cache(config_id=None):
+    """Drop cached plaintext for one APIConfiguration, or for all of them"""
+    if config_id is None:
+        _credentials_cache.clear()
+    else:
+        _credentials_cache.delete_where(lambda key: key[0] == config_id)
+
+
+def _on_configuration_change(mapper, connection, target):
+    invalidate_credentials_cache(target.id)
+
+
+def register_credentials_cache_listeners():
+    """Invalidate decrypted credentials whenever an APIConfiguration is updated or deleted"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    from src.models.organization import APIConfiguration
+
+    event.listen(APIConfiguration, 'after_update', _on_configuration_change)
+    event.listen(APIConfiguration, 'after_delete', _on_configuration_change)
+    _listeners_registered = True
+
 
 class EncryptionService:
-    def __init__(self):
-        self.key = self._get_encryption_key()
-        self.cipher = Fernet(self.key)
+    def __init__(self, salt: bytes = DEFAULT_SALT):
+        self.salt = salt
+        self.keys = self._get_encryption_keys()
+        self.key = self.keys[0]
+        self.cipher = get_cipher(self.keys)
     
-    def _get_encryption_key(self):
-        """Get or generate encryption key"""
+    def _get_encryption_keys(self):
+        """Get the configured keys (derived keys are cached per process and salt)"""
         # In production, this should be stored securely (e.g., environment variable, key management service)
-        key_env = os.environ.get('ENCRYPTION_KEY')
-        if key_env:
-            return key_env.encode()
-        
-        # Generate key from a password (for development)
-        password = os.environ.get('ENCRYPTION_PASSWORD', 'default_dev_password').encode()
-        salt = b'loginexia_salt_2024'  # In production, use random salt per organization
-        
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(password))
-        return key
+        return _configured_keys(self.salt)
+    
+    def _get_encryption_key(self):
+        """Get the primary encryption key"""
+        return self._get_encryption_keys()[0]
+    
+    def decrypt_config_credentials(self, config):
+        """
+        Decrypt an APIConfiguration's credentials through the short-lived plaintext cache.
+
+        The cache key includes a digest of the ciphertext, so a row rewritten by
+        another worker never serves stale credentials here.
+        """
+        encrypted = config.credentials
+        if not isinstance(encrypted, str):
+            return self.decrypt_credentials(encrypted)
+
+        cache_key = (config.id, hashlib.sha256(encrypted.encode()).hexdigest())
+        credentials = _credentials_cache.get(cache_key)
+        if credentials is MISSING:
+            credentials = self.decrypt_credentials(encrypted)
+            _credentials_cache.set(cache_key, credentials)
+        return dict(credentials)
     
     def encrypt_credentials(self, credentials_dict):
         """Encrypt credentials dictionary"""
@@ -59,9 +165,141 @@ class EncryptionService:
         except Exception as e:
             raise ValueError(f"Failed to decrypt string: {str(e)}")
     
-    def rotate_key(self, old_key, new_key):
-        """Rotate encryption key (for key rotation scenarios)"""
-        # This would be used to re-encrypt all credentials with a new key
-        # Implementation would depend on specific requirements
+    def rotate_key(self, old_key, new_key, batch_size=ROTATION_BATCH_SIZE, workers=None,
+                   checkpoint_path=ROTATION_CHECKPOINT_PATH):
+        """
+        Re-encrypt every stored APIConfiguration credential from old_key to new_key.
+
+        Rows are streamed in id order in fixed-size batches (only id and
+        credentials are selected), re-encrypted on a process pool with
+        MultiFernet.rotate and written back with one bulk UPDATE per batch.
+        The last committed id is checkpointed, so an interrupted run resumes
+        where it stopped; rotating an already-rotated token is a no-op, so
+        replaying a batch is safe.
+
+        Run with ENCRYPTION_KEYS="<new_key>,<old_key>" so readers accept both
+        keys while rows are being rewritten, then drop the old key.
+        """
+        from src.models.user import db
+        from src.models.organization import APIConfiguration
+
+        old_key = old_key.encode() if isinstance(old_key, str) else old_key
+        new_key = new_key.encode() if isinstance(new_key, str) else new_key
+        fingerprint = hashlib.sha256(new_key).hexdigest()[:16]
+        last_id = _read_checkpoint(checkpoint_path, fingerprint)
+
+        table = APIConfiguration.__table__
+        update = table.update().where(table.c.id == bindparam('config_id')).values(
+            credentials=bindparam('new_credentials')
+        )
+        stats = {'rotated': 0, 'skipped': 0, 'failed': 0, 'batches': 0, 'resumed_from': last_id}
+
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                query = db.session.query(APIConfiguration.id, APIConfiguration.credentials)
+                if last_id is not None:
+                    query = query.filter(APIConfiguration.id > last_id)
+                rows = query.order_by(APIConfiguration.id).limit(batch_size).all()
+                if not rows:
+                    break
+
+                encrypted = [(config_id, credentials) for config_id, credentials in rows
+                             if isinstance(credentials, str)]
+                stats['skipped'] += len(rows) - len(encrypted)
+
+                # Split the batch so every CPU gets a slice of the crypto work
+                slice_size = max(1, -(-len(encrypted) // workers))
+                slices = [encrypted[i:i + slice_size] for i in range(0, len(encrypted), slice_size)]
+                results = [
+                    item for chunk in executor.map(_rotate_tokens, [(old_key, new_key, part) for part in slices])
+                    for item in chunk
+                ]
+
+                updates = [{'config_id': config_id, 'new_credentials': token}
+                           for config_id, token in results if token is not None]
+                stats['failed'] += len(results) - len(updates)
+                for config_id, token in results:
+                    if token is None:
+                        logger.error(f"Could not rotate credentials for API configuration {config_id}")
+
+                try:
+                    if updates:
+                        db.session.execute(update, updates)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+                last_id = rows[-1][0]
+                _write_checkpoint(checkpoint_path, fingerprint, last_id)
+                stats['rotated'] += len(updates)
+                stats['batches'] += 1
+
+        _clear_checkpoint(checkpoint_path)
+        invalidate_credentials_cache()
+        # Las filas se reescribieron sin pasar por el ORM: avisar a todos los workers
+        from src.services.config_cache import config_cache
+        config_cache.invalidate()
+        logger.info(f"Key rotation finished: {stats}")
+        return stats
+
+
+def _rotate_tokens(args):
+    """Process-pool worker: rotate a slice of (id, ciphertext) pairs to the new key"""
+    old_key, new_key, rows = args
+    cipher = MultiFernet([Fernet(new_key), Fernet(old_key)])
+    rotated = []
+    for config_id, encrypted in rows:
+        try:
+            token = cipher.rotate(base64.urlsafe_b64decode(encrypted.encode()))
+            rotated.append((config_id, base64.urlsafe_b64encode(token).decode()))
+        except Exception:
+            rotated.append((config_id, None))
+    return rotated
+
+
+def _read_checkpoint(path, fingerprint):
+    try:
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint.get('fingerprint') == fingerprint:
+            return checkpoint.get('last_id')
+    except (OSError, ValueError):
         pass
+    return None
+
+
+def _write_checkpoint(path, fingerprint, last_id):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as checkpoint_file:
+        json.dump({'fingerprint': fingerprint, 'last_id': last_id}, checkpoint_file)
+    os.replace(tmp_path, path)
+
+
+def _clear_checkpoint(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+if __name__ == '__main__':
+    import argparse
+    from src.main import app
+
+    parser = argparse.ArgumentParser(description='Re-encrypt stored API credentials with a new key')
+    parser.add_argument('--old-key', default=os.environ.get('OLD_ENCRYPTION_KEY'))
+    parser.add_argument('--new-key', default=os.environ.get('NEW_ENCRYPTION_KEY'))
+    parser.add_argument('--batch-size', type=int, default=ROTATION_BATCH_SIZE)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--checkpoint', default=ROTATION_CHECKPOINT_PATH)
+    args = parser.parse_args()
+    if not args.old_key or not args.new_key:
+        parser.error('--old-key and --new-key (or OLD_ENCRYPTION_KEY / NEW_ENCRYPTION_KEY) are required')
 
+    with app.app_context():
+        print(EncryptionService().rotate_key(
+            args.old_key, args.new_key, args.batch_size, args.workers, args.checkpoint
+        ))
@@ -0,0 +1,229 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import logging
+import requests
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import and_, exists, inspect, or_
+from sqlalchemy.orm import aliased
+from src.models.user import db
+from src.models.support import Alert, AlertOutbox
+from src.services.config_cache import config_cache
+from src.services.alert_automation import DELIVERY_FAILED, OUTBOX_ALERT_RAISED
+from src.services.alert_digest import AlertDigestService
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_TIMEOUT_SECONDS = 5
+# Un lote reclamado y sin resultado en este tiempo (relay caído) vuelve a entregarse
+CLAIM_TIMEOUT_SECONDS = int(os.environ.get('OUTBOX_CLAIM_TIMEOUT', 300))
+
+
+class OutboxDeliveryError(Exception):
+    """Error transitorio: el evento se reintentará más tarde"""
+
+
+_OPEN_STATUSES = ('pending', 'processing')
+
+
+def _earlier_open_in_partition():
+    """
+    EXISTS de un evento anterior sin terminar (pendiente o en entrega) del mismo
+    repartidor, o de la misma alerta si no hay repartidor: mantiene el orden por
+    clave de partición sin que el siguiente evento ocupe sitio en el lote.
+    """
+    earlier = aliased(AlertOutbox)
+    same_partition = or_(
+        and_(AlertOutbox.rider_id.isnot(None), earlier.rider_id == AlertOutbox.rider_id),
+        and_(AlertOutbox.rider_id.is_(None), earlier.rider_id.is_(None), earlier.alert_id == AlertOutbox.alert_id)
+    )
+    return exists().where(earlier.status.in_(_OPEN_STATUSES), earlier.id < AlertOutbox.id, same_partition)
+
+
+def _snapshot(instance):
+    """Copia transitoria con los valores de columna ya cargados (no toca la sesión al leerla)"""
+    copy = type(instance)()
+    for attribute in inspect(type(instance)).column_attrs:
+        setattr(copy, attribute.key, getattr(instance, attribute.key))
+    return copy
+
+
+class OutboxRelay:
+    """
+    Drena la tabla alert_outbox en lotes y entrega cada evento a los emisores de
+    notificaciones (WhatsApp, a través de AlertDigestService) y a los webhooks
+    configurados por la organización.
+
+    Cada lote se reclama (status 'processing' con un plazo de reclamación) y se
+    confirma antes de entregar, así que las llamadas HTTP no retienen bloqueos
+    ni transacciones; el resultado de cada evento se confirma después. Un lote
+    cuyo relay muere se vuelve a reclamar al vencer el plazo.
+
+    La entrega es at-least-once y ordenada por repartidor: mientras un evento
+    de un repartidor siga sin terminar (en entrega, fallido o esperando su
+    backoff), los eventos posteriores del mismo repartidor no se seleccionan.
+    """
+
+    def __init__(self, batch_size: int = 100, max_attempts: int = 8, base_backoff_seconds: int = 5,
+                 claim_timeout_seconds: int = CLAIM_TIMEOUT_SECONDS):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.claim_timeout_seconds = claim_timeout_seconds
+        self.handlers = {
+            OUTBOX_ALERT_RAISED: [self._deliver_whatsapp, self._deliver_webhooks],
+        }
+
+    def drain_once(self) -> Dict[str, int]:
+        """
+        Reclama un lote de eventos, los entrega fuera de la transacción y registra cada resultado
+
+        Solo se seleccionan eventos cuyo reintento (o plazo de reclamación) ya
+        vence y que son el primero sin terminar de su repartidor: los eventos
+        en espera de backoff no ocupan el lote ni bloquean a los de otros repartidores.
+
+        Returns:
+            Dict con estadísticas del lote
+        """
+        stats = {'processed': 0, 'delivered': 0, 'retried': 0, 'failed': 0}
+        for event_id in self._claim():
+            stats['processed'] += 1
+            stats[self._process(event_id)] += 1
+        return stats
+
+    def _claim(self) -> List[int]:
+        """Marca el lote como 'processing' y confirma, liberando los bloqueos de fila"""
+        now = datetime.utcnow()
+        try:
+            events = (
+                AlertOutbox.query
+                .filter(
+                    AlertOutbox.status.in_(_OPEN_STATUSES),
+                    or_(AlertOutbox.next_attempt_at.is_(None), AlertOutbox.next_attempt_at <= now),
+                    ~_earlier_open_in_partition()
+                )
+                .order_by(AlertOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for event in events:
+                if event.status == 'processing':
+                    logger.warning(f"Outbox event {event.id} claim expired, reclaiming")
+                event.status = 'processing'
+                event.attempts = (event.attempts or 0) + 1
+                event.next_attempt_at = now + timedelta(seconds=self.claim_timeout_seconds)
+            event_ids = [event.id for event in events]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return event_ids
+
+    def _process(self, event_id: int) -> str:
+        """Entrega un evento reclamado y confirma su resultado; devuelve la clave de estadística"""
+        # Los manejadores reciben copias desligadas de la sesión y la lectura se cierra aquí
+        event = _snapshot(db.session.get(AlertOutbox, event_id))
+        alert = db.session.get(Alert, event.alert_id)
+        alert = _snapshot(alert) if alert is not None else None
+        db.session.commit()
+
+        error = None
+        try:
+            if alert is None:
+                raise ValueError(f"Alert {event.alert_id} not found")
+            for handler in self.handlers.get(event.event_type, []):
+                handler(event, alert)
+        except Exception as e:
+            db.session.rollback()
+            error = e
+
+        now = datetime.utcnow()
+        try:
+            event = db.session.get(AlertOutbox, event_id)
+            if error is None:
+                event.status = 'sent'
+                event.processed_at = now
+                event.last_error = None
+                outcome = 'delivered'
+            elif event.attempts >= self.max_attempts:
+                event.status = 'failed'
+                event.processed_at = now
+                event.last_error = str(error)
+                outcome = 'failed'
+                logger.error(f"Outbox event {event.id} failed permanently: {str(error)}")
+            else:
+                event.status = 'pending'
+                event.last_error = str(error)
+                event.next_attempt_at = now + timedelta(
+                    seconds=self.base_backoff_seconds * (2 ** (event.attempts - 1))
+                )
+                outcome = 'retried'
+                logger.warning(f"Outbox event {event.id} will be retried: {str(error)}")
+
+            if outcome != 'retried':
+                # Evento terminado: si la alerta sigue sin enviar, pasa al barrido de pendientes
+                Alert.query.filter(Alert.id == event.alert_id).update(
+                    {Alert.outbox_pending: False}, synchronize_session=False
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return outcome
+
+    def run_forever(self, interval: float = 2.0):
+        """Bucle del relay: drena lotes mientras se procesen eventos y espera `interval` cuando no hay ninguno listo"""
+        logger.info("Outbox relay started")
+        while True:
+            try:
+                stats = self.drain_once()
+                if stats['processed'] > 0:
+                    continue
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error draining alert outbox: {str(e)}")
+            time.sleep(interval)
+
+    def _deliver_whatsapp(self, event: AlertOutbox, alert: Alert):
+        result = AlertDigestService.dispatch(alert.id)
+        if result == DELIVERY_FAILED:
+            raise OutboxDeliveryError(f"WhatsApp delivery failed for alert {alert.id}")
+
+    def _deliver_webhooks(self, event: AlertOutbox, alert: Alert):
+        webhooks = config_cache.get_all(event.organization_id, 'webhook')
+        db.session.commit()  # La lectura de configuración no debe seguir abierta durante el POST
+
+        body = json.dumps({
+            'event_id': event.id,
+            'event_type': event.event_type,
+            'alert': alert.to_dict()
+        }, default=str)
+
+        for webhook in webhooks:
+            url = webhook.credentials.get('url')
+            if not url:
+                continue
+
+            headers = {'Content-Type': 'application/json'}
+            secret = webhook.credentials.get('secret')
+            if secret:
+                signature = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+                headers['X-Loginexia-Signature'] = f"sha256={signature}"
+
+            try:
+                response = requests.post(url, data=body, headers=headers, timeout=WEBHOOK_TIMEOUT_SECONDS)
+            except requests.RequestException as e:
+                raise OutboxDeliveryError(f"Webhook {url} unreachable: {str(e)}")
+            if response.status_code >= 300:
+                raise OutboxDeliveryError(f"Webhook {url} returned {response.status_code}")
+
+
+if __name__ == '__main__':
+    from src.main import app
+
+    with app.app_context():
+        OutboxRelay().run_forever()
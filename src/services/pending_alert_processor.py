@@ -0,0 +1,177 @@
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+from src.models.user import db
+from src.models.support import Alert
+from src.services.alert_automation import AlertAutomationService
+from src.services.alert_digest import AlertDigestService
+from src.services.rider_directory import rider_directory
+from src.services.whatsapp_service import BULK_MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+PENDING_SEVERITIES = ['critical', 'high']
+
+
+class PendingAlertProcessor:
+    """
+    Envía por lotes las alertas críticas pendientes de WhatsApp.
+
+    Las alertas se recorren por bloques ordenados por ID, la configuración de
+    WhatsApp se resuelve una sola vez por organización, los mensajes de cada
+    bloque salen en paralelo (uno por destinatario) y los cambios de estado del
+    bloque se confirman en una única transacción.
+    """
+
+    def __init__(self, chunk_size: int = 200, max_workers: int = BULK_MAX_WORKERS,
+                 min_age_seconds: int = 0):
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.min_age_seconds = min_age_seconds
+
+    def _pending_query(self, organization_id: Optional[str] = None):
+        query = Alert.query.filter(
+            Alert.whatsapp_sent == False,  # noqa: E712
+            Alert.status == 'active',
+            Alert.severity.in_(PENDING_SEVERITIES),
+            # Las alertas del outbox las envía su relay; se liberan si su evento falla del todo
+            Alert.outbox_pending == False  # noqa: E712
+        )
+        if organization_id:
+            query = query.filter(Alert.organization_id == organization_id)
+        if self.min_age_seconds:
+            # Las alertas recientes las atiende su propia tarea de notificación
+            cutoff = datetime.utcnow() - timedelta(seconds=self.min_age_seconds)
+            query = query.filter(Alert.created_at <= cutoff)
+        return query
+
+    def iter_chunks(self, organization_id: str) -> Iterator[List[Alert]]:
+        """
+        Recorre las alertas pendientes de una organización en bloques de chunk_size
+
+        Se pagina por clave (Alert.id > último ID) en lugar de mantener un cursor
+        abierto, porque cada bloque se confirma antes de pedir el siguiente.
+
+        Args:
+            organization_id: ID de la organización
+
+        Yields:
+            List[Alert]: Bloque de alertas pendientes
+        """
+        last_id = None
+        while True:
+            query = self._pending_query(organization_id)
+            if last_id is not None:
+                query = query.filter(Alert.id > last_id)
+            chunk = query.order_by(Alert.id).limit(self.chunk_size).all()
+            if not chunk:
+                return
+            last_id = chunk[-1].id
+            yield chunk
+
+    def process_organization(self, organization_id: str) -> Dict[str, int]:
+        """
+        Envía todas las alertas pendientes de una organización
+
+        Args:
+            organization_id: ID de la organización
+
+        Returns:
+            Dict con estadísticas del procesamiento
+        """
+        stats = {
+            'total_alerts': 0,
+            'messages': 0,
+            'sent': 0,
+            'failed': 0,
+            'no_phone': 0,
+            'chunks': 0
+        }
+
+        whatsapp_service = AlertAutomationService.get_whatsapp_service(organization_id)
+        if not whatsapp_service:
+            logger.warning(f"No WhatsApp configuration found for organization {organization_id}")
+            stats['no_config'] = True
+            return stats
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk in self.iter_chunks(organization_id):
+                try:
+                    self._process_chunk(chunk, whatsapp_service, executor, stats)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+        logger.info(
+            f"Processed {stats['total_alerts']} pending alerts for organization {organization_id}: "
+            f"{stats['sent']} sent in {stats['messages']} messages, {stats['failed']} failed"
+        )
+        return stats
+
+    def _process_chunk(self, chunk: List[Alert], whatsapp_service, executor, stats: Dict[str, int]):
+        stats['chunks'] += 1
+        stats['total_alerts'] += len(chunk)
+
+        # Una sola consulta al directorio para las alertas sin teléfono propio
+        rider_directory.lookup_phones(
+            chunk[0].organization_id,
+            [alert.rider_id for alert in chunk if alert.rider_id and not alert.rider_phone]
+        )
+        phones = {alert.id: AlertAutomationService._get_rider_phone(alert) for alert in chunk}
+        deliveries = []
+        for group in AlertDigestService.group_by_recipient(chunk, phones=phones):
+            rider_phone = phones.get(group[0].id)
+            if not rider_phone:
+                stats['no_phone'] += len(group)
+                continue
+            # Los hilos solo hacen HTTP: los datos de la alerta se serializan aquí
+            payloads = [alert.to_dict() for alert in group]
+            deliveries.append((group, rider_phone, executor.submit(
+                whatsapp_service.send_alert_digest, rider_phone, payloads
+            )))
+
+        for group, rider_phone, future in deliveries:
+            result = future.result()
+            AlertDigestService.apply_result(group, rider_phone, result)
+            stats['messages'] += 1
+            if result['success']:
+                stats['sent'] += len(group)
+            else:
+                stats['failed'] += len(group)
+
+    def process_all(self) -> Dict[str, Dict[str, int]]:
+        """
+        Envía las alertas pendientes de todas las organizaciones
+
+        Returns:
+            Dict: Estadísticas por ID de organización
+        """
+        organization_ids = [
+            row[0] for row in self._pending_query()
+            .with_entities(Alert.organization_id)
+            .distinct()
+            .all()
+        ]
+
+        results = {}
+        for organization_id in organization_ids:
+            try:
+                results[organization_id] = self.process_organization(organization_id)
+            except Exception as e:
+                logger.error(f"Error processing pending alerts for organization {organization_id}: {str(e)}")
+                results[organization_id] = {'error': str(e)}
+        return results
+
+
+if __name__ == '__main__':
+    import sys
+    from src.main import app
+
+    with app.app_context():
+        processor = PendingAlertProcessor()
+        if len(sys.argv) > 1:
+            print(processor.process_organization(sys.argv[1]))
+        else:
+            print(processor.process_all())
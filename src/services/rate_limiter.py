@@ -0,0 +1,326 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+from src.services.redis_client import get_redis, reset_redis
+
+logger = logging.getLogger(__name__)
+
+# Requests per minute allowed per organization, by subscription tier
+TIER_RATE_LIMITS = {
+    'basic': int(os.environ.get('RATE_LIMIT_BASIC_PER_MINUTE', 60)),
+    'professional': int(os.environ.get('RATE_LIMIT_PROFESSIONAL_PER_MINUTE', 300)),
+    'enterprise': int(os.environ.get('RATE_LIMIT_ENTERPRISE_PER_MINUTE', 1200)),
+}
+DEFAULT_RATE_LIMIT = TIER_RATE_LIMITS['basic']
+WINDOW_SECONDS = 60
+USAGE_RETENTION_DAYS = 90
+
+# Sliding-window counter: the previous fixed window is weighted by how much of it
+# still overlaps the sliding window. Returns {allowed, scope, limit, remaining}.
+_CHECK_SCRIPT = """
+local weight = tonumber(ARGV[1])
+local limits = {tonumber(ARGV[2]), tonumber(ARGV[3])}
+local quota_limit = tonumber(ARGV[4])
+local endpoint = ARGV[5]
+local usage_ttl = tonumber(ARGV[6])
+local scopes = {'organization', 'api_key'}
+local remaining = -1
+local limiting_scope = 'organization'
+local limiting_limit = limits[1]
+for i = 1, 2 do
+    local current = tonumber(redis.call('GET', KEYS[2 * i - 1]) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+    local count = math.floor(previous * weight) + current
+    if count >= limits[i] then
+        redis.call('HINCRBY', KEYS[6], 'rejected', 1)
+        redis.call('EXPIRE', KEYS[6], usage_ttl)
+        return {0, scopes[i], limits[i], 0}
+    end
+    local left = limits[i] - count - 1
+    if remaining < 0 or left < remaining then
+        remaining = left
+        limiting_scope = scopes[i]
+        limiting_limit = limits[i]
+    end
+end
+local used = tonumber(redis.call('GET', KEYS[5]) or '0')
+if quota_limit > 0 then
+    if used >= quota_limit then
+        redis.call('HINCRBY', KEYS[6], 'rejected', 1)
+        redis.call('EXPIRE', KEYS[6], usage_ttl)
+        return {0, 'quota', quota_limit, 0}
+    end
+    if quota_limit - used - 1 < remaining then
+        remaining = quota_limit - used - 1
+        limiting_scope = 'quota'
+        limiting_limit = quota_limit
+    end
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], 120)
+redis.call('INCR', KEYS[5])
+redis.call('EXPIRE', KEYS[5], 90000)
+redis.call('HINCRBY', KEYS[6], 'requests', 1)
+redis.call('HINCRBY', KEYS[6], 'endpoint:' .. endpoint, 1)
+redis.call('EXPIRE', KEYS[6], usage_ttl)
+return {1, limiting_scope, limiting_limit, remaining}
+"""
+
+
+class LimitDecision(NamedTuple):
+    allowed: bool
+    scope: str  # organization, api_key or quota: the limit closest to being exhausted
+    limit: int
+    remaining: int
+    reset: int  # Seconds until the limiting window resets
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            'RateLimit-Limit': str(self.limit),
+            'RateLimit-Remaining': str(max(0, self.remaining)),
+            'RateLimit-Reset': str(self.reset),
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.reset)
+        return headers
+
+
+def _day_bucket(now: float) -> str:
+    return datetime.utcfromtimestamp(now).strftime('%Y%m%d')
+
+
+def _seconds_to_midnight(now: float) -> int:
+    current = datetime.utcfromtimestamp(now)
+    midnight = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((midnight - current).total_seconds()))
+
+
+class RateLimiter:
+    """
+    Sliding-window rate limit per organization and per API key, plus a daily
+    request quota per organization (Organization.api_quota_limit).
+
+    Counters live in Redis so every worker enforces the same limits. While a
+    scope is known to be exhausted, requests are rejected from an in-process
+    table without a Redis round trip; if Redis is unavailable the same
+    algorithm runs on local counters.
+    """
+
+    def __init__(self):
+        self._script = None
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._usage: Dict[str, Dict[str, int]] = {}
+        self._blocked: Dict[str, tuple] = {}
+        self._pruned_window = None
+
+    def limits_for(self, organization, api_key=None) -> Dict[str, int]:
+        """Per-minute and daily limits that apply to a request"""
+        org_limit = TIER_RATE_LIMITS.get(organization.subscription_tier, DEFAULT_RATE_LIMIT)
+        key_limit = org_limit
+        permissions = getattr(api_key, 'permissions', None)
+        if isinstance(permissions, dict) and permissions.get('rate_limit_per_minute'):
+            key_limit = min(org_limit, int(permissions['rate_limit_per_minute']))
+        return {
+            'organization_per_minute': org_limit,
+            'api_key_per_minute': key_limit,
+            'daily_quota': organization.api_quota_limit or 0
+        }
+
+    def check(self, organization, api_key=None, endpoint: str = 'unknown') -> LimitDecision:
+        """
+        Count a request against the organization's limits
+
+        Args:
+            organization: Organization making the request
+            api_key: APIKey used (optional; its permissions may set a lower limit)
+            endpoint: Endpoint name recorded in the usage counters
+
+        Returns:
+            LimitDecision with the values for the RateLimit-* headers
+        """
+        now = time.time()
+        api_key_id = getattr(api_key, 'id', None) or 'session'
+        blocked = self._blocked_decision(organization, api_key_id, now)
+        if blocked is not None:
+            self._record_rejection(organization.id, now)
+            return blocked
+
+        limits = self.limits_for(organization, api_key)
+        window = int(now // WINDOW_SECONDS)
+        weight = 1 - (now % WINDOW_SECONDS) / WINDOW_SECONDS
+        keys = [
+            f"ratelimit:org:{organization.id}:{window}",
+            f"ratelimit:org:{organization.id}:{window - 1}",
+            f"ratelimit:key:{api_key_id}:{window}",
+            f"ratelimit:key:{api_key_id}:{window - 1}",
+            f"quota:{organization.id}:{_day_bucket(now)}",
+            f"api_usage:{organization.id}:{_day_bucket(now)}",
+        ]
+        args = [
+            weight, limits['organization_per_minute'], limits['api_key_per_minute'],
+            limits['daily_quota'], endpoint, USAGE_RETENTION_DAYS * 86400
+        ]
+
+        result = self._check_redis(keys, args)
+        if result is None:
+            result = self._check_local(keys, args)
+
+        allowed, scope, limit, remaining = int(result[0]), str(result[1]), int(result[2]), int(result[3])
+        reset = _seconds_to_midnight(now) if scope == 'quota' else int(WINDOW_SECONDS - now % WINDOW_SECONDS) or 1
+        decision = LimitDecision(bool(allowed), scope, limit, remaining, reset)
+
+        if not decision.allowed:
+            blocked_key = organization.id if scope != 'api_key' else f"{organization.id}:{api_key_id}"
+            # A quota block is re-checked after one window, so a raised quota applies without waiting for midnight
+            with self._lock:
+                self._blocked[blocked_key] = (now + min(reset, WINDOW_SECONDS), now + reset, decision)
+            logger.info(f"Rate limit ({scope}) reached for organization {organization.id}")
+        return decision
+
+    def _blocked_decision(self, organization, api_key_id: str, now: float) -> Optional[LimitDecision]:
+        with self._lock:
+            for blocked_key in (organization.id, f"{organization.id}:{api_key_id}"):
+                entry = self._blocked.get(blocked_key)
+                if entry is None:
+                    continue
+                until, resets_at, decision = entry
+                quota_changed = decision.scope == 'quota' and decision.limit != (organization.api_quota_limit or 0)
+                if until > now and not quota_changed:
+                    return decision._replace(reset=max(1, int(resets_at - now)))
+                del self._blocked[blocked_key]
+        return None
+
+    def _check_redis(self, keys: List[str], args: List) -> Optional[List]:
+        redis_client = get_redis()
+        if redis_client is None:
+            return None
+        try:
+            if self._script is None:
+                self._script = redis_client.register_script(_CHECK_SCRIPT)
+            return self._script(keys=keys, args=args)
+        except Exception as e:
+            logger.warning(f"Redis rate limiter unavailable, using local counters: {str(e)}")
+            self._script = None
+            reset_redis()
+            return None
+
+    def _check_local(self, keys: List[str], args: List) -> List:
+        weight, org_limit, key_limit, quota_limit, endpoint = args[:5]
+        with self._lock:
+            remaining = None
+            limiting = ('organization', org_limit)
+            for index, (scope, limit) in enumerate((('organization', org_limit), ('api_key', key_limit))):
+                current = self._counters.get(keys[2 * index], 0)
+                previous = self._counters.get(keys[2 * index + 1], 0)
+                count = int(previous * weight) + current
+                if count >= limit:
+                    self._bump_usage(keys[5], 'rejected')
+                    return [0, scope, limit, 0]
+                if remaining is None or limit - count - 1 < remaining:
+                    remaining = limit - count - 1
+                    limiting = (scope, limit)
+
+            used = self._counters.get(keys[4], 0)
+            if quota_limit > 0:
+                if used >= quota_limit:
+                    self._bump_usage(keys[5], 'rejected')
+                    return [0, 'quota', quota_limit, 0]
+                if quota_limit - used - 1 < remaining:
+                    remaining = quota_limit - used - 1
+                    limiting = ('quota', quota_limit)
+
+            for key in (keys[0], keys[2], keys[4]):
+                self._counters[key] = self._counters.get(key, 0) + 1
+            self._bump_usage(keys[5], 'requests')
+            self._bump_usage(keys[5], f"endpoint:{endpoint}")
+            self._prune_local(keys)
+            return [1, limiting[0], limiting[1], remaining]
+
+    def _bump_usage(self, usage_key: str, field: str):
+        usage = self._usage.setdefault(usage_key, {})
+        usage[field] = usage.get(field, 0) + 1
+
+    def _record_rejection(self, organization_id: str, now: float):
+        # Rejections served from the fast path are only known to this process
+        redis_client = get_redis()
+        usage_key = f"api_usage:{organization_id}:{_day_bucket(now)}"
+        if redis_client is not None:
+            try:
+                redis_client.hincrby(usage_key, 'rejected', 1)
+                return
+            except Exception:
+                reset_redis()
+        with self._lock:
+            self._bump_usage(usage_key, 'rejected')
+
+    def _prune_local(self, keys: List[str]):
+        """
+        Drop window counters older than the previous window, quotas of past
+        days and usage counters past USAGE_RETENTION_DAYS; runs once per window
+        (caller holds the lock)
+        """
+        window = int(keys[0].rsplit(':', 1)[1])
+        if window == self._pruned_window:
+            return
+        self._pruned_window = window
+        today = keys[4].rsplit(':', 1)[1]
+        for key in list(self._counters):
+            bucket = key.rsplit(':', 1)[1]
+            if key.startswith('ratelimit:') and int(bucket) < window - 1:
+                del self._counters[key]
+            elif key.startswith('quota:') and bucket != today:
+                del self._counters[key]
+        oldest = (datetime.strptime(today, '%Y%m%d') - timedelta(days=USAGE_RETENTION_DAYS)).strftime('%Y%m%d')
+        for key in list(self._usage):
+            if key.rsplit(':', 1)[1] < oldest:
+                del self._usage[key]
+
+    def get_usage(self, organization_id: str, days: int = 7) -> List[Dict]:
+        """
+        Daily request counters for an organization, most recent first
+
+        Returns:
+            List of {'date', 'requests', 'rejected', 'endpoints'} dicts
+        """
+        today = datetime.utcnow()
+        buckets = [(today - timedelta(days=offset)).strftime('%Y%m%d') for offset in range(days)]
+        keys = [f"api_usage:{organization_id}:{bucket}" for bucket in buckets]
+
+        raw = None
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                pipeline = redis_client.pipeline()
+                for key in keys:
+                    pipeline.hgetall(key)
+                raw = pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Could not read API usage from Redis: {str(e)}")
+                reset_redis()
+        if raw is None:
+            with self._lock:
+                raw = [dict(self._usage.get(key, {})) for key in keys]
+
+        usage = []
+        for bucket, counters in zip(buckets, raw):
+            counters = {field: int(value) for field, value in (counters or {}).items()}
+            usage.append({
+                'date': datetime.strptime(bucket, '%Y%m%d').date().isoformat(),
+                'requests': counters.get('requests', 0),
+                'rejected': counters.get('rejected', 0),
+                'endpoints': {
+                    field.split(':', 1)[1]: value for field, value in counters.items()
+                    if field.startswith('endpoint:')
+                }
+            })
+        return usage
+
+
+# Shared per-process instance
+rate_limiter = RateLimiter()
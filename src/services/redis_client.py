@@ -0,0 +1,66 @@
+import os
+import time
+import logging
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Tiempo de espera antes de reintentar la conexión tras un fallo
+_RETRY_AFTER_SECONDS = 30
+
+_client = None
+_client_url = None
+_last_failure = 0.0
+
+
+def get_redis_url():
+    """Resolve the Redis URL from the Flask config or the environment"""
+    if has_app_context():
+        url = current_app.config.get('REDIS_URL')
+        if url:
+            return url
+    return os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+
+def get_redis():
+    """
+    Return a shared Redis client, or None when Redis is not reachable.
+
+    Callers must always have an in-process fallback: a failed connection is
+    remembered for a short period so the hot path does not pay a connection
+    timeout on every request.
+    """
+    global _client, _client_url, _last_failure
+
+    url = get_redis_url()
+    if _client is not None and _client_url == url:
+        return _client
+
+    if time.monotonic() - _last_failure < _RETRY_AFTER_SECONDS:
+        return None
+
+    try:
+        import redis
+
+        client = redis.Redis.from_url(
+            url,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+            decode_responses=True
+        )
+        client.ping()
+    except Exception as e:
+        _last_failure = time.monotonic()
+        logger.warning(f"Redis not available at {url}, using in-process state: {str(e)}")
+        return None
+
+    _client = client
+    _client_url = url
+    return _client
+
+
+def reset_redis():
+    """Forget the current client so the next call reconnects (e.g. after a Redis error)"""
+    global _client, _last_failure
+    _client = None
+    _last_failure = time.monotonic()
@@ -0,0 +1,236 @@
+import os
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.models.user import db
+from src.models.support import RiderContact
+from src.services.cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_TTL_SECONDS = int(os.environ.get('RIDER_DIRECTORY_TTL', 900))
+# Los repartidores sin teléfono conocido se vuelven a consultar antes
+DIRECTORY_NEGATIVE_TTL_SECONDS = int(os.environ.get('RIDER_DIRECTORY_NEGATIVE_TTL', 60))
+DIRECTORY_PAGE_SIZE = 200
+_LOOKUP_BATCH_SIZE = 500
+
+
+def _rider_items(response) -> List[Dict]:
+    """Normaliza una página de get_riders (lista o envoltorio con la lista)"""
+    if isinstance(response, list):
+        return response
+    if isinstance(response, dict):
+        for key in ('employees', 'riders', 'items', 'data', 'results'):
+            if isinstance(response.get(key), list):
+                return response[key]
+    return []
+
+
+def _contact_fields(rider: Dict) -> Optional[Tuple[str, Dict]]:
+    """Extrae (rider_id, campos de contacto) de un repartidor de la API externa"""
+    rider_id = rider.get('employee_id') or rider.get('rider_id') or rider.get('id')
+    if not rider_id:
+        return None
+
+    contact = rider.get('contact') or {}
+    phone = (
+        rider.get('phone') or rider.get('phone_number') or rider.get('mobile')
+        or (contact.get('phone') if isinstance(contact, dict) else None)
+    )
+    name = rider.get('name') or ' '.join(
+        part for part in (rider.get('first_name'), rider.get('last_name')) if part
+    ) or None
+
+    return str(rider_id), {
+        'phone': str(phone) if phone else None,
+        'name': name,
+        'city_id': str(rider['city_id']) if rider.get('city_id') is not None else None
+    }
+
+
+class RiderDirectory:
+    """
+    Directorio local rider_id → teléfono por organización.
+
+    Se alimenta en bloque desde las páginas de get_riders (barrido periódico y
+    las respuestas que ya obtienen las rutas de repartidores) y se consulta por
+    lotes: una pasada sobre la caché en memoria y una consulta IN para los que falten.
+    """
+
+    def __init__(self, ttl_seconds: int = DIRECTORY_TTL_SECONDS,
+                 negative_ttl_seconds: int = DIRECTORY_NEGATIVE_TTL_SECONDS,
+                 max_entries: int = 100000):
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._cache = TTLCache(ttl_seconds, max_entries=max_entries)
+
+    def lookup_phones(self, organization_id: str, rider_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Resuelve los teléfonos de varios repartidores en una sola pasada
+
+        Args:
+            organization_id: ID de la organización
+            rider_ids: IDs de repartidor en el sistema externo
+
+        Returns:
+            Dict[str, str]: Teléfono por rider_id (solo los conocidos)
+        """
+        phones = {}
+        missing = []
+        for rider_id in {str(rider_id) for rider_id in rider_ids if rider_id}:
+            phone = self._cache.get((organization_id, rider_id))
+            if phone is MISSING:
+                missing.append(rider_id)
+            elif phone:
+                phones[rider_id] = phone
+
+        for offset in range(0, len(missing), _LOOKUP_BATCH_SIZE):
+            batch = missing[offset:offset + _LOOKUP_BATCH_SIZE]
+            rows = RiderContact.query.with_entities(RiderContact.rider_id, RiderContact.phone).filter(
+                RiderContact.organization_id == organization_id,
+                RiderContact.rider_id.in_(batch)
+            ).all()
+            found = {rider_id: phone for rider_id, phone in rows if phone}
+            for rider_id in batch:
+                phone = found.get(rider_id)
+                if phone:
+                    phones[rider_id] = phone
+                    self._cache.set((organization_id, rider_id), phone)
+                else:
+                    self._cache.set((organization_id, rider_id), None, self.negative_ttl_seconds)
+
+        return phones
+
+    def get_phone(self, organization_id: str, rider_id: str) -> Optional[str]:
+        """Teléfono de un repartidor o None si no está en el directorio"""
+        if not rider_id:
+            return None
+        return self.lookup_phones(organization_id, [rider_id]).get(str(rider_id))
+
+    def remember(self, organization_id: str, riders) -> Dict[str, int]:
+        """
+        Actualiza el directorio con repartidores ya obtenidos de la API externa (sin commit)
+
+        Solo se escriben las filas nuevas o cuyo contacto ha cambiado.
+
+        Args:
+            organization_id: ID de la organización
+            riders: Página de get_riders/get_rider (lista, envoltorio o un solo repartidor)
+
+        Returns:
+            Dict con el número de contactos creados y actualizados
+        """
+        items = _rider_items(riders)
+        if not items and isinstance(riders, dict):
+            items = [riders]
+
+        contacts = {}
+        for rider in items:
+            parsed = _contact_fields(rider) if isinstance(rider, dict) else None
+            if parsed:
+                contacts[parsed[0]] = parsed[1]
+
+        stats = {'created': 0, 'updated': 0}
+        if not contacts:
+            return stats
+
+        existing = {
+            contact.rider_id: contact for contact in RiderContact.query.filter(
+                RiderContact.organization_id == organization_id,
+                RiderContact.rider_id.in_(list(contacts))
+            ).all()
+        }
+
+        for rider_id, fields in contacts.items():
+            contact = existing.get(rider_id)
+            if contact is None:
+                db.session.add(RiderContact(organization_id=organization_id, rider_id=rider_id, **fields))
+                stats['created'] += 1
+            else:
+                changed = False
+                for field, value in fields.items():
+                    # Una página sin teléfono no borra el que ya conocemos
+                    if value is not None and getattr(contact, field) != value:
+                        setattr(contact, field, value)
+                        changed = True
+                if changed:
+                    stats['updated'] += 1
+
+            if fields['phone']:
+                self._cache.set((organization_id, rider_id), fields['phone'])
+
+        return stats
+
+    def remember_quietly(self, organization_id: str, riders):
+        """Variante de remember para las rutas: confirma y nunca propaga errores"""
+        try:
+            stats = self.remember(organization_id, riders)
+            if stats['created'] or stats['updated']:
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Could not update rider directory for organization {organization_id}: {str(e)}")
+
+    def refresh(self, organization, page_size: int = DIRECTORY_PAGE_SIZE) -> Dict[str, int]:
+        """
+        Recorre el listado completo de repartidores de la organización y sincroniza el directorio
+
+        Cada página se confirma por separado.
+
+        Args:
+            organization: Objeto Organization con configuración rider_external
+
+        Returns:
+            Dict con estadísticas de la sincronización
+        """
+        from src.services.rider_service import RiderExternalService
+
+        rider_service = RiderExternalService(organization)
+        stats = {'pages': 0, 'riders': 0, 'created': 0, 'updated': 0}
+        offset = 0
+        while True:
+            items = _rider_items(rider_service.get_riders({'limit': page_size, 'offset': offset}))
+            if not items:
+                break
+
+            try:
+                page_stats = self.remember(organization.id, items)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            stats['pages'] += 1
+            stats['riders'] += len(items)
+            stats['created'] += page_stats['created']
+            stats['updated'] += page_stats['updated']
+            if len(items) < page_size:
+                break
+            offset += page_size
+
+        logger.info(
+            f"Rider directory refreshed for organization {organization.id}: "
+            f"{stats['riders']} riders, {stats['created']} new, {stats['updated']} updated"
+        )
+        return stats
+
+    def invalidate(self, organization_id: Optional[str] = None):
+        """Vacía la caché en memoria (de una organización o completa)"""
+        if organization_id is None:
+            self._cache.clear()
+        else:
+            self._cache.delete_where(lambda key: key[0] == organization_id)
+
+
+rider_directory = RiderDirectory()
+
+
+if __name__ == '__main__':
+    from src.main import app
+    from src.models.organization import Organization, APIConfiguration
+
+    with app.app_context():
+        organization_ids = [
+            row[0] for row in APIConfiguration.query.with_entities(APIConfiguration.organization_id)
+            .filter_by(api_type='rider_external', is_active=True).distinct().all()
+        ]
+        for organization_id in organization_ids:
+            print(organization_id, rider_directory.refresh(Organization.query.get(organization_id)))
@@ -1,9 +1,11 @@
 import requests
 import json
+from collections import Counter
 from datetime import datetime, timedelta
 from flask import current_app
-from src.models.organization import APIConfiguration
+from src.services.config_cache import config_cache
 from src.services.encryption_service import EncryptionService
+from src.services.alert_suppression import SuppressionDecision, alert_rules, crosses_enter
 
 class RiderExternalService:
     def __init__(self, organization):
@@ -14,17 +16,13 @@ class RiderExternalService:
         
     def _get_credentials(self):
         """Get decrypted credentials for the organization"""
-        config = APIConfiguration.query.filter_by(
-            organization_id=self.organization.id,
-            api_type='rider_external',
-            is_active=True
-        ).first()
+        config = config_cache.get(self.organization.id, 'rider_external')
         
         if not config:
             raise ValueError("No RiderExternal API configuration found for organization")
         
         encryption_service = EncryptionService()
-        return encryption_service.decrypt_credentials(config.credentials)
+        return encryption_service.decrypt_config_credentials(config)
     
     def _get_auth_token(self):
         """Get authentication token using STS"""
@@ -135,8 +133,9 @@ class RiderExternalService:
 class RiderAnalyticsService:
     """Service for analyzing rider data and generating insights"""
     
-    def __init__(self, rider_service):
+    def __init__(self, rider_service, suppressor=None):
         self.rider_service = rider_service
+        self.suppressor = suppressor
     
     def calculate_kpis(self, city_id, date_range=None):
         """Calculate key performance indicators"""
@@ -159,54 +158,77 @@ class RiderAnalyticsService:
     def detect_alerts(self, city_id):
         """Detect alerts based on rider data"""
         alerts = []
+        rules = self.suppressor.rules if self.suppressor is not None else alert_rules()
         riders_data = self.rider_service.get_live_riders(city_id)
         
         for rider in riders_data.get('riders', []):
+            late_minutes = rider.get('late_duration_minutes', 0) if rider.get('status') == 'LATE' else 0
+            
             # Cash threshold alert
-            if rider.get('cash_amount', 0) >= 120:
+            decision = self._check(rider, 'cash_threshold', rider.get('cash_amount', 0))
+            if decision.active:
                 alerts.append({
                     'type': 'cash_threshold',
                     'rider_id': rider.get('id'),
                     'severity': 'high',
-                    'message': f"Rider {rider.get('name')} has cash amount ≥ €120",
-                    'data': {'cash_amount': rider.get('cash_amount')}
+                    'message': f"Rider {rider.get('name')} has cash amount ≥ €{rules['cash_threshold']['enter']}",
+                    'data': {'cash_amount': rider.get('cash_amount')},
+                    'suppressed': not decision.notify
                 })
             
             # No-show alert
-            if rider.get('status') == 'LATE' and rider.get('late_duration_minutes', 0) > 30:
+            decision = self._check(rider, 'no_show', late_minutes)
+            if decision.active:
                 alerts.append({
                     'type': 'no_show',
                     'rider_id': rider.get('id'),
                     'severity': 'medium',
                     'message': f"Rider {rider.get('name')} is late for {rider.get('late_duration_minutes')} minutes",
-                    'data': {'late_duration': rider.get('late_duration_minutes')}
+                    'data': {'late_duration': rider.get('late_duration_minutes')},
+                    'suppressed': not decision.notify
                 })
             
             # Battery low alert
-            if rider.get('battery_level', 100) < 20:
+            decision = self._check(rider, 'battery_low', rider.get('battery_level', 100))
+            if decision.active:
                 alerts.append({
                     'type': 'battery_low',
                     'rider_id': rider.get('id'),
                     'severity': 'medium',
                     'message': f"Rider {rider.get('name')} has low battery: {rider.get('battery_level')}%",
-                    'data': {'battery_level': rider.get('battery_level')}
+                    'data': {'battery_level': rider.get('battery_level')},
+                    'suppressed': not decision.notify
                 })
         
         return alerts
     
+    def _check(self, rider, alert_type, value):
+        """Alert thresholds from the alert rules, plus hysteresis and cool-down when a suppressor is configured"""
+        if self.suppressor is None:
+            rule = alert_rules().get(alert_type)
+            condition = rule is not None and crosses_enter(rule, value)
+            return SuppressionDecision(active=condition, notify=condition)
+        return self.suppressor.evaluate(
+            self.rider_service.organization.id,
+            rider.get('id'),
+            alert_type,
+            value
+        )
+    
     def generate_performance_report(self, city_id, date_range=None):
         """Generate comprehensive performance report"""
         kpis = self.calculate_kpis(city_id, date_range)
         alerts = self.detect_alerts(city_id)
+        severity_counts = Counter(a.get('severity') for a in alerts)
         
         report = {
             'kpis': kpis,
             'alerts': alerts,
             'summary': {
                 'total_alerts': len(alerts),
-                'critical_alerts': len([a for a in alerts if a.get('severity') == 'critical']),
-                'high_alerts': len([a for a in alerts if a.get('severity') == 'high']),
-                'medium_alerts': len([a for a in alerts if a.get('severity') == 'medium']),
+                'critical_alerts': severity_counts['critical'],
+                'high_alerts': severity_counts['high'],
+                'medium_alerts': severity_counts['medium'],
                 'rider_utilization': (kpis['active_riders'] / max(kpis['total_riders'], 1)) * 100
             },
             'generated_at': datetime.utcnow().isoformat()
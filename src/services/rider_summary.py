@@ -0,0 +1,232 @@
+import os
+import json
+import math
+import heapq
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# Approximate token budget for the rider digest, by prompt type. The digest is
+# shrunk (fewer outliers and companies, fewer quantiles) until it fits.
+PROMPT_TOKEN_BUDGETS = {
+    'recommendations': int(os.environ.get('AI_SUMMARY_BUDGET_RECOMMENDATIONS', 600)),
+    'knowledge_context': int(os.environ.get('AI_SUMMARY_BUDGET_KNOWLEDGE', 900)),
+}
+DEFAULT_TOKEN_BUDGET = 600
+CHARS_PER_TOKEN = 4  # Conservative estimate for compact JSON
+
+# Metrics worth listing individual riders for, and which end of the range is the problem
+OUTLIER_METRICS = {
+    'cash_amount': 'high',
+    'late_duration_minutes': 'high',
+    'battery_level': 'low',
+}
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+MAX_NUMERIC_FIELDS = 8
+_ID_FIELDS = ('id', 'rider_id', 'employee_id')
+_COMPANY_FIELDS = ('company_id', 'company', 'company_name')
+
+# Progressively cheaper renderings, tried in order until one fits the budget
+_DETAIL_LEVELS = (
+    {'outliers': 5, 'companies': 10, 'quantiles': QUANTILES},
+    {'outliers': 3, 'companies': 5, 'quantiles': (0.25, 0.5, 0.9)},
+    {'outliers': 1, 'companies': 3, 'quantiles': (0.5,)},
+    {'outliers': 0, 'companies': 0, 'quantiles': (0.5,)},
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _items(data, keys: Iterable[str]) -> List[Dict]:
+    """Records of a snapshot that is either a list or a dict wrapping one"""
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    if isinstance(data, dict):
+        for key in keys:
+            if isinstance(data.get(key), list):
+                return [item for item in data[key] if isinstance(item, dict)]
+    return []
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    """Linear-interpolated quantile of an already sorted list"""
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _round(value: float):
+    return round(value, 2) if isinstance(value, float) else value
+
+
+def _numeric_fields(records: List[Dict]) -> List[str]:
+    """Numeric fields present in the records, outlier metrics first, ids excluded"""
+    seen = Counter(
+        field for record in records for field, value in record.items()
+        if _is_number(value) and field not in _ID_FIELDS and not field.endswith('_id')
+    )
+    fields = [field for field in OUTLIER_METRICS if field in seen]
+    fields += [field for field, _ in seen.most_common() if field not in fields]
+    return fields[:MAX_NUMERIC_FIELDS]
+
+
+def _truncated_json(data, limit: int = 200) -> str:
+    """Errors and unexpected shapes are passed through, but never a large payload"""
+    return json.dumps(data, default=str, separators=(',', ':'))[:limit]
+
+
+def _rider_id(rider: Dict):
+    for field in _ID_FIELDS:
+        if rider.get(field) is not None:
+            return rider[field]
+    return None
+
+
+def _company_key(rider: Dict) -> Optional[str]:
+    for field in _COMPANY_FIELDS:
+        value = rider.get(field)
+        if isinstance(value, dict):
+            value = value.get('id') or value.get('name')
+        if value is not None:
+            return str(value)
+    return None
+
+
+class RiderSnapshotDigest:
+    """
+    Statistical digest of a live rider snapshot: counts by status, quantiles
+    of every numeric field, the most extreme riders for the alerting metrics
+    and per-company aggregates.
+
+    Statistics are computed once over the full snapshot; render() then emits
+    as much detail as fits a token budget, so prompt size stays flat however
+    large the fleet is.
+    """
+
+    def __init__(self, rider_data, company_data=None):
+        riders = _items(rider_data, ('riders', 'employees', 'items', 'data', 'results'))
+        self.total = len(riders)
+        self.status_counts = dict(Counter(str(r.get('status') or 'UNKNOWN') for r in riders).most_common())
+        self.fields = _numeric_fields(riders)
+
+        self.values = {}
+        for field in self.fields:
+            self.values[field] = sorted(r[field] for r in riders if _is_number(r.get(field)))
+
+        self.outliers = {}
+        for field, direction in OUTLIER_METRICS.items():
+            pick = heapq.nlargest if direction == 'high' else heapq.nsmallest
+            ranked = pick(
+                _DETAIL_LEVELS[0]['outliers'],
+                (r for r in riders if _is_number(r.get(field))),
+                key=lambda r: r[field]
+            )
+            self.outliers[field] = [
+                {'id': _rider_id(r), 'status': r.get('status'), field: _round(r[field])}
+                for r in ranked
+            ]
+
+        self.companies = self._company_aggregates(riders)
+        self.company_overview = self._company_overview(company_data)
+        # A snapshot without riders is usually an upstream error worth showing
+        self.raw = None if riders or rider_data is None else _truncated_json(rider_data)
+
+    def _company_aggregates(self, riders: List[Dict]) -> List[Dict]:
+        groups: Dict[str, List[Dict]] = {}
+        for rider in riders:
+            company = _company_key(rider)
+            if company is not None:
+                groups.setdefault(company, []).append(rider)
+
+        aggregates = []
+        for company, members in groups.items():
+            statuses = Counter(str(r.get('status') or 'UNKNOWN') for r in members)
+            aggregate = {'company': company, 'riders': len(members), 'working': statuses.get('WORKING', 0)}
+            for field in OUTLIER_METRICS:
+                values = [r[field] for r in members if _is_number(r.get(field))]
+                if values:
+                    aggregate[f"avg_{field}"] = _round(sum(values) / len(values))
+            aggregates.append(aggregate)
+        aggregates.sort(key=lambda a: a['riders'], reverse=True)
+        return aggregates
+
+    def _company_overview(self, company_data) -> Optional[Dict]:
+        if company_data is None:
+            return None
+        companies = _items(company_data, ('companies', 'items', 'data', 'results'))
+        if not companies:
+            return {'raw': _truncated_json(company_data)}
+        fields = _numeric_fields(companies)
+        return {
+            'count': len(companies),
+            'totals': {
+                field: _round(sum(c[field] for c in companies if _is_number(c.get(field))))
+                for field in fields
+            }
+        }
+
+    def as_dict(self, outliers: int = 5, companies: int = 10, quantiles=QUANTILES) -> Dict:
+        stats = {}
+        for field, values in self.values.items():
+            if not values:
+                continue
+            stats[field] = {
+                'n': len(values),
+                'min': _round(values[0]),
+                'mean': _round(sum(values) / len(values)),
+                **{f"p{int(q * 100)}": _round(_quantile(values, q)) for q in quantiles},
+                'max': _round(values[-1]),
+            }
+
+        digest = {'total_riders': self.total, 'by_status': self.status_counts, 'stats': stats}
+        if self.raw is not None:
+            digest['raw'] = self.raw
+        if outliers and any(self.outliers.values()):
+            digest['outliers'] = {
+                f"{'highest' if OUTLIER_METRICS[field] == 'high' else 'lowest'}_{field}": riders[:outliers]
+                for field, riders in self.outliers.items() if riders
+            }
+        if self.companies:
+            digest['company_count'] = len(self.companies)
+            if companies:
+                digest['companies'] = self.companies[:companies]
+                rest = self.companies[companies:]
+                if rest:
+                    digest['other_companies'] = {
+                        'companies': len(rest), 'riders': sum(c['riders'] for c in rest)
+                    }
+        if self.company_overview is not None:
+            digest['company_overview'] = self.company_overview
+        return digest
+
+    def render(self, budget_tokens: int = DEFAULT_TOKEN_BUDGET) -> str:
+        """Compact JSON digest, at the highest detail level that fits the budget"""
+        text = ''
+        for level in _DETAIL_LEVELS:
+            text = json.dumps(self.as_dict(**level), default=str, separators=(',', ':'))
+            if estimate_tokens(text) <= budget_tokens:
+                return text
+        # Even the coarsest digest is too long (e.g. many numeric fields): hard cut
+        return text[:budget_tokens * CHARS_PER_TOKEN]
+
+
+def summarize_for_prompt(rider_data, company_data=None, prompt_type: str = 'recommendations') -> str:
+    """
+    Digest of a rider snapshot sized for one prompt
+
+    Args:
+        rider_data: get_live_riders response (list or dict with a 'riders' list)
+        company_data: get_companies_overview response (optional)
+        prompt_type: Key of PROMPT_TOKEN_BUDGETS
+
+    Returns:
+        str: Compact JSON within the prompt type's token budget
+    """
+    budget = PROMPT_TOKEN_BUDGETS.get(prompt_type, DEFAULT_TOKEN_BUDGET)
+    return RiderSnapshotDigest(rider_data, company_data).render(budget)
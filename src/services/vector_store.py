@@ -0,0 +1,413 @@
+import os
+import re
+import json
+import fcntl
+import uuid
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from src.services.cache import TTLCache, MISSING
+from src.services.ai_cache import EMBEDDING_MODEL, normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+VECTOR_STORE_DIR = os.environ.get('VECTOR_STORE_DIR', os.path.join(BASE_DIR, 'data', 'vector_store'))
+# Shortened embeddings keep 100k chunks at ~100 MB and a full scan within a few ms
+VECTOR_DIMENSIONS = int(os.environ.get('VECTOR_DIMENSIONS', 256))
+CHUNK_SIZE = int(os.environ.get('VECTOR_CHUNK_SIZE', 800))  # Characters
+CHUNK_OVERLAP = 100
+EMBEDDING_BATCH_SIZE = 100
+INITIAL_CAPACITY = 1024
+# Deleted rows are tombstoned; the matrix is rewritten once they reach this share
+COMPACT_RATIO = 0.25
+
+_VECTORS_FILE = 'vectors.f32'
+_META_FILE = 'meta.json'
+_TEXTS_FILE = 'texts.jsonl'
+_LOCK_FILE = 'store.lock'
+
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split a document on paragraph and sentence boundaries into chunks of about `size` characters"""
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text or ''):
+        paragraph = re.sub(r'\s+', ' ', paragraph).strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= size:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            # Sentences longer than a chunk are cut hard
+            pieces.extend(sentence[i:i + size] for i in range(0, len(sentence), size))
+
+    chunks, current = [], ''
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > size:
+            chunks.append(current)
+            # Carry the tail of the previous chunk so answers spanning a boundary are retrievable
+            current = current[-overlap:].lstrip() + ' ' + piece if overlap else piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class OrganizationVectorStore:
+    """
+    Chunk embeddings of one organization's documents.
+
+    Vectors are L2-normalized float32 rows of a memory-mapped matrix
+    (vectors.f32). Chunk texts are appended to texts.jsonl, and meta.json
+    maps each row to its document and the byte offset of its text, so a
+    write rewrites only the small index. Cosine top-k is a single
+    matrix-vector product over the mapped rows.
+
+    Appends write new rows and texts past the current end and then replace
+    meta.json atomically, so readers in other processes never see a
+    half-written index; they reload when meta.json changes. Writers are
+    serialized with a file lock.
+    """
+
+    def __init__(self, organization_id: str, root: str = VECTOR_STORE_DIR):
+        self.organization_id = organization_id
+        self.path = os.path.join(root, organization_id)
+        self._lock = threading.RLock()
+        self._meta = None
+        self._meta_mtime = None
+        self._vectors = None
+        self._texts = None
+        self._alive = None
+
+    # -- persistence --
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _empty_meta(self) -> Dict:
+        return {'dimensions': None, 'model': EMBEDDING_MODEL, 'count': 0, 'capacity': 0,
+                'rows': [], 'documents': {}}
+
+    def _reload_if_changed(self):
+        """Pick up writes made by other processes (caller holds self._lock)"""
+        meta_path = self._file(_META_FILE)
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            if self._meta is None:
+                self._meta = self._empty_meta()
+                self._alive = np.zeros(0, dtype=bool)
+            return
+        if self._meta is not None and mtime == self._meta_mtime:
+            return
+
+        with open(meta_path) as handle:
+            meta = json.load(handle)
+        self._meta, self._meta_mtime = meta, mtime
+        self._alive = np.array([row is not None for row in meta['rows']], dtype=bool)
+        self._vectors = None
+        # Like the memmap, the open handle keeps reading the file this meta.json refers to
+        # (searches still holding the previous handle close it when they drop it)
+        self._texts = open(self._file(_TEXTS_FILE), 'rb') if os.path.exists(self._file(_TEXTS_FILE)) else None
+        if meta['capacity']:
+            self._vectors = np.memmap(
+                self._file(_VECTORS_FILE), dtype=np.float32, mode='r',
+                shape=(meta['capacity'], meta['dimensions'])
+            )
+
+    def _write_meta(self, meta: Dict):
+        tmp_path = self._file(f"{_META_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as handle:
+            json.dump(meta, handle, separators=(',', ':'))
+        os.replace(tmp_path, self._file(_META_FILE))
+        self._meta_mtime = None  # Force a reload (and a fresh read-only map) on next access
+
+    def _append_texts(self, texts: List[str]) -> List[List[int]]:
+        """Append chunk texts to texts.jsonl; returns their [offset, length] in bytes"""
+        spans = []
+        with open(self._file(_TEXTS_FILE), 'ab') as handle:
+            offset = handle.tell()
+            for text in texts:
+                line = (json.dumps(text) + '\n').encode('utf-8')
+                handle.write(line)
+                spans.append([offset, len(line)])
+                offset += len(line)
+        return spans
+
+    def _migrate_inline_texts(self, meta: Dict):
+        """Move chunk texts kept inline by older meta.json files into texts.jsonl"""
+        inline = [index for index, row in enumerate(meta['rows']) if row is not None and len(row) == 2]
+        if not inline:
+            return
+        spans = self._append_texts([meta['rows'][index][1] for index in inline])
+        for index, span in zip(inline, spans):
+            meta['rows'][index] = [meta['rows'][index][0]] + span
+
+    def _read_text(self, texts, row: List) -> str:
+        if len(row) == 2:
+            return row[1]
+        return json.loads(os.pread(texts.fileno(), row[2], row[1]))
+
+    def _write_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        handle = open(self._file(_LOCK_FILE), 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    # -- writes --
+
+    def add_document(self, text: str, embed, title: Optional[str] = None,
+                     document_id: Optional[str] = None) -> Dict:
+        """
+        Chunk, embed and append a document (replacing any previous version with the same ID)
+
+        Args:
+            text: Document body
+            embed: Callable(list of texts) -> list of vectors
+            title: Optional display title, prepended to every chunk before embedding
+            document_id: Stable ID chosen by the caller (generated when omitted)
+
+        Returns:
+            Dict: Document entry (id, title, chunks, created_at)
+        """
+        chunks = chunk_text(text)
+        if not chunks:
+            raise ValueError('Document has no text')
+        document_id = document_id or str(uuid.uuid4())
+
+        # Embedding happens outside the write lock: it is the slow part
+        inputs = [f"{title}\n{chunk}" if title else chunk for chunk in chunks]
+        vectors = _normalize(np.asarray(embed(inputs), dtype=np.float32))
+
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            meta = json.loads(json.dumps(self._meta))
+            if meta['dimensions'] is None:
+                meta['dimensions'] = int(vectors.shape[1])
+            elif meta['dimensions'] != vectors.shape[1]:
+                raise ValueError(
+                    f"Embedding size {vectors.shape[1]} does not match the store ({meta['dimensions']})"
+                )
+
+            self._migrate_inline_texts(meta)
+            self._drop_rows(meta, document_id)
+            start = meta['count']
+            self._ensure_capacity(meta, start + len(chunks))
+            matrix = np.memmap(self._file(_VECTORS_FILE), dtype=np.float32, mode='r+',
+                               shape=(meta['capacity'], meta['dimensions']))
+            matrix[start:start + len(chunks)] = vectors
+            matrix.flush()
+            del matrix
+
+            meta['rows'].extend([document_id] + span for span in self._append_texts(chunks))
+            meta['count'] = start + len(chunks)
+            entry = {
+                'id': document_id,
+                'title': title,
+                'chunks': len(chunks),
+                'rows': list(range(start, start + len(chunks))),
+                'created_at': datetime.utcnow().isoformat()
+            }
+            meta['documents'][document_id] = entry
+            self._compact_if_needed(meta)
+            self._write_meta(meta)
+
+        logger.info(f"Indexed document {document_id} ({len(chunks)} chunks) for organization {self.organization_id}")
+        return {key: value for key, value in entry.items() if key != 'rows'}
+
+    def delete_document(self, document_id: str) -> bool:
+        """Remove a document's chunks; returns False if it was not indexed"""
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            if document_id not in self._meta['documents']:
+                return False
+            meta = json.loads(json.dumps(self._meta))
+            self._migrate_inline_texts(meta)
+            self._drop_rows(meta, document_id)
+            self._compact_if_needed(meta)
+            self._write_meta(meta)
+        return True
+
+    @staticmethod
+    def _drop_rows(meta: Dict, document_id: str):
+        entry = meta['documents'].pop(document_id, None)
+        for row in (entry or {}).get('rows', ()):
+            meta['rows'][row] = None
+
+    def _ensure_capacity(self, meta: Dict, needed: int):
+        if needed <= meta['capacity']:
+            return
+        capacity = max(INITIAL_CAPACITY, meta['capacity'])
+        while capacity < needed:
+            capacity *= 2
+        # Growing the file keeps existing rows in place; readers still map the old size
+        with open(self._file(_VECTORS_FILE), 'ab') as handle:
+            handle.truncate(capacity * meta['dimensions'] * 4)
+        meta['capacity'] = capacity
+
+    def _compact_if_needed(self, meta: Dict):
+        dead = sum(1 for row in meta['rows'] if row is None)
+        if not dead or dead < COMPACT_RATIO * max(meta['count'], 1):
+            return
+
+        keep = [index for index, row in enumerate(meta['rows']) if row is not None]
+        old = np.memmap(self._file(_VECTORS_FILE), dtype=np.float32, mode='r',
+                        shape=(meta['capacity'], meta['dimensions']))
+        capacity = max(INITIAL_CAPACITY, 1 << max(len(keep) - 1, 0).bit_length())
+        tmp_path = self._file(f"{_VECTORS_FILE}.{os.getpid()}.tmp")
+        new = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(capacity, meta['dimensions']))
+        if keep:
+            new[:len(keep)] = old[keep]
+        new.flush()
+        del new, old
+        # Processes still mapping the old file keep reading it until they reload
+        os.replace(tmp_path, self._file(_VECTORS_FILE))
+
+        # Rewrite texts.jsonl with the live chunks only, in the new row order
+        rows, offset = [], 0
+        tmp_path = self._file(f"{_TEXTS_FILE}.{os.getpid()}.tmp")
+        with open(self._file(_TEXTS_FILE), 'rb') as source, open(tmp_path, 'wb') as target:
+            for old_row in keep:
+                document_id, old_offset, length = meta['rows'][old_row]
+                target.write(os.pread(source.fileno(), length, old_offset))
+                rows.append([document_id, offset, length])
+                offset += length
+        os.replace(tmp_path, self._file(_TEXTS_FILE))
+
+        remap = {old_row: new_row for new_row, old_row in enumerate(keep)}
+        meta['rows'] = rows
+        for entry in meta['documents'].values():
+            entry['rows'] = [remap[row] for row in entry['rows']]
+        meta['count'] = len(keep)
+        meta['capacity'] = capacity
+        logger.info(f"Compacted vector store of organization {self.organization_id} to {len(keep)} chunks")
+
+    # -- reads --
+
+    def search(self, query_vector, top_k: int = 4, min_score: float = 0.0) -> List[Dict]:
+        """
+        Top-k chunks by cosine similarity to an (unnormalized) query embedding
+
+        Returns:
+            List of {'document_id', 'title', 'text', 'score'} dicts, best first
+        """
+        with self._lock:
+            self._reload_if_changed()
+            meta, vectors, texts, alive = self._meta, self._vectors, self._texts, self._alive
+        count = meta['count']
+        if not count or vectors is None or not alive.any():
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != meta['dimensions']:
+            logger.warning(
+                f"Query embedding size {query.shape[0]} does not match the vector store of "
+                f"organization {self.organization_id} ({meta['dimensions']})"
+            )
+            return []
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        scores = vectors[:count] @ query
+        scores[~alive[:count]] = -np.inf
+        k = min(top_k, int(alive.sum()))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+
+        results = []
+        for row in best:
+            score = float(scores[row])
+            if score < min_score:
+                break
+            document_id = meta['rows'][row][0]
+            results.append({
+                'document_id': document_id,
+                'title': meta['documents'].get(document_id, {}).get('title'),
+                'text': self._read_text(texts, meta['rows'][row]),
+                'score': round(score, 4)
+            })
+        return results
+
+    def list_documents(self) -> List[Dict]:
+        with self._lock:
+            self._reload_if_changed()
+            documents = list(self._meta['documents'].values())
+        return [{key: value for key, value in entry.items() if key != 'rows'} for entry in documents]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._reload_if_changed()
+            meta, alive = self._meta, self._alive
+        return {
+            'documents': len(meta['documents']),
+            'chunks': int(alive.sum()),
+            'dimensions': meta['dimensions'],
+            'model': meta['model']
+        }
+
+
+class VectorStoreService:
+    """Per-organization stores plus the embedding calls that feed and query them"""
+
+    def __init__(self, root: str = VECTOR_STORE_DIR, dimensions: int = VECTOR_DIMENSIONS):
+        self.root = root
+        self.dimensions = dimensions
+        self._stores: Dict[str, OrganizationVectorStore] = {}
+        self._lock = threading.Lock()
+        # Repeated questions skip the embedding call
+        self._query_embeddings = TTLCache(3600, max_entries=5000)
+
+    def store_for(self, organization_id: str) -> OrganizationVectorStore:
+        with self._lock:
+            store = self._stores.get(organization_id)
+            if store is None:
+                store = self._stores[organization_id] = OrganizationVectorStore(organization_id, self.root)
+            return store
+
+    def embed(self, client, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for offset in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            response = client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=texts[offset:offset + EMBEDDING_BATCH_SIZE],
+                dimensions=self.dimensions
+            )
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return vectors
+
+    def add_document(self, client, organization_id: str, text: str, title: Optional[str] = None,
+                     document_id: Optional[str] = None) -> Dict:
+        return self.store_for(organization_id).add_document(
+            text, lambda texts: self.embed(client, texts), title=title, document_id=document_id
+        )
+
+    def delete_document(self, organization_id: str, document_id: str) -> bool:
+        return self.store_for(organization_id).delete_document(document_id)
+
+    def retrieve(self, client, organization_id: str, question: str, top_k: int = 4,
+                 min_score: float = 0.2) -> List[Dict]:
+        """Most relevant chunks for a question ([] when the organization has no documents)"""
+        store = self.store_for(organization_id)
+        if not store.stats()['chunks']:
+            return []
+
+        # The cache key is exactly the embedded text, so case differences get their own vector
+        key = normalize_prompt(question)
+        query_vector = self._query_embeddings.get(key)
+        if query_vector is MISSING:
+            query_vector = self.embed(client, [key])[0]
+            self._query_embeddings.set(key, query_vector)
+        return store.search(query_vector, top_k=top_k, min_score=min_score)
+
+
+# Shared per-process instance
+vector_store = VectorStoreService()
@@ -0,0 +1,207 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+from src.services.redis_client import get_redis, reset_redis
+
+logger = logging.getLogger(__name__)
+
+# Throughput por defecto de la Cloud API por número de teléfono (mensajes/segundo)
+DEFAULT_RATE = float(os.environ.get('WHATSAPP_RATE_PER_SECOND', 80))
+MIN_RATE = float(os.environ.get('WHATSAPP_MIN_RATE_PER_SECOND', 5))
+MAX_RATE = float(os.environ.get('WHATSAPP_MAX_RATE_PER_SECOND', DEFAULT_RATE))
+BURST_SECONDS = 1.0
+
+# Códigos de error de throttling de la Graph API
+THROUGHPUT_ERROR_CODES = {4, 80007, 130429}  # Límite de throughput del número / de la app
+PAIR_RATE_ERROR_CODES = {131056}  # Demasiados mensajes al mismo destinatario
+PAIR_RATE_RETRY_SECONDS = 6.0
+
+_KEY = 'whatsapp_rate:{phone_number_id}'
+
+# Token bucket atómico en Redis. Devuelve los milisegundos a esperar (0 = token concedido)
+_ACQUIRE_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local default_rate = tonumber(ARGV[2])
+local burst_seconds = tonumber(ARGV[3])
+local state = redis.call('HMGET', key, 'tokens', 'ts', 'rate', 'paused_until')
+local rate = tonumber(state[3]) or default_rate
+local capacity = math.max(1, rate * burst_seconds)
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+local paused_until = tonumber(state[4]) or 0
+if paused_until > now then
+    return math.ceil((paused_until - now) * 1000)
+end
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', key, 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('EXPIRE', key, 3600)
+return wait
+"""
+
+# AIMD atómico: lee, ajusta y acota el ritmo en un solo paso para que un
+# on_success concurrente no pise la reducción de un on_throttled
+_ADJUST_SCRIPT = """
+local key = KEYS[1]
+local mode = ARGV[1]
+local default_rate = tonumber(ARGV[2])
+local min_rate = tonumber(ARGV[3])
+local max_rate = tonumber(ARGV[4])
+local rate = tonumber(redis.call('HGET', key, 'rate')) or default_rate
+if mode == 'decrease' then
+    rate = rate / 2
+else
+    rate = rate + tonumber(ARGV[5])
+end
+rate = math.max(min_rate, math.min(max_rate, rate))
+redis.call('HSET', key, 'rate', rate)
+if ARGV[6] ~= '' then
+    local paused_until = tonumber(redis.call('HGET', key, 'paused_until')) or 0
+    redis.call('HSET', key, 'paused_until', math.max(paused_until, tonumber(ARGV[6])))
+end
+redis.call('EXPIRE', key, 3600)
+return tostring(rate)
+"""
+
+# Incremento aditivo por envío correcto (mensajes/segundo)
+RATE_INCREASE_STEP = 0.1
+
+
+class WhatsAppRateGovernor:
+    """
+    Regulador de envíos por phone_number_id.
+
+    Token bucket con incremento aditivo / reducción multiplicativa (AIMD):
+    cada envío correcto sube ligeramente el ritmo hasta MAX_RATE y cada
+    respuesta de throttling lo reduce a la mitad y pausa el número durante el
+    tiempo indicado por la API. El estado se comparte entre workers vía Redis y
+    cae a un bucket en memoria cuando Redis no está disponible.
+    """
+
+    def __init__(self, default_rate: float = DEFAULT_RATE, min_rate: float = MIN_RATE,
+                 max_rate: float = MAX_RATE):
+        self.default_rate = default_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._local: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._script = None
+        self._adjust_script = None
+
+    def acquire(self, phone_number_id: str, timeout: float = 60.0) -> bool:
+        """
+        Espera hasta obtener permiso para enviar un mensaje
+
+        Args:
+            phone_number_id: Número emisor de WhatsApp Business
+            timeout: Tiempo máximo de espera en segundos
+
+        Returns:
+            bool: True si se concedió el envío dentro del timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._try_acquire(phone_number_id)
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def on_success(self, phone_number_id: str):
+        """Incremento aditivo del ritmo tras un envío correcto"""
+        self._adjust(phone_number_id, 'increase')
+
+    def on_throttled(self, phone_number_id: str, retry_after: Optional[float] = None):
+        """Reducción multiplicativa del ritmo y pausa del número tras un throttling"""
+        pause_until = time.time() + (retry_after or 1.0)
+        self._adjust(phone_number_id, 'decrease', paused_until=pause_until)
+        logger.warning(f"WhatsApp throughput throttled for {phone_number_id}, backing off {retry_after or 1.0}s")
+
+    def current_rate(self, phone_number_id: str) -> float:
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                rate = redis_client.hget(_KEY.format(phone_number_id=phone_number_id), 'rate')
+                return float(rate) if rate else self.default_rate
+            except Exception:
+                reset_redis()
+        with self._lock:
+            return self._local.get(phone_number_id, {}).get('rate', self.default_rate)
+
+    def _try_acquire(self, phone_number_id: str) -> float:
+        """Intenta tomar un token; devuelve los segundos a esperar (0 si se concedió)"""
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                if self._script is None:
+                    self._script = redis_client.register_script(_ACQUIRE_SCRIPT)
+                wait_ms = self._script(
+                    keys=[_KEY.format(phone_number_id=phone_number_id)],
+                    args=[time.time(), self.default_rate, BURST_SECONDS]
+                )
+                return int(wait_ms) / 1000.0
+            except Exception as e:
+                logger.warning(f"Redis rate governor unavailable, using local bucket: {str(e)}")
+                self._script = None
+                reset_redis()
+
+        now = time.time()
+        with self._lock:
+            state = self._local.setdefault(phone_number_id, {
+                'rate': self.default_rate,
+                'tokens': self.default_rate * BURST_SECONDS,
+                'ts': now,
+                'paused_until': 0.0
+            })
+            if state['paused_until'] > now:
+                return state['paused_until'] - now
+            capacity = max(1.0, state['rate'] * BURST_SECONDS)
+            state['tokens'] = min(capacity, state['tokens'] + (now - state['ts']) * state['rate'])
+            state['ts'] = now
+            if state['tokens'] >= 1:
+                state['tokens'] -= 1
+                return 0.0
+            return (1 - state['tokens']) / state['rate']
+
+    def _adjust(self, phone_number_id: str, mode: str, paused_until: Optional[float] = None):
+        """Aplica el paso AIMD ('increase' o 'decrease') acotado a [min_rate, max_rate]"""
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                if self._adjust_script is None:
+                    self._adjust_script = redis_client.register_script(_ADJUST_SCRIPT)
+                self._adjust_script(
+                    keys=[_KEY.format(phone_number_id=phone_number_id)],
+                    args=[mode, self.default_rate, self.min_rate, self.max_rate, RATE_INCREASE_STEP,
+                          '' if paused_until is None else paused_until]
+                )
+                return
+            except Exception as e:
+                logger.warning(f"Could not update shared WhatsApp rate: {str(e)}")
+                self._adjust_script = None
+                reset_redis()
+
+        with self._lock:
+            state = self._local.setdefault(phone_number_id, {
+                'rate': self.default_rate,
+                'tokens': self.default_rate * BURST_SECONDS,
+                'ts': time.time(),
+                'paused_until': 0.0
+            })
+            rate = state['rate'] / 2 if mode == 'decrease' else state['rate'] + RATE_INCREASE_STEP
+            state['rate'] = max(self.min_rate, min(self.max_rate, rate))
+            if paused_until is not None:
+                state['paused_until'] = max(state['paused_until'], paused_until)
+
+
+# Instancia compartida por proceso
+whatsapp_rate_governor = WhatsAppRateGovernor()
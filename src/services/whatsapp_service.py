@@ -1,22 +1,79 @@
+import os
+import time
 import requests
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Optional
 from datetime import datetime
+from src.services.whatsapp_rate_governor import (
+    WhatsAppRateGovernor, whatsapp_rate_governor, PAIR_RATE_ERROR_CODES,
+    PAIR_RATE_RETRY_SECONDS, THROUGHPUT_ERROR_CODES
+)
 
 logger = logging.getLogger(__name__)
 
+# URL base de la Graph API (se puede apuntar a benchmarks/fake_graph_api.py para pruebas de carga)
+GRAPH_API_URL = os.environ.get('WHATSAPP_GRAPH_URL', 'https://graph.facebook.com').rstrip('/')
+
+# Timeout (conexión, lectura) para las llamadas a la Graph API
+REQUEST_TIMEOUT = (3.05, 10)
+
+# Reintentos máximos de un mensaje tras respuestas de throttling
+MAX_THROTTLE_RETRIES = 3
+
+# Concurrencia máxima de los envíos masivos
+BULK_MAX_WORKERS = int(os.environ.get('WHATSAPP_BULK_MAX_WORKERS', 16))
+
+# Emojis según el tipo de alerta
+ALERT_TYPE_EMOJI = {
+    'cash_threshold': '💰',
+    'battery_low': '🔋',
+    'no_show': '⚠️',
+    'off_zone': '📍',
+    'late_delivery': '⏰',
+    'emergency': '🚨'
+}
+
+# Emojis según severidad
+SEVERITY_EMOJI = {
+    'low': '🟡',
+    'medium': '🟠',
+    'high': '🔴',
+    'critical': '🚨'
+}
+
+SEVERITY_ORDER = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+
+_session = None
+
+def get_http_session() -> requests.Session:
+    """
+    Sesión HTTP compartida por proceso con pool de conexiones keep-alive a graph.facebook.com
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(BULK_MAX_WORKERS, 10))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
 class WhatsAppService:
     """
     Servicio para enviar notificaciones de WhatsApp a repartidores
     Utiliza WhatsApp Business API para alertas críticas
     """
     
-    def __init__(self, access_token: str, phone_number_id: str, version: str = "v18.0"):
+    def __init__(self, access_token: str, phone_number_id: str, version: str = "v18.0",
+                 governor: WhatsAppRateGovernor = None):
         self.access_token = access_token
         self.phone_number_id = phone_number_id
         self.version = version
-        self.base_url = f"https://graph.facebook.com/{version}/{phone_number_id}/messages"
+        self.base_url = f"{GRAPH_API_URL}/{version}/{phone_number_id}/messages"
+        self.governor = governor or whatsapp_rate_governor
         
     def send_alert_message(self, rider_phone: str, alert_data: Dict) -> bool:
         """
@@ -29,39 +86,139 @@ class WhatsAppService:
         Returns:
             bool: True si el mensaje se envió correctamente
         """
+        return self.send_alert(rider_phone, alert_data)['success']
+    
+    def send_alert(self, rider_phone: str, alert_data: Dict) -> Dict:
+        """
+        Envía una alerta de WhatsApp y devuelve el resultado detallado
+        
+        Args:
+            rider_phone: Número de teléfono del repartidor (formato internacional)
+            alert_data: Datos de la alerta
+            
+        Returns:
+            Dict: Resultado del envío, incluido el message_id asignado por WhatsApp
+        """
         try:
             message_text = self._format_alert_message(alert_data)
-            
-            payload = {
-                "messaging_product": "whatsapp",
-                "to": rider_phone,
-                "type": "text",
-                "text": {
-                    "body": message_text
-                }
+            return self._send_text(rider_phone, message_text)
+                
+        except Exception as e:
+            logger.error(f"Error sending WhatsApp alert: {str(e)}")
+            return {'success': False, 'status_code': None, 'error': str(e), 'message_id': None, 'elapsed_ms': 0.0}
+    
+    def _send_text(self, rider_phone: str, message_text: str) -> Dict:
+        """
+        Envía un mensaje de texto ya formateado
+        
+        Returns:
+            Dict: Resultado del envío (success, status_code, error, message_id, elapsed_ms)
+        """
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": rider_phone,
+            "type": "text",
+            "text": {
+                "body": message_text
             }
+        }
+        
+        result = self._post_message(payload)
+        if result['success']:
+            logger.info(f"WhatsApp alert sent successfully to {rider_phone}")
+        else:
+            logger.error(f"Failed to send WhatsApp alert: {result['error']}")
+        return result
+    
+    def _post_message(self, payload: Dict) -> Dict:
+        """
+        Hace POST de un mensaje a la Graph API usando la sesión compartida
+        
+        Args:
+            payload: Cuerpo del mensaje
             
-            headers = {
-                "Authorization": f"Bearer {self.access_token}",
-                "Content-Type": "application/json"
-            }
+        Returns:
+            Dict: Resultado del envío (success, status_code, error, message_id, elapsed_ms)
+        """
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json"
+        }
+        body = json.dumps(payload)
+        
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            # Respetar el ritmo sostenible del número emisor
+            if not self.governor.acquire(self.phone_number_id):
+                return self._result(False, None, 'Rate governor timeout', started)
             
-            response = requests.post(
-                self.base_url,
-                headers=headers,
-                data=json.dumps(payload)
-            )
+            try:
+                response = get_http_session().post(
+                    self.base_url,
+                    headers=headers,
+                    data=body,
+                    timeout=REQUEST_TIMEOUT
+                )
+            except requests.RequestException as e:
+                return self._result(False, None, str(e), started)
             
             if response.status_code == 200:
-                logger.info(f"WhatsApp alert sent successfully to {rider_phone}")
-                return True
-            else:
-                logger.error(f"Failed to send WhatsApp alert: {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error sending WhatsApp alert: {str(e)}")
-            return False
+                self.governor.on_success(self.phone_number_id)
+                return self._result(True, response.status_code, None, started, self._message_id(response))
+            
+            retry_after = self._throttle_delay(response)
+            if retry_after is None or attempt >= MAX_THROTTLE_RETRIES:
+                return self._result(False, response.status_code, response.text, started)
+            
+            # Throttling: esperar lo indicado por la API y reintentar
+            attempt += 1
+            time.sleep(retry_after)
+    
+    def _throttle_delay(self, response) -> Optional[float]:
+        """
+        Devuelve los segundos a esperar si la respuesta es un throttling, o None si es un error definitivo
+        """
+        try:
+            error_code = response.json().get('error', {}).get('code')
+        except ValueError:
+            error_code = None
+        
+        advised = response.headers.get('Retry-After')
+        try:
+            advised = float(advised) if advised else None
+        except ValueError:
+            advised = None
+        
+        if error_code in PAIR_RATE_ERROR_CODES:
+            # Límite por destinatario: no penaliza el ritmo global del número
+            return advised or PAIR_RATE_RETRY_SECONDS
+        
+        if response.status_code == 429 or error_code in THROUGHPUT_ERROR_CODES:
+            self.governor.on_throttled(self.phone_number_id, advised)
+            return advised or 1.0
+        
+        return None
+    
+    @staticmethod
+    def _message_id(response) -> Optional[str]:
+        """Extrae el ID del mensaje (wamid) de la respuesta de la Graph API"""
+        try:
+            messages = response.json().get('messages') or []
+            return messages[0].get('id') if messages else None
+        except (ValueError, AttributeError):
+            return None
+    
+    @staticmethod
+    def _result(success: bool, status_code: Optional[int], error: Optional[str], started: float,
+                message_id: Optional[str] = None) -> Dict:
+        return {
+            'success': success,
+            'status_code': status_code,
+            'error': error,
+            'message_id': message_id,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
     
     def send_template_message(self, rider_phone: str, template_name: str, parameters: List[str]) -> bool:
         """
@@ -94,22 +251,13 @@ class WhatsAppService:
                 }
             }
             
-            headers = {
-                "Authorization": f"Bearer {self.access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
-                self.base_url,
-                headers=headers,
-                data=json.dumps(payload)
-            )
+            result = self._post_message(payload)
             
-            if response.status_code == 200:
+            if result['success']:
                 logger.info(f"WhatsApp template message sent to {rider_phone}")
                 return True
             else:
-                logger.error(f"Failed to send template message: {response.text}")
+                logger.error(f"Failed to send template message: {result['error']}")
                 return False
                 
         except Exception as e:
@@ -131,26 +279,8 @@ class WhatsAppService:
         title = alert_data.get('title', 'Alerta')
         description = alert_data.get('description', '')
         
-        # Emojis según el tipo de alerta
-        emoji_map = {
-            'cash_threshold': '💰',
-            'battery_low': '🔋',
-            'no_show': '⚠️',
-            'off_zone': '📍',
-            'late_delivery': '⏰',
-            'emergency': '🚨'
-        }
-        
-        # Emojis según severidad
-        severity_emoji = {
-            'low': '🟡',
-            'medium': '🟠', 
-            'high': '🔴',
-            'critical': '🚨'
-        }
-        
-        emoji = emoji_map.get(alert_type, '⚠️')
-        sev_emoji = severity_emoji.get(severity, '🟠')
+        emoji = ALERT_TYPE_EMOJI.get(alert_type, '⚠️')
+        sev_emoji = SEVERITY_EMOJI.get(severity, '🟠')
         
         message = f"{emoji} *ALERTA LOGINEXIA* {sev_emoji}\n\n"
         message += f"*{title}*\n"
@@ -160,6 +290,54 @@ class WhatsAppService:
         
         return message
     
+    def _format_digest_message(self, alerts_data: List[Dict]) -> str:
+        """
+        Formatea varias alertas de un mismo repartidor en un único mensaje
+        
+        Args:
+            alerts_data: Datos de las alertas, en cualquier orden
+            
+        Returns:
+            str: Mensaje formateado
+        """
+        if len(alerts_data) == 1:
+            return self._format_alert_message(alerts_data[0])
+        
+        # Las más graves primero
+        ordered = sorted(alerts_data, key=lambda a: SEVERITY_ORDER.get(a.get('severity'), 0), reverse=True)
+        top_severity = ordered[0].get('severity', 'medium')
+        
+        message = f"🚨 *ALERTAS LOGINEXIA* {SEVERITY_EMOJI.get(top_severity, '🟠')}\n"
+        message += f"Tienes {len(ordered)} alertas activas:\n\n"
+        for alert_data in ordered:
+            emoji = ALERT_TYPE_EMOJI.get(alert_data.get('alert_type', 'unknown'), '⚠️')
+            sev_emoji = SEVERITY_EMOJI.get(alert_data.get('severity', 'medium'), '🟠')
+            message += f"{emoji} {sev_emoji} *{alert_data.get('title', 'Alerta')}*\n"
+            if alert_data.get('description'):
+                message += f"{alert_data['description']}\n"
+            message += "\n"
+        message += f"📅 {datetime.now().strftime('%d/%m/%Y %H:%M')}\n"
+        message += "🔗 Revisa tu dashboard para más detalles"
+        
+        return message
+    
+    def send_alert_digest(self, rider_phone: str, alerts_data: List[Dict]) -> Dict:
+        """
+        Envía en un solo mensaje todas las alertas pendientes de un repartidor
+        
+        Args:
+            rider_phone: Número de teléfono del repartidor
+            alerts_data: Datos de las alertas a agrupar
+            
+        Returns:
+            Dict: Resultado del envío, incluido el message_id asignado por WhatsApp
+        """
+        try:
+            return self._send_text(rider_phone, self._format_digest_message(alerts_data))
+        except Exception as e:
+            logger.error(f"Error sending WhatsApp alert digest: {str(e)}")
+            return {'success': False, 'status_code': None, 'error': str(e), 'message_id': None, 'elapsed_ms': 0.0}
+    
     def send_bulk_alerts(self, riders_phones: List[str], alert_data: Dict) -> Dict[str, bool]:
         """
         Envía alertas a múltiples repartidores
@@ -171,12 +349,56 @@ class WhatsAppService:
         Returns:
             Dict[str, bool]: Resultado del envío por cada número
         """
-        results = {}
+        bulk_result = self.send_bulk_alerts_concurrent(riders_phones, alert_data)
+        return {phone: result['success'] for phone, result in bulk_result['results'].items()}
+    
+    def send_bulk_alerts_concurrent(self, riders_phones: List[str], alert_data: Dict,
+                                    max_workers: int = BULK_MAX_WORKERS) -> Dict:
+        """
+        Envía la misma alerta a múltiples repartidores con concurrencia acotada
         
-        for phone in riders_phones:
-            results[phone] = self.send_alert_message(phone, alert_data)
+        Args:
+            riders_phones: Lista de números de teléfono
+            alert_data: Datos de la alerta
+            max_workers: Número máximo de envíos simultáneos
             
-        return results
+        Returns:
+            Dict: 'results' con el resultado por número y 'stats' con los tiempos
+        """
+        started = time.perf_counter()
+        phones = list(dict.fromkeys(riders_phones))  # Sin duplicados, conservando el orden
+        message_text = self._format_alert_message(alert_data)
+        
+        def send(phone):
+            try:
+                return phone, self._send_text(phone, message_text)
+            except Exception as e:
+                logger.error(f"Error sending WhatsApp alert to {phone}: {str(e)}")
+                return phone, {'success': False, 'status_code': None, 'error': str(e),
+                               'message_id': None, 'elapsed_ms': 0.0}
+        
+        results = {}
+        if phones:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(phones)))) as executor:
+                for phone, result in executor.map(send, phones):
+                    results[phone] = result
+        
+        latencies = sorted(result['elapsed_ms'] for result in results.values())
+        successful = sum(1 for result in results.values() if result['success'])
+        elapsed = time.perf_counter() - started
+        
+        return {
+            'results': results,
+            'stats': {
+                'total': len(phones),
+                'successful': successful,
+                'failed': len(phones) - successful,
+                'elapsed_ms': round(elapsed * 1000, 1),
+                'messages_per_second': round(len(phones) / elapsed, 2) if elapsed > 0 else None,
+                'latency_p50_ms': latencies[len(latencies) // 2] if latencies else None,
+                'latency_max_ms': latencies[-1] if latencies else None
+            }
+        }
     
     def get_message_status(self, message_id: str) -> Optional[Dict]:
         """
@@ -189,12 +411,12 @@ class WhatsAppService:
             Dict: Estado del mensaje o None si hay error
         """
         try:
-            url = f"https://graph.facebook.com/{self.version}/{message_id}"
+            url = f"{GRAPH_API_URL}/{self.version}/{message_id}"
             headers = {
                 "Authorization": f"Bearer {self.access_token}"
             }
             
-            response = requests.get(url, headers=headers)
+            response = get_http_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
             
             if response.status_code == 200:
                 return response.json()
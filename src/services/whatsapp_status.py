@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.models.user import db
+from src.models.support import Alert
+from src.services.redis_client import get_redis, reset_redis
+
+logger = logging.getLogger(__name__)
+
+# Orden de los estados de entrega: un callback nunca hace retroceder el estado
+STATUS_RANK = {
+    'sent': 1,
+    'delivered': 2,
+    'read': 3,
+    'failed': 4,
+}
+
+FLUSH_BATCH_SIZE = int(os.environ.get('WHATSAPP_STATUS_BATCH_SIZE', 200))
+FLUSH_MAX_DELAY_SECONDS = float(os.environ.get('WHATSAPP_STATUS_MAX_DELAY', 5))
+
+# Un lote reclamado y no confirmado en este tiempo (worker caído) vuelve al búfer
+CLAIM_TIMEOUT_SECONDS = int(os.environ.get('WHATSAPP_STATUS_CLAIM_TIMEOUT', 300))
+
+_BUFFER_KEY = 'whatsapp_status_buffer'
+_PROCESSING_PREFIX = 'whatsapp_status_buffer:processing:'
+_CLAIMS_KEY = 'whatsapp_status_buffer:claims'
+
+
+class WhatsAppStatusBuffer:
+    """
+    Acumula los callbacks de estado de WhatsApp y los aplica a Alert.whatsapp_status
+    en UPDATEs por lotes (una transacción por lote) indexados por whatsapp_message_id.
+
+    El búfer vive en una lista de Redis compartida entre workers; sin Redis se
+    usa una lista en memoria del proceso. Cada lote se mueve a una lista de
+    procesamiento propia y solo se borra tras el commit: si la BD falla el lote
+    vuelve al búfer, y si el worker muere lo recupera el siguiente flush.
+    """
+
+    def __init__(self, batch_size: int = FLUSH_BATCH_SIZE, max_delay: float = FLUSH_MAX_DELAY_SECONDS):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._local: List[Dict] = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def add(self, statuses: Iterable[Dict]) -> int:
+        """
+        Añade callbacks al búfer y lo vacía si se alcanza el tamaño o la antigüedad máxima
+
+        Args:
+            statuses: Objetos {'id', 'status', 'timestamp'} del webhook de WhatsApp
+
+        Returns:
+            int: Número de filas actualizadas si se vació el búfer, 0 si no
+        """
+        entries = [
+            {'id': status['id'], 'status': status['status']}
+            for status in statuses
+            if status.get('id') and status.get('status') in STATUS_RANK
+        ]
+        if not entries:
+            return 0
+
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                size = redis_client.rpush(_BUFFER_KEY, *[json.dumps(entry) for entry in entries])
+                if size >= self.batch_size:
+                    return self.flush()
+                return 0
+            except Exception as e:
+                logger.warning(f"Could not buffer WhatsApp statuses in Redis: {str(e)}")
+                reset_redis()
+
+        with self._lock:
+            if not self._local:
+                self._oldest = time.monotonic()
+            self._local.extend(entries)
+            should_flush = (
+                len(self._local) >= self.batch_size or
+                time.monotonic() - self._oldest >= self.max_delay
+            )
+        return self.flush() if should_flush else 0
+
+    def flush(self) -> int:
+        """Aplica todos los estados pendientes del búfer; devuelve las filas actualizadas"""
+        self._recover_stale_claims()
+        updated = 0
+        while True:
+            entries, claim = self._take(self.batch_size)
+            if not entries:
+                return updated
+            try:
+                updated += self._apply(entries)
+            except Exception:
+                self._release(entries, claim)
+                raise
+            self._ack(claim)
+
+    def _take(self, count: int) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Reclama hasta count entradas; devuelve (entradas, clave de la lista de
+        procesamiento en Redis o None si vienen del búfer local)
+        """
+        redis_client = get_redis()
+        if redis_client is not None:
+            claim = f"{_PROCESSING_PREFIX}{uuid.uuid4().hex}"
+            try:
+                # LMOVE en una transacción: las entradas nunca están fuera de Redis
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.zadd(_CLAIMS_KEY, {claim: time.time()})
+                for _ in range(count):
+                    pipe.lmove(_BUFFER_KEY, claim, 'LEFT', 'RIGHT')
+                raw = [item for item in pipe.execute()[1:] if item is not None]
+                if raw:
+                    return [json.loads(item) for item in raw], claim
+                redis_client.zrem(_CLAIMS_KEY, claim)
+            except Exception as e:
+                logger.warning(f"Could not read WhatsApp status buffer from Redis: {str(e)}")
+                reset_redis()
+
+        with self._lock:
+            entries = self._local[:count]
+            del self._local[:count]
+            self._oldest = time.monotonic() if self._local else None
+        return entries, None
+
+    def _ack(self, claim: Optional[str]):
+        """Borra el lote ya aplicado de su lista de procesamiento"""
+        if claim is None:
+            return
+        redis_client = get_redis()
+        if redis_client is None:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.delete(claim)
+            pipe.zrem(_CLAIMS_KEY, claim)
+            pipe.execute()
+        except Exception as e:
+            # El lote se reaplicará tras el timeout; los estados nunca retroceden
+            logger.warning(f"Could not acknowledge WhatsApp status batch {claim}: {str(e)}")
+            reset_redis()
+
+    def _release(self, entries: List[Dict], claim: Optional[str]):
+        """Devuelve al búfer un lote que no se pudo aplicar"""
+        if claim is None:
+            with self._lock:
+                self._local[:0] = entries
+                self._oldest = self._oldest or time.monotonic()
+            return
+        redis_client = get_redis()
+        if redis_client is None or not self._requeue(redis_client, claim):
+            logger.warning(f"WhatsApp status batch {claim} will be retried after the claim timeout")
+
+    @staticmethod
+    def _requeue(redis_client, claim: str) -> bool:
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            for _ in range(redis_client.llen(claim)):
+                pipe.lmove(claim, _BUFFER_KEY, 'RIGHT', 'LEFT')
+            pipe.delete(claim)
+            pipe.zrem(_CLAIMS_KEY, claim)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Could not requeue WhatsApp status batch {claim}: {str(e)}")
+            reset_redis()
+            return False
+
+    def _recover_stale_claims(self):
+        """Devuelve al búfer los lotes reclamados por workers que no llegaron a confirmarlos"""
+        redis_client = get_redis()
+        if redis_client is None:
+            return
+        try:
+            stale = redis_client.zrangebyscore(_CLAIMS_KEY, '-inf', time.time() - CLAIM_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.warning(f"Could not list WhatsApp status claims: {str(e)}")
+            reset_redis()
+            return
+        for claim in stale:
+            claim = claim.decode() if isinstance(claim, bytes) else claim
+            if self._requeue(redis_client, claim):
+                logger.warning(f"Requeued stale WhatsApp status batch {claim}")
+
+    @staticmethod
+    def _apply(entries: List[Dict]) -> int:
+        # Quedarse con el estado más avanzado de cada mensaje dentro del lote
+        latest: Dict[str, str] = {}
+        for entry in entries:
+            current = latest.get(entry['id'])
+            if current is None or STATUS_RANK[entry['status']] > STATUS_RANK[current]:
+                latest[entry['id']] = entry['status']
+
+        by_status = defaultdict(list)
+        for message_id, status in latest.items():
+            by_status[status].append(message_id)
+
+        updated = 0
+        try:
+            for status, message_ids in by_status.items():
+                lower_statuses = [name for name, rank in STATUS_RANK.items() if rank < STATUS_RANK[status]]
+                result = (
+                    Alert.query
+                    .filter(Alert.whatsapp_message_id.in_(message_ids))
+                    .filter(db.or_(Alert.whatsapp_status.is_(None), Alert.whatsapp_status.in_(lower_statuses)))
+                    .update({Alert.whatsapp_status: status}, synchronize_session=False)
+                )
+                updated += result
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error applying WhatsApp status batch: {str(e)}")
+            raise
+
+        logger.info(f"Applied {len(latest)} WhatsApp status callbacks ({updated} alerts updated)")
+        return updated
+
+
+def extract_statuses(payload: Dict) -> List[Dict]:
+    """Extrae la lista de estados de un payload de webhook de WhatsApp Cloud API"""
+    statuses = []
+    for entry in payload.get('entry', []):
+        for change in entry.get('changes', []):
+            statuses.extend(change.get('value', {}).get('statuses', []))
+    return statuses
+
+
+# Instancia compartida por proceso
+whatsapp_status_buffer = WhatsAppStatusBuffer()
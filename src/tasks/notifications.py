@@ -0,0 +1,198 @@
+import logging
+from src.celery_app import celery, CRITICAL_QUEUE, DEFAULT_QUEUE
+from src.models.user import db
+from src.models.support import Alert
+from src.services.redis_client import get_redis, reset_redis
+
+logger = logging.getLogger(__name__)
+
+# Prioridad por severidad (en el transporte Redis de Celery 0 es la más alta)
+SEVERITY_PRIORITY = {
+    'critical': 0,
+    'high': 3,
+}
+
+_ENQUEUED_KEY = 'notification:enqueued:{alert_id}'
+_ENQUEUED_TTL_SECONDS = 3600
+
+
+class NotificationDeliveryError(Exception):
+    """Fallo transitorio de envío: la tarea se reintenta con backoff"""
+
+
+def enqueue_alert_notification(alert: Alert) -> bool:
+    """
+    Encola el envío por WhatsApp de una alerta crítica o de alta severidad
+
+    La clave de idempotencia evita encolar dos veces la misma alerta mientras
+    la primera tarea sigue pendiente.
+
+    Args:
+        alert: Objeto Alert ya persistido
+
+    Returns:
+        bool: True si se encoló, False si ya estaba encolada
+    """
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            key = _ENQUEUED_KEY.format(alert_id=alert.id)
+            if not redis_client.set(key, '1', nx=True, ex=_ENQUEUED_TTL_SECONDS):
+                logger.info(f"Alert {alert.id} notification already enqueued")
+                return False
+        except Exception as e:
+            logger.warning(f"Could not set idempotency key for alert {alert.id}: {str(e)}")
+            reset_redis()
+
+    from src.services.alert_digest import DIGEST_WINDOW_SECONDS
+
+    # Las alertas no críticas esperan la ventana de agrupación para salir en un solo mensaje
+    send_alert_notification.apply_async(
+        args=[alert.id],
+        queue=CRITICAL_QUEUE if alert.severity == 'critical' else DEFAULT_QUEUE,
+        priority=SEVERITY_PRIORITY.get(alert.severity, 6),
+        countdown=0 if alert.severity == 'critical' else DIGEST_WINDOW_SECONDS
+    )
+    return True
+
+
+def _release_idempotency_key(alert_id: str):
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.delete(_ENQUEUED_KEY.format(alert_id=alert_id))
+        except Exception:
+            reset_redis()
+
+
+@celery.task(
+    bind=True,
+    autoretry_for=(NotificationDeliveryError,),
+    retry_backoff=5,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=8,
+    acks_late=True
+)
+def send_alert_notification(self, alert_id: str):
+    """
+    Envía la notificación de WhatsApp de una alerta (idempotente: no reenvía alertas ya enviadas)
+
+    Las demás alertas pendientes del mismo repartidor se incluyen en el mismo mensaje.
+    """
+    from src.services.alert_automation import DELIVERY_FAILED
+    from src.services.alert_digest import AlertDigestService
+
+    alert = Alert.query.get(alert_id)
+    if alert is None:
+        logger.warning(f"Alert {alert_id} not found, dropping notification task")
+        _release_idempotency_key(alert_id)
+        return 'missing'
+    if alert.outbox_pending:
+        # La notificación es del relay del outbox: enviarla aquí la duplicaría
+        _release_idempotency_key(alert_id)
+        return 'outbox'
+
+    try:
+        result = AlertDigestService.dispatch(alert_id)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if result == DELIVERY_FAILED:
+        if self.request.retries >= self.max_retries:
+            _release_idempotency_key(alert_id)
+        raise NotificationDeliveryError(f"WhatsApp delivery failed for alert {alert_id}")
+
+    _release_idempotency_key(alert_id)
+    return result
+
+
+@celery.task
+def process_pending_alerts(organization_id: str = None, min_age_seconds: int = 300):
+    """
+    Barrido periódico de alertas pendientes que no llegaron a enviarse por su tarea
+
+    Solo toca alertas con más de min_age_seconds para no competir con las tareas en curso.
+    """
+    from src.services.pending_alert_processor import PendingAlertProcessor
+
+    processor = PendingAlertProcessor(min_age_seconds=min_age_seconds)
+    if organization_id:
+        return processor.process_organization(organization_id)
+    return processor.process_all()
+
+
+@celery.task
+def refresh_rider_directory():
+    """Sincroniza el directorio de contactos con el listado de repartidores de cada organización"""
+    from src.models.organization import Organization, APIConfiguration
+    from src.services.rider_directory import rider_directory
+
+    organization_ids = [
+        row[0] for row in APIConfiguration.query.with_entities(APIConfiguration.organization_id)
+        .filter_by(api_type='rider_external', is_active=True).distinct().all()
+    ]
+
+    results = {}
+    for organization_id in organization_ids:
+        try:
+            results[organization_id] = rider_directory.refresh(Organization.query.get(organization_id))
+        except Exception as e:
+            logger.error(f"Error refreshing rider directory for organization {organization_id}: {str(e)}")
+            results[organization_id] = {'error': str(e)}
+    return results
+
+
+@celery.task
+def refresh_analytics_store():
+    """Alimenta la base de analítica local: alertas nuevas o cambiadas y una instantánea por ciudad conocida"""
+    from src.models.organization import Organization, APIConfiguration
+    from src.models.support import RiderContact
+    from src.services.analytics_store import analytics_store
+    from src.services.rider_service import RiderExternalService
+
+    results = {'alerts': analytics_store.sync_alerts()}
+
+    organization_ids = [
+        row[0] for row in APIConfiguration.query.with_entities(APIConfiguration.organization_id)
+        .filter_by(api_type='rider_external', is_active=True).distinct().all()
+    ]
+    for organization_id in organization_ids:
+        # Ciudades ya vistas en el directorio de repartidores o en alertas
+        city_ids = {
+            row[0] for query in (
+                RiderContact.query.with_entities(RiderContact.city_id).filter_by(organization_id=organization_id),
+                Alert.query.with_entities(Alert.city_id).filter_by(organization_id=organization_id)
+            ) for row in query.distinct().all() if row[0]
+        }
+        rider_service = RiderExternalService(Organization.query.get(organization_id))
+        riders = 0
+        for city_id in city_ids:
+            try:
+                counts = analytics_store.ingest_snapshot(
+                    organization_id, city_id,
+                    rider_service.get_live_riders(city_id),
+                    rider_service.get_companies_overview(city_id)
+                )
+                riders += counts['riders']
+            except Exception as e:
+                logger.error(f"Error refreshing analytics for organization {organization_id}, city {city_id}: {str(e)}")
+        results[organization_id] = {'cities': len(city_ids), 'riders': riders}
+    return results
+
+
+@celery.task
+def reconcile_alert_counters():
+    """Reparación periódica de los contadores materializados de alertas"""
+    from src.services.alert_counters import AlertCounterService
+
+    return AlertCounterService.reconcile()
+
+
+@celery.task
+def flush_whatsapp_statuses():
+    """Aplica los callbacks de estado de WhatsApp que quedan en el búfer"""
+    from src.services.whatsapp_status import whatsapp_status_buffer
+
+    return whatsapp_status_buffer.flush()
@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Unreachable Redis: services fall back to their in-process state
+os.environ.setdefault('REDIS_URL', 'redis://127.0.0.1:1/0')
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Minimal app with a file-backed SQLite database (shared across threads and connections)"""
+    from src.models.user import db
+    import src.models.organization  # noqa: F401  (register tables)
+    import src.models.support  # noqa: F401
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        REDIS_URL=os.environ['REDIS_URL'],
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def db_session(app):
+    from src.models.user import db
+    return db.session
@@ -0,0 +1,43 @@
+from src.services.ai_cache import AIResponseCache, normalize_prompt
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'answer': f"answer {self.calls}"}
+
+
+def test_normalization_keeps_case():
+    assert normalize_prompt('  Riders  in   Madrid?? ') == 'Riders in Madrid'
+    assert normalize_prompt("WHERE name = 'Ana'") != normalize_prompt("where name = 'ana'")
+
+
+def test_whitespace_and_trailing_punctuation_share_an_entry():
+    cache, compute = AIResponseCache(), Counter()
+    cache.cached_call('org-1', 'query_knowledge_base', 'Who is late?', compute, context='docs')
+    result = cache.cached_call('org-1', 'query_knowledge_base', ' Who  is late ', compute, context='docs')
+
+    assert compute.calls == 1
+    assert result['cached'] is True
+
+
+def test_case_of_question_and_context_is_significant():
+    cache, compute = AIResponseCache(), Counter()
+    cache.cached_call('org-1', 'generate_sql_from_nl', "riders named 'Ana'", compute, context='schema')
+    cache.cached_call('org-1', 'generate_sql_from_nl', "riders named 'ana'", compute, context='schema')
+    cache.cached_call('org-1', 'generate_sql_from_nl', "riders named 'Ana'", compute, context='SCHEMA')
+    cache.cached_call('org-1', 'generate_sql_from_nl', "riders named 'Ana'", compute, context='schema ')
+
+    assert compute.calls == 4
+
+
+def test_lookup_and_store_use_the_same_key_as_cached_call():
+    cache = AIResponseCache()
+    cache.store('org-1', 'query_knowledge_base', 'Cash policy?', {'answer': 'x'}, 'Context A')
+
+    assert cache.lookup('org-1', 'query_knowledge_base', 'Cash policy', 'Context A')['answer'] == 'x'
+    assert cache.lookup('org-1', 'query_knowledge_base', 'Cash policy', 'context a') is None
+    assert cache.lookup('org-2', 'query_knowledge_base', 'Cash policy', 'Context A') is None
@@ -0,0 +1,35 @@
+import time
+from src.routes import ai as ai_routes
+
+
+class FakeAIService:
+    def __init__(self):
+        self.timeouts = []
+
+    def with_timeout(self, seconds):
+        self.timeouts.append(seconds)
+        return self
+
+    def generate_recommendations(self, rider_data, **kwargs):
+        return {'recommendations': [], 'type': kwargs['recommendation_type']}
+
+
+def test_ai_calls_get_the_remaining_deadline_as_timeout():
+    service = FakeAIService()
+    deadline = time.monotonic() + 5
+    future = ai_routes._submit_ai_call(service, deadline, 'generate_recommendations', {},
+                                       recommendation_type='performance')
+
+    assert ai_routes._result_before(future, deadline) == ({'recommendations': [], 'type': 'performance'}, None)
+    assert 0 < service.timeouts[0] <= 5
+
+
+def test_ai_calls_queued_past_the_deadline_are_not_started():
+    service = FakeAIService()
+    deadline = time.monotonic() - 1
+    future = ai_routes._submit_ai_call(service, deadline, 'generate_recommendations', {},
+                                       recommendation_type='performance')
+    future.exception(timeout=5)
+
+    assert ai_routes._result_before(future, deadline) == (None, ai_routes.TIMED_OUT)
+    assert service.timeouts == []
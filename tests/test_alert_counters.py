@@ -0,0 +1,59 @@
+import logging
+import threading
+from src.models.support import Alert, AlertCounter
+from src.services.alert_counters import AlertCounterService, _apply_delta, register_alert_counter_listeners
+
+KEY = ('org-1', 'madrid', 'cash_threshold', 'high', 'active')
+
+
+def _add_alerts(app, count):
+    from src.models.user import db
+    with app.app_context():
+        for _ in range(count):
+            db.session.add(Alert(organization_id='org-1', city_id='madrid', alert_type='cash_threshold',
+                                 severity='high', title='Cash'))
+            db.session.commit()
+        db.session.remove()
+
+
+def test_concurrent_first_inserts_share_one_counter_row(app, db_session):
+    register_alert_counter_listeners()
+    threads = [threading.Thread(target=_add_alerts, args=(app, 10)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters = AlertCounter.query.filter_by(organization_id='org-1').all()
+    assert [counter.count for counter in counters] == [60]
+    assert AlertCounterService.reconcile('org-1')['repaired'] == 0
+
+
+def test_increment_of_an_existing_key_is_an_upsert(db_session):
+    connection = db_session.connection()
+    _apply_delta(connection, KEY, 1)
+    _apply_delta(connection, KEY, 2)
+    db_session.commit()
+
+    assert [counter.count for counter in AlertCounter.query.all()] == [3]
+
+
+def test_decrement_of_a_missing_counter_is_logged(db_session, caplog):
+    with caplog.at_level(logging.WARNING, logger='src.services.alert_counters'):
+        _apply_delta(db_session.connection(), KEY, -1)
+    db_session.commit()
+
+    assert AlertCounter.query.count() == 0
+    assert 'missing on decrement' in caplog.text
+
+
+def test_seed_reconciles_alerts_created_before_the_counters(db_session):
+    db_session.add(Alert(organization_id='org-1', city_id='madrid', alert_type='cash_threshold',
+                         severity='high', title='Cash'))
+    # Alerts written before the alert_counters table existed
+    AlertCounter.query.delete()
+    db_session.commit()
+
+    assert AlertCounterService.seed() is True
+    assert [counter.count for counter in AlertCounter.query.all()] == [1]
+    assert AlertCounterService.seed() is False
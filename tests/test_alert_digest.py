@@ -0,0 +1,22 @@
+from datetime import datetime
+from src.models.support import Alert
+from src.services.alert_digest import AlertDigestService
+
+
+def _alert(db_session, **fields):
+    alert = Alert(organization_id='org-1', alert_type='cash_threshold', title='Cash', severity='high',
+                  created_at=datetime.utcnow(), **fields)
+    db_session.add(alert)
+    db_session.commit()
+    return alert
+
+
+def test_pending_alerts_of_the_rider_are_collected_by_id_or_phone(db_session):
+    without_phone = _alert(db_session, rider_id='r1')
+    same_phone = _alert(db_session, rider_id='r9', rider_phone='+34600000001')
+    other_rider = _alert(db_session, rider_id='r2', rider_phone='+34600000002')
+    trigger = _alert(db_session, rider_id='r1', rider_phone='+34600000001')
+
+    collected = {alert.id for alert in AlertDigestService.collect_pending(trigger)}
+    assert collected == {trigger.id, without_phone.id, same_phone.id}
+    assert other_rider.id not in collected
@@ -0,0 +1,28 @@
+from src.services.alert_events import AlertEventBus, ALERT_RAISED
+
+
+def test_resume_from_current_id_replays_only_later_events(app):
+    bus = AlertEventBus()
+    bus.publish('org-1', ALERT_RAISED, {'id': 'before'})
+    cursor = bus.current_id('org-1')
+    bus.publish('org-1', ALERT_RAISED, {'id': 'after'})
+    bus.publish('org-2', ALERT_RAISED, {'id': 'other-org'})
+
+    events = bus.subscribe('org-1', cursor, heartbeat=0.01)
+    event_id, event_type, payload = next(events)
+
+    assert event_type == ALERT_RAISED
+    assert '"after"' in payload
+    # Nothing else for this organization: the next item is a keep-alive
+    assert next(events) is None
+    events.close()
+
+
+def test_current_id_of_a_quiet_bus_resumes_from_the_start(app):
+    bus = AlertEventBus()
+    cursor = bus.current_id('org-1')
+    bus.publish('org-1', ALERT_RAISED, {'id': 'first'})
+
+    events = bus.subscribe('org-1', cursor, heartbeat=0.01)
+    assert '"first"' in next(events)[2]
+    events.close()
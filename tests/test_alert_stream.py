@@ -0,0 +1,64 @@
+import pytest
+from src.models.organization import Organization
+from src.models.user import User
+from src.routes import alerts as alerts_routes
+from src.services.auth_service import AuthService, STREAM_TOKEN_COOKIE
+
+
+@pytest.fixture
+def client(app, db_session, monkeypatch):
+    from src.routes.alerts import alerts_bp
+    app.config['SECRET_KEY'] = 'test-secret-key-with-at-least-32-bytes'
+    app.register_blueprint(alerts_bp, url_prefix='/api/alerts')
+    monkeypatch.setattr(alerts_routes, 'SSE_ALLOW_LOCAL_BUS', True)
+    return app.test_client()
+
+
+@pytest.fixture
+def user(db_session):
+    organization = Organization(name='Fleet')
+    db_session.add(organization)
+    db_session.flush()
+    user = User(organization_id=organization.id, email='ops@example.com', password_hash='x')
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _bearer(user):
+    return {'Authorization': f"Bearer {AuthService.generate_tokens(user)['access_token']}"}
+
+
+def test_event_source_connects_with_a_stream_token(client, user):
+    issued = client.post('/api/alerts/stream-token', headers=_bearer(user))
+    assert issued.status_code == 200
+    token = issued.get_json()['stream_token']
+
+    response = client.get(f"/api/alerts/stream?stream_token={token}", buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    response.close()
+
+
+def test_event_source_connects_with_the_stream_cookie(client, user):
+    client.post('/api/alerts/stream-token', headers=_bearer(user))
+    assert client.get_cookie(STREAM_TOKEN_COOKIE, path='/api/alerts/stream') is not None
+
+    response = client.get('/api/alerts/stream', buffered=False)
+    assert response.status_code == 200
+    response.close()
+
+
+def test_stream_tokens_are_not_access_tokens(client, user):
+    token = client.post('/api/alerts/stream-token', headers=_bearer(user)).get_json()['stream_token']
+    response = client.get('/api/alerts/counts', headers={'Authorization': f"Bearer {token}"})
+    assert response.status_code == 401
+
+    access_token = AuthService.generate_tokens(user)['access_token']
+    assert client.get(f"/api/alerts/stream?stream_token={access_token}").status_code == 401
+
+
+def test_stream_is_refused_without_redis_unless_single_worker(client, user, monkeypatch):
+    monkeypatch.setattr(alerts_routes, 'SSE_ALLOW_LOCAL_BUS', False)
+    response = client.get('/api/alerts/stream', headers=_bearer(user))
+    assert response.status_code == 503
@@ -0,0 +1,97 @@
+import pytest
+from types import SimpleNamespace
+from src.models.support import Alert
+from src.services import alert_suppression
+from src.services.alert_suppression import AlertSuppressionService
+from src.services.rider_service import RiderAnalyticsService
+
+
+class FakeRiderService:
+    organization = SimpleNamespace(id='org-1')
+
+    def __init__(self, riders):
+        self.riders = riders
+
+    def get_live_riders(self, city_id):
+        return {'riders': self.riders}
+
+
+def test_detection_uses_the_alert_rule_thresholds(app):
+    riders = [
+        {'id': 1, 'cash_amount': 120, 'battery_level': 20},
+        {'id': 2, 'status': 'LATE', 'late_duration_minutes': 30, 'battery_level': 19},
+        {'id': 3, 'status': 'LATE', 'late_duration_minutes': 31, 'cash_amount': None},
+    ]
+    alerts = RiderAnalyticsService(FakeRiderService(riders)).detect_alerts('madrid')
+    assert sorted((a['rider_id'], a['type']) for a in alerts) == [
+        (1, 'cash_threshold'), (2, 'battery_low'), (3, 'no_show')
+    ]
+
+    # Changing the configured rules moves detection too
+    rules = dict(alert_suppression.DEFAULT_SUPPRESSION_RULES)
+    rules['cash_threshold'] = dict(rules['cash_threshold'], enter=150, exit=140)
+    app.config['ALERT_SUPPRESSION_RULES'] = rules
+    alerts = RiderAnalyticsService(FakeRiderService(riders)).detect_alerts('madrid')
+    assert 'cash_threshold' not in {a['type'] for a in alerts}
+
+
+def test_resolving_an_alert_resets_its_suppression_state(app, db_session, monkeypatch):
+    from src.routes import alerts as alerts_routes
+    suppressor = AlertSuppressionService(cooldown_seconds=3600)
+    monkeypatch.setattr(alerts_routes, 'alert_suppressor', suppressor)
+    monkeypatch.setattr(alert_suppression, 'get_redis', lambda: None)
+
+    assert suppressor.evaluate('org-1', 'r1', 'cash_threshold', 130).notify
+    suppressor.evaluate('org-1', 'r1', 'cash_threshold', 100)
+    # Inside the cool-down a new crossing is suppressed
+    assert not suppressor.evaluate('org-1', 'r1', 'cash_threshold', 130).notify
+    suppressor.evaluate('org-1', 'r1', 'cash_threshold', 100)
+
+    alert = Alert(organization_id='org-1', alert_type='cash_threshold', title='Cash', rider_id='r1')
+    db_session.add(alert)
+    db_session.commit()
+    with app.test_request_context():
+        response, status = alerts_routes.resolve_alert.__wrapped__(SimpleNamespace(organization_id='org-1'), alert.id)
+    assert status == 200
+
+    assert suppressor.evaluate('org-1', 'r1', 'cash_threshold', 130).notify
+
+
+class CountingRedis:
+    def __init__(self, client):
+        self.client = client
+        self.reads = 0
+
+    def hget(self, *args):
+        self.reads += 1
+        return self.client.hget(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _shared_redis(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    client = CountingRedis(fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(alert_suppression, 'get_redis', lambda: client)
+    return client
+
+
+def test_redis_misses_are_cached_locally(monkeypatch):
+    client = _shared_redis(monkeypatch)
+    suppressor = AlertSuppressionService(sync_seconds=60)
+
+    for _ in range(5):
+        assert not suppressor.evaluate('org-1', 'r1', 'cash_threshold', 100).active
+    assert client.reads == 1
+
+
+def test_local_entries_resync_with_redis(monkeypatch):
+    _shared_redis(monkeypatch)
+    worker_a = AlertSuppressionService(cooldown_seconds=3600, sync_seconds=0)
+    worker_b = AlertSuppressionService(cooldown_seconds=3600, sync_seconds=0)
+
+    assert worker_a.evaluate('org-1', 'r1', 'cash_threshold', 130).notify
+    # Another worker resolves the alert: worker A picks up the reset from Redis
+    worker_b.reset('org-1', 'r1', 'cash_threshold')
+    assert worker_a.evaluate('org-1', 'r1', 'cash_threshold', 130).notify
@@ -0,0 +1,52 @@
+import pytest
+from src.services.analytics_store import AnalyticsStore, AnalyticsQueryError
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnalyticsStore(str(tmp_path / 'analytics.db'))
+    store.ingest_snapshot('org-a', 'madrid', [{'id': 1, 'status': 'WORKING', 'cash_amount': 50.0}],
+                          [{'id': 'c1', 'name': 'Acme'}])
+    store.ingest_snapshot('org-b', 'madrid', [{'id': 2, 'status': 'WORKING', 'cash_amount': 900.0},
+                                              {'id': 3, 'status': 'BREAK'}])
+    return store
+
+
+def test_queries_only_see_the_callers_organization(store):
+    result = store.execute('org-a', 'SELECT organization_id, id, cash_amount FROM riders')
+    assert result['rows'] == [['org-a', '1', 50.0]]
+
+    joined = store.execute('org-b', 'SELECT COUNT(*) FROM riders r LEFT JOIN companies c ON c.id = r.company_id')
+    assert joined['rows'] == [[2]]
+    assert store.execute('org-b', 'SELECT COUNT(*) FROM companies')['rows'] == [[0]]
+
+
+@pytest.mark.parametrize('sql', [
+    'SELECT * FROM main.riders',
+    'SELECT * FROM sqlite_master',
+    'SELECT * FROM data_versions',
+    'DELETE FROM riders',
+    'SELECT 1; DROP TABLE riders',
+    "ATTACH DATABASE 'other.db' AS other",
+])
+def test_queries_cannot_escape_the_organization_views(store, sql):
+    with pytest.raises(AnalyticsQueryError):
+        store.execute('org-a', sql)
+
+
+def test_cached_results_are_per_organization(store):
+    sql = 'SELECT COUNT(*) FROM riders'
+    assert store.execute('org-a', sql)['rows'] == [[1]]
+    assert store.execute('org-b', sql)['rows'] == [[2]]
+    assert store.execute('org-a', sql)['cached'] is True
+
+
+def test_identical_snapshot_keeps_the_data_version(store):
+    version = store.data_version('org-a')
+    store.ingest_snapshot('org-a', 'madrid', [{'id': 1, 'status': 'WORKING', 'cash_amount': 50.0}],
+                          [{'id': 'c1', 'name': 'Acme'}])
+    assert store.data_version('org-a') == version
+
+    store.ingest_snapshot('org-a', 'madrid', [{'id': 1, 'status': 'WORKING', 'cash_amount': 75.0}],
+                          [{'id': 'c1', 'name': 'Acme'}])
+    assert store.data_version('org-a') == version + 1
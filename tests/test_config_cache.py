@@ -0,0 +1,20 @@
+from src.models.organization import APIConfiguration, Organization
+from src.services.config_cache import ConfigurationCache
+
+
+def test_callers_get_copies_of_the_cached_credentials(db_session):
+    organization = Organization(name='Acme')
+    db_session.add(organization)
+    db_session.flush()
+    db_session.add(APIConfiguration(organization_id=organization.id, api_type='whatsapp',
+                                    credentials={'access_token': 'token', 'extra': {'phone_number_id': '1'}}))
+    db_session.commit()
+
+    cache = ConfigurationCache()
+    config = cache.get(organization.id, 'whatsapp')
+    config.credentials['access_token'] = 'changed'
+    config.credentials['extra']['phone_number_id'] = '2'
+
+    assert cache.get(organization.id, 'whatsapp').credentials == {
+        'access_token': 'token', 'extra': {'phone_number_id': '1'}
+    }
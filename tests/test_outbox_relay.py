@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta
+from src.models.support import Alert, AlertOutbox
+from src.services.alert_automation import OUTBOX_ALERT_RAISED
+from src.services.outbox_relay import OutboxRelay
+
+
+def _alert(db_session, rider_id, organization_id='org-1'):
+    alert = Alert(organization_id=organization_id, alert_type='cash_threshold', title='Cash', rider_id=rider_id)
+    db_session.add(alert)
+    db_session.flush()
+    return alert
+
+
+def _event(db_session, alert, next_attempt_at=None):
+    event = AlertOutbox(
+        organization_id=alert.organization_id, alert_id=alert.id, rider_id=alert.rider_id,
+        event_type=OUTBOX_ALERT_RAISED, next_attempt_at=next_attempt_at or datetime.utcnow()
+    )
+    db_session.add(event)
+    db_session.flush()
+    return event
+
+
+class RecordingRelay(OutboxRelay):
+    def __init__(self, failing=(), **kwargs):
+        super().__init__(**kwargs)
+        self.delivered = []
+        self.failing = set(failing)
+        self.handlers = {OUTBOX_ALERT_RAISED: [self._record]}
+
+    def _record(self, event, alert):
+        if event.id in self.failing:
+            raise RuntimeError('boom')
+        self.delivered.append(event.id)
+
+
+def test_backed_off_events_do_not_fill_the_batch(db_session):
+    future = datetime.utcnow() + timedelta(hours=1)
+    waiting = [_event(db_session, _alert(db_session, f"late-{i}"), next_attempt_at=future) for i in range(3)]
+    ready = _event(db_session, _alert(db_session, 'ready'))
+    db_session.commit()
+
+    relay = RecordingRelay(batch_size=3)
+    stats = relay.drain_once()
+
+    assert relay.delivered == [ready.id]
+    assert stats['processed'] == 1
+    assert all(db_session.get(AlertOutbox, event.id).status == 'pending' for event in waiting)
+
+
+def test_nothing_due_reports_no_work(db_session):
+    _event(db_session, _alert(db_session, 'r1'), next_attempt_at=datetime.utcnow() + timedelta(minutes=5))
+    db_session.commit()
+
+    stats = RecordingRelay(batch_size=10).drain_once()
+
+    # run_forever sleeps when nothing was processed
+    assert stats['processed'] == 0
+
+
+def test_events_of_a_rider_wait_for_the_earlier_one(db_session):
+    first = _event(db_session, _alert(db_session, 'rider-a'))
+    second = _event(db_session, _alert(db_session, 'rider-a'))
+    other = _event(db_session, _alert(db_session, 'rider-b'))
+    db_session.commit()
+
+    relay = RecordingRelay(failing={first.id}, batch_size=10)
+    relay.drain_once()
+
+    # The failed head is backed off and still blocks its rider; other riders proceed
+    assert relay.delivered == [other.id]
+    assert db_session.get(AlertOutbox, first.id).next_attempt_at > datetime.utcnow()
+    assert db_session.get(AlertOutbox, second.id).status == 'pending'
+
+    relay.failing.clear()
+    db_session.get(AlertOutbox, first.id).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    relay.drain_once()
+    relay.drain_once()
+
+    assert relay.delivered == [other.id, first.id, second.id]
+
+
+def test_permanently_failed_event_unblocks_its_rider(db_session):
+    first = _event(db_session, _alert(db_session, 'rider-a'))
+    second = _event(db_session, _alert(db_session, 'rider-a'))
+    db_session.commit()
+
+    relay = RecordingRelay(failing={first.id}, max_attempts=1)
+    relay.drain_once()
+    assert db_session.get(AlertOutbox, first.id).status == 'failed'
+
+    relay.drain_once()
+    assert relay.delivered == [second.id]
+
+
+def test_events_without_rider_are_ordered_per_alert(db_session):
+    alert = _alert(db_session, None)
+    first = _event(db_session, alert)
+    second = _event(db_session, alert)
+    unrelated = _event(db_session, _alert(db_session, None))
+    db_session.commit()
+
+    relay = RecordingRelay()
+    relay.drain_once()
+
+    assert relay.delivered == [first.id, unrelated.id]
+    relay.drain_once()
+    assert relay.delivered == [first.id, unrelated.id, second.id]
+
+
+def test_delivery_runs_after_the_claim_is_committed(app, db_session):
+    import sqlite3
+    event = _event(db_session, _alert(db_session, 'rider-a'))
+    db_session.commit()
+    path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+    seen = []
+
+    def check(event, alert):
+        assert not db_session().in_transaction()
+        # Another connection sees the claim and can write while the handler runs
+        with sqlite3.connect(path, timeout=0.1) as connection:
+            seen.append(connection.execute(
+                'SELECT status FROM alert_outbox WHERE id = ?', (event.id,)
+            ).fetchone()[0])
+            connection.execute('UPDATE alerts SET title = title')
+
+    relay = RecordingRelay()
+    relay.handlers = {OUTBOX_ALERT_RAISED: [check]}
+    assert relay.drain_once()['delivered'] == 1
+    assert seen == ['processing']
+    assert db_session.get(AlertOutbox, event.id).status == 'sent'
+
+
+def test_expired_claims_are_delivered_again(db_session):
+    event = _event(db_session, _alert(db_session, 'rider-a'))
+    event.status = 'processing'
+    event.attempts = 1
+    blocked = _event(db_session, _alert(db_session, 'rider-a'))
+    db_session.commit()
+
+    relay = RecordingRelay()
+    event.next_attempt_at = datetime.utcnow() + timedelta(minutes=5)
+    db_session.commit()
+    relay.drain_once()
+    # A live claim blocks its rider's later events
+    assert relay.delivered == []
+
+    event.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    relay.drain_once()
+    relay.drain_once()
+    assert relay.delivered == [event.id, blocked.id]
+    assert db_session.get(AlertOutbox, event.id).attempts == 2
+
+
+class FakeWhatsApp:
+    def __init__(self):
+        self.messages = []
+
+    def send_alert_digest(self, phone, alerts):
+        self.messages.append((phone, sorted(alert['id'] for alert in alerts)))
+        return {'success': True, 'message_id': f"wamid.{len(self.messages)}"}
+
+
+def test_outbox_alerts_go_through_the_digest_and_skip_the_sweep(db_session, monkeypatch):
+    from src.services.alert_automation import AlertAutomationService
+    from src.services.pending_alert_processor import PendingAlertProcessor
+    whatsapp = FakeWhatsApp()
+    monkeypatch.setattr(AlertAutomationService, 'get_whatsapp_service', staticmethod(lambda org: whatsapp))
+
+    owned = []
+    for _ in range(2):
+        alert = _alert(db_session, 'rider-a')
+        alert.severity, alert.rider_phone, alert.outbox_pending = 'critical', '+34600000000', True
+        owned.append(alert)
+    task_alert = _alert(db_session, 'rider-a')
+    task_alert.severity, task_alert.rider_phone = 'critical', '+34600000000'
+    events = [_event(db_session, alert) for alert in owned]
+    db_session.commit()
+
+    swept = PendingAlertProcessor()._pending_query('org-1').all()
+    assert [alert.id for alert in swept] == [task_alert.id]
+
+    stats = OutboxRelay().drain_once()
+    OutboxRelay().drain_once()
+
+    # One message for both outbox alerts; the task-owned alert is left to its own path
+    assert stats['delivered'] == 1
+    assert whatsapp.messages == [('+34600000000', sorted(alert.id for alert in owned))]
+    assert all(db_session.get(AlertOutbox, event.id).status == 'sent' for event in events)
+    for alert in owned:
+        db_session.refresh(alert)
+        assert alert.whatsapp_sent and not alert.outbox_pending
+    db_session.refresh(task_alert)
+    assert not task_alert.whatsapp_sent
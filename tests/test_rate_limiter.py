@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+import pytest
+from src.services import rate_limiter as rate_limiter_module
+from src.services.rate_limiter import RateLimiter, WINDOW_SECONDS
+
+START = 1_700_000_000 - 1_700_000_000 % 86400 + 3600  # 01:00 UTC, at a window boundary
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [float(START)]
+    monkeypatch.setattr(rate_limiter_module, 'get_redis', lambda: None)
+    monkeypatch.setattr(rate_limiter_module.time, 'time', lambda: now[0])
+    return now
+
+
+def _organization(organization_id):
+    return SimpleNamespace(id=organization_id, subscription_tier='basic', api_quota_limit=1000)
+
+
+def test_other_organizations_keep_their_window_counters(clock):
+    limiter = RateLimiter()
+    busy, quiet = _organization('busy'), _organization('quiet')
+    for _ in range(5):
+        limiter.check(quiet)
+    clock[0] += WINDOW_SECONDS + 1
+    limiter.check(busy)
+
+    # The quiet organization's previous window still weighs in the sliding window
+    decision = limiter.check(quiet)
+    assert decision.remaining < 60 - 2
+
+
+def test_windows_older_than_the_previous_one_are_dropped(clock):
+    limiter = RateLimiter()
+    limiter.check(_organization('org-1'))
+    clock[0] += 2 * WINDOW_SECONDS
+    limiter.check(_organization('org-2'))
+
+    window = int(clock[0] // WINDOW_SECONDS)
+    windows = {int(key.rsplit(':', 1)[1]) for key in limiter._counters if key.startswith('ratelimit:')}
+    assert windows == {window}
+    assert 'quota:org-1:' + rate_limiter_module._day_bucket(clock[0]) in limiter._counters
+
+
+def test_quota_blocks_are_rechecked_after_one_window(clock):
+    limiter = RateLimiter()
+    organization = SimpleNamespace(id='org-1', subscription_tier='basic', api_quota_limit=2)
+    limiter.check(organization)
+    limiter.check(organization)
+    rejected = limiter.check(organization)
+    assert (rejected.allowed, rejected.scope) == (False, 'quota')
+    assert rejected.reset > WINDOW_SECONDS
+
+    # A raised quota applies to the next request
+    organization.api_quota_limit = 10
+    assert limiter.check(organization).allowed
+
+    # An unchanged quota is re-checked once the window has passed
+    organization.api_quota_limit = 3
+    assert not limiter.check(organization).allowed
+    limiter._counters['quota:org-1:' + rate_limiter_module._day_bucket(clock[0])] = 0
+    assert not limiter.check(organization).allowed
+    clock[0] += WINDOW_SECONDS
+    assert limiter.check(organization).allowed
+
+
+def test_usage_older_than_the_retention_is_dropped(clock):
+    limiter = RateLimiter()
+    limiter.check(_organization('org-1'))
+    clock[0] += (rate_limiter_module.USAGE_RETENTION_DAYS + 1) * 86400
+    limiter.check(_organization('org-1'))
+
+    assert list(limiter._usage) == ['api_usage:org-1:' + rate_limiter_module._day_bucket(clock[0])]
@@ -0,0 +1,43 @@
+import json
+import os
+from src.services.vector_store import OrganizationVectorStore
+
+
+def embed(texts):
+    return [[1.0, float(index)] for index, _ in enumerate(texts)]
+
+
+def _meta(store):
+    with open(os.path.join(store.path, 'meta.json')) as handle:
+        return json.load(handle)
+
+
+def test_meta_json_keeps_offsets_and_not_chunk_texts(tmp_path):
+    store = OrganizationVectorStore('org-1', str(tmp_path))
+    store.add_document('Política de efectivo: depositar cada 120 €.', embed, document_id='cash')
+    store.add_document('Batería mínima del 20 %.', embed, document_id='battery')
+
+    assert 'Política' not in json.dumps(_meta(store), ensure_ascii=False)
+    assert {hit['text'] for hit in store.search([1.0, 0.0])} == {
+        'Política de efectivo: depositar cada 120 €.', 'Batería mínima del 20 %.'
+    }
+
+    # Deleting compacts both the vectors and texts.jsonl
+    store.delete_document('cash')
+    assert [hit['text'] for hit in store.search([1.0, 0.0])] == ['Batería mínima del 20 %.']
+    assert _meta(store)['rows'] == [['battery', 0, os.path.getsize(os.path.join(store.path, 'texts.jsonl'))]]
+
+
+def test_inline_texts_of_older_indexes_are_migrated(tmp_path):
+    store = OrganizationVectorStore('org-1', str(tmp_path))
+    store.add_document('Old chunk.', embed, document_id='old')
+    meta = _meta(store)
+    meta['rows'] = [['old', 'Old chunk.']]
+    with open(os.path.join(store.path, 'meta.json'), 'w') as handle:
+        json.dump(meta, handle)
+    os.remove(os.path.join(store.path, 'texts.jsonl'))
+
+    assert [hit['text'] for hit in store.search([1.0, 0.0])] == ['Old chunk.']
+    store.add_document('New chunk.', embed, document_id='new')
+    assert all(len(row) == 3 for row in _meta(store)['rows'])
+    assert {hit['text'] for hit in store.search([1.0, 0.0])} == {'Old chunk.', 'New chunk.'}
@@ -0,0 +1,37 @@
+import threading
+import pytest
+from src.services import whatsapp_rate_governor
+from src.services.whatsapp_rate_governor import WhatsAppRateGovernor
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(whatsapp_rate_governor, 'get_redis', lambda: client)
+    return client
+
+
+def test_throttling_is_not_overwritten_by_concurrent_successes(fake_redis):
+    governor = WhatsAppRateGovernor(default_rate=80, min_rate=5, max_rate=80)
+    successes = [threading.Thread(target=governor.on_success, args=('pn-1',)) for _ in range(20)]
+    throttle = threading.Thread(target=governor.on_throttled, args=('pn-1', 1.0))
+    for thread in successes[:10] + [throttle] + successes[10:]:
+        thread.start()
+    for thread in successes + [throttle]:
+        thread.join()
+
+    # Already at the cap: halved to 40, then at most +0.1 per later success
+    assert governor.current_rate('pn-1') <= 40 + 20 * 0.1 + 1e-9
+    assert float(fake_redis.hget('whatsapp_rate:pn-1', 'paused_until')) > 0
+
+
+def test_rate_is_clamped_to_the_configured_bounds(fake_redis):
+    governor = WhatsAppRateGovernor(default_rate=6, min_rate=5, max_rate=6.05)
+    governor.on_success('pn-2')
+    assert governor.current_rate('pn-2') == pytest.approx(6.05)
+
+    for _ in range(3):
+        governor.on_throttled('pn-2', 0.1)
+    assert governor.current_rate('pn-2') == 5
@@ -0,0 +1,114 @@
+import hashlib
+import hmac
+import json
+import pytest
+from src.models.support import Alert
+from src.services import whatsapp_status
+from src.services.whatsapp_status import WhatsAppStatusBuffer, _BUFFER_KEY, _CLAIMS_KEY
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(whatsapp_status, 'get_redis', lambda: client)
+    return client
+
+
+@pytest.fixture
+def no_redis(monkeypatch):
+    monkeypatch.setattr(whatsapp_status, 'get_redis', lambda: None)
+
+
+def _alert(db_session, message_id):
+    alert = Alert(organization_id='org-1', alert_type='cash_threshold', title='Cash', whatsapp_message_id=message_id)
+    db_session.add(alert)
+    db_session.commit()
+    return alert
+
+
+def _failing_apply(monkeypatch):
+    def fail(entries):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(WhatsAppStatusBuffer, '_apply', staticmethod(fail))
+
+
+def test_failed_apply_keeps_redis_entries_for_the_next_flush(app, db_session, fake_redis, monkeypatch):
+    alert = _alert(db_session, 'wamid.1')
+    buffer = WhatsAppStatusBuffer(batch_size=100, max_delay=3600)
+    buffer.add([{'id': 'wamid.1', 'status': 'delivered'}, {'id': 'wamid.1', 'status': 'read'}])
+
+    with monkeypatch.context() as patch:
+        _failing_apply(patch)
+        with pytest.raises(RuntimeError):
+            buffer.flush()
+
+    # Back in the buffer, in order, with no claim left behind
+    assert [json.loads(item)['status'] for item in fake_redis.lrange(_BUFFER_KEY, 0, -1)] == ['delivered', 'read']
+    assert fake_redis.zcard(_CLAIMS_KEY) == 0
+
+    assert buffer.flush() == 1
+    db_session.refresh(alert)
+    assert alert.whatsapp_status == 'read'
+    assert fake_redis.llen(_BUFFER_KEY) == 0
+    assert fake_redis.keys('whatsapp_status_buffer:processing:*') == []
+
+
+def test_batch_claimed_by_a_dead_worker_is_recovered(app, db_session, fake_redis, monkeypatch):
+    alert = _alert(db_session, 'wamid.2')
+    buffer = WhatsAppStatusBuffer(batch_size=100, max_delay=3600)
+    buffer.add([{'id': 'wamid.2', 'status': 'delivered'}])
+
+    # A worker claims the batch and dies before committing
+    entries, claim = buffer._take(100)
+    assert entries and fake_redis.llen(_BUFFER_KEY) == 0
+    assert buffer.flush() == 0
+
+    monkeypatch.setattr(whatsapp_status, 'CLAIM_TIMEOUT_SECONDS', -1)
+    assert buffer.flush() == 1
+    db_session.refresh(alert)
+    assert alert.whatsapp_status == 'delivered'
+    assert not fake_redis.exists(claim)
+
+
+def test_failed_apply_keeps_local_entries(app, db_session, no_redis, monkeypatch):
+    alert = _alert(db_session, 'wamid.3')
+    buffer = WhatsAppStatusBuffer(batch_size=100, max_delay=3600)
+    buffer.add([{'id': 'wamid.3', 'status': 'sent'}])
+    buffer.add([{'id': 'wamid.3', 'status': 'read'}])
+
+    with monkeypatch.context() as patch:
+        _failing_apply(patch)
+        with pytest.raises(RuntimeError):
+            buffer.flush()
+    assert len(buffer._local) == 2
+
+    assert buffer.flush() == 1
+    db_session.refresh(alert)
+    assert alert.whatsapp_status == 'read'
+
+
+def _webhook_app(app):
+    from src.routes.whatsapp import whatsapp_bp
+    app.register_blueprint(whatsapp_bp, url_prefix='/api/whatsapp')
+    return app.test_client()
+
+
+def test_webhook_rejects_callbacks_without_app_secret(app, no_redis, monkeypatch):
+    monkeypatch.delenv('WHATSAPP_APP_SECRET', raising=False)
+    response = _webhook_app(app).post('/api/whatsapp/webhook', json={'entry': []})
+    assert response.status_code == 403
+
+
+def test_webhook_accepts_signed_callbacks(app, no_redis, monkeypatch):
+    monkeypatch.setenv('WHATSAPP_APP_SECRET', 'secret')
+    client = _webhook_app(app)
+    body = json.dumps({'entry': []}).encode()
+    signature = 'sha256=' + hmac.new(b'secret', body, hashlib.sha256).hexdigest()
+
+    unsigned = client.post('/api/whatsapp/webhook', data=body, content_type='application/json')
+    signed = client.post('/api/whatsapp/webhook', data=body, content_type='application/json',
+                         headers={'X-Hub-Signature-256': signature})
+
+    assert unsigned.status_code == 403
+    assert signed.status_code == 200
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Punto de entrada de los workers de Celery para fleet.loginexia.com
+
+    celery -A worker.celery worker -Q notifications_critical,notifications
+    celery -A worker.celery beat
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Añadir el directorio actual al path
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+# Configurar variables de entorno
+os.environ.setdefault('FLASK_ENV', 'production')
+
+# La app Flask configura Celery y aporta el contexto de aplicación a las tareas
+from src.main import app as application
+from src.celery_app import celery
+
+import src.tasks.notifications  # noqa: E402,F401  Registrar las tareas